@@ -0,0 +1,196 @@
+"""
+Dung lượng lưu trữ alert trước / sau khi nén: ghi N alert tổng hợp (text / chat lặp lại nhiều lần,
+URL kèm danh sách lý do, audio, video kèm danh sách frame) vào bảng `alerts` cũ, đo kích thước SQLite,
+sau đó migrate sang partition (nội dung theo hash, result nén, chi tiết ở bảng phụ) và đo lại.
+Kết quả quy ra byte trên mỗi triệu alert. Trước khi ghi, kiểm tra mọi chuỗi của preset dictionary
+(alert_codec) đều có trong result; thiếu thì dừng với mã lỗi 1.
+
+Chạy:
+    python -m benchmarks.alert_storage [--alerts 100000] [--distinct-texts 2000] [--output storage.json]
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.micro import synthetic_messages, synthetic_urls
+from benchmarks.report import summarize, write_report
+from benchmarks.stubs import write_config
+
+TOXIC_PHRASES = ["tao đánh mày chết đi đồ ngu", "giết nó đi, chém cho máu me", "gửi phim sex khỏa thân đi"]
+
+def sample_results(texts: list, urls: list) -> dict:
+    """
+    Result theo loại alert. Text, chat và URL chạy code thật (tầng từ khoá, URL chỉ phân tích
+    cấu trúc nên không cần model / mạng); video và audio cần file media nên được dựng theo
+    đúng các key mà analyze_video_file / analyze_audio_file trả về.
+    """
+    import asyncio
+    from src.filters.conversation_filter import ConversationModerator
+    from src.filters.text_filter import check_text
+    from src.routers.url_api import analyze_url_safety, apply_url_policy
+    from src.utils.policy import default_policy
+    from src.utils.qos import qos
+
+    fidelity = qos.fidelity(qos.current())
+
+    async def moderate_chat():
+        moderator = ConversationModerator()
+        results = []
+        for index, content in enumerate(texts):
+            conversation_id = f"conversation-{index % 50}"
+            result = await moderator.moderate(conversation_id, content, sender="child", use_model=False)
+            results.append(dict(result, conversation_id=conversation_id))
+        return results
+
+    return {
+        "TEXT": [default_policy.apply_text(check_text(content, use_model=False)) for content in texts],
+        "CHAT": asyncio.run(moderate_chat()),
+        # (url, result) của các URL bị cảnh báo
+        "URL": [(url, result) for url, result in (
+            (url, dict(apply_url_policy(analyze_url_safety(url, fetch_content=False), default_policy), fidelity=fidelity))
+            for url in urls
+        ) if result["label"] != "safe"]
+    }
+
+def audio_result(rng: random.Random, text_result: dict) -> dict:
+    segments = rng.randrange(1, 20)
+    segment = rng.randrange(segments)
+    return {
+        "transcription": "chào cả lớp",
+        "has_speech": True,
+        "segments": segments,
+        "recognized_segments": segment + 1,
+        "recognizer": "google",
+        "early_exit": True,
+        "analysis": text_result,
+        "flagged_segment": {"segment": segment, "start": segment * 30.0, "end": segment * 30.0 + 12.5},
+        "label": "suspicious",
+        "score": text_result["score"]
+    }
+
+def video_result(rng: random.Random, index: int, fidelity: dict, audio: dict) -> dict:
+    frames = rng.randrange(5, 60)
+    seconds = round(rng.random() * 10, 3)
+    # Phần lớn video bị đánh dấu do frame, track audio không có lời nói độc hại
+    if rng.random() < 0.3:
+        audio, modalities = dict(audio, has_audio=True, seconds=seconds), ["frames", "audio"]
+    else:
+        audio, modalities = {"has_audio": False, "label": "safe", "seconds": seconds}, ["frames"]
+    return {
+        "filename": f"video_{index}.mp4", "duration": 300.0, "fps": 30.0, "total_frames": 9000,
+        "analyzed_frames": 300, "suspicious_frames": frames, "suspicious_percentage": frames / 3,
+        "details": [
+            {"frame": frame * 30, "timestamp": float(frame), "result": {"label": "nsfw", "score": round(rng.random(), 4)}}
+            for frame in range(frames)
+        ],
+        "audio": audio,
+        "flagged_modalities": modalities,
+        "timing": {"frames_seconds": round(rng.random() * 60, 3), "audio_seconds": seconds,
+                   "total_seconds": round(rng.random() * 60, 3)},
+        "label": "suspicious", "score": min(frames * 0.1, 1.0), "sample_rate": 30, "fidelity": fidelity, "policy": "default"
+    }
+
+def synthetic_alert_rows(count: int, distinct_texts: int, seed: int = 42) -> list:
+    from src.utils.qos import qos
+
+    rng = random.Random(seed)
+    # Chỉ tin bị cảnh báo mới vào bảng alert: thêm cụm đủ để tầng từ khoá gán toxic
+    texts = [f"{message} {rng.choice(TOXIC_PHRASES)}" for message in synthetic_messages(distinct_texts, toxic_ratio=0.0, seed=seed)]
+    urls = synthetic_urls(max(distinct_texts // 4, 1), seed=seed)
+    samples = sample_results(texts, urls)
+    fidelity = qos.fidelity(qos.current())
+    now = datetime.datetime.utcnow()
+    rows = []
+    for i in range(count):
+        moment = now - datetime.timedelta(seconds=rng.randrange(28 * 24 * 3600))
+        kind = rng.random()
+        if kind < 0.6:
+            # Phân bố lệch: vài tin "viral" chiếm phần lớn
+            index = min(int(rng.paretovariate(1.2)) - 1, distinct_texts - 1)
+            alert_type = "TEXT" if kind < 0.4 else "CHAT"
+            rows.append({"time": moment, "type": alert_type, "content": texts[index], "level": "warning",
+                         "result": samples[alert_type][index]})
+        elif kind < 0.85:
+            url, result = rng.choice(samples["URL"])
+            rows.append({"time": moment, "type": "URL", "content": url, "level": "warning", "result": result})
+        elif kind < 0.9:
+            audio = dict(audio_result(rng, rng.choice(samples["TEXT"])), filename=f"audio_{i}.mp3", policy="default")
+            rows.append({"time": moment, "type": "AUDIO", "content": f"audio_{i}.mp3", "level": "warning", "result": audio})
+        else:
+            video = video_result(rng, i, fidelity, audio_result(rng, rng.choice(samples["TEXT"])))
+            rows.append({"time": moment, "type": "VIDEO", "content": f"video_{i}.mp4", "level": "warning", "result": video})
+    return rows
+
+def database_size(engine, path: str) -> int:
+    # VACUUM để kích thước file phản ánh dữ liệu thật (không tính trang trống)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+    return os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Dung lượng lưu trữ alert trước / sau khi nén")
+    parser.add_argument("--alerts", type=int, default=100000)
+    parser.add_argument("--distinct-texts", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--output", help="Ghi report JSON ra file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aicp-storage-")
+    # Config phải được đặt trước khi import src (database / config đọc lúc import)
+    os.environ["AICP_CONFIG"] = write_config(workdir)
+    db_path = os.path.join(workdir, "bench.db")
+
+    from src.utils.alert_codec import LazyResult, unused_dictionary_tokens
+    from src.utils.alert_store import alert_store
+    from src.utils.database import SessionLocal, Alert, engine
+
+    empty_size = database_size(engine, db_path)
+    rows = synthetic_alert_rows(args.alerts, args.distinct_texts)
+
+    # Mọi chuỗi trong preset dictionary phải có trong result thật, nếu không là dictionary đoán sai
+    unused = unused_dictionary_tokens(row["result"] for row in rows)
+    if unused:
+        parser.exit(1, f"Preset dictionary tokens not found in any alert result: {unused}\n")
+
+    # Trước: bảng alerts cũ (nội dung và result JSON đầy đủ trên mỗi dòng)
+    db = SessionLocal()
+    try:
+        for start in range(0, len(rows), args.batch):
+            db.bulk_insert_mappings(Alert, rows[start:start + args.batch])
+            db.commit()
+    finally:
+        db.close()
+    legacy_size = database_size(engine, db_path) - empty_size
+
+    # Sau: migrate sang partition
+    started = time.perf_counter()
+    while alert_store.migrate_legacy(args.batch):
+        pass
+    migrate_seconds = time.perf_counter() - started
+    compact_size = database_size(engine, db_path) - empty_size
+
+    # Đọc dashboard: lấy 50 alert mới nhất, giải mã result khi serialize
+    samples = []
+    for _ in range(200):
+        t0 = time.perf_counter()
+        alerts = alert_store.recent_alerts(50)
+        for alert in alerts:
+            if isinstance(alert["result"], LazyResult):
+                dict(alert["result"])
+        samples.append(time.perf_counter() - t0)
+
+    per_million = 1_000_000 / args.alerts
+    results = {
+        "legacy": {"bytes": legacy_size, "bytes_per_million_alerts": int(legacy_size * per_million)},
+        "compact": {"bytes": compact_size, "bytes_per_million_alerts": int(compact_size * per_million)},
+        "ratio": round(legacy_size / compact_size, 2) if compact_size else None,
+        "migrate_alerts_per_s": round(args.alerts / migrate_seconds, 1),
+        "recent_alerts_50": summarize(samples)
+    }
+    write_report("alert_storage", results, {"alerts": args.alerts, "distinct_texts": args.distinct_texts}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Đo real-time factor (RTF) của backend nhận dạng offline theo số core CPU.
+
+RTF = thời gian xử lý / độ dài audio (RTF < 1 nghĩa là nhanh hơn thời gian thực).
+
+Chạy:
+    python -m benchmarks.asr_rtf path/to/voice_note.mp3 [--threads 1 2 4]
+"""
+import argparse
+import json
+import os
+import time
+
+import torch
+from pydub import AudioSegment
+
+from src.filters.audio_filter import LocalRecognizer, normalize_audio, segment_audio
+
+def measure(recognizer, audio, ranges, threads: int):
+    torch.set_num_threads(threads)
+
+    # Warm-up để không tính thời gian load model
+    recognizer.recognize(audio[ranges[0][0]:ranges[0][1]])
+
+    start = time.perf_counter()
+    for begin, end in ranges:
+        recognizer.recognize(audio[begin:end])
+    elapsed = time.perf_counter() - start
+
+    duration = sum(end - begin for begin, end in ranges) / 1000
+    rtf = elapsed / duration
+    return {
+        "threads": threads,
+        "audio_seconds": round(duration, 2),
+        "elapsed_seconds": round(elapsed, 3),
+        "rtf": round(rtf, 4),
+        "rtf_per_core": round(rtf * threads, 4)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RTF của LocalRecognizer")
+    parser.add_argument("audio", help="File audio dùng để đo")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    audio = normalize_audio(AudioSegment.from_file(args.audio))
+    ranges = segment_audio(audio)
+    if not ranges:
+        raise SystemExit("No speech found in audio file")
+
+    recognizer = LocalRecognizer()
+    results = [measure(recognizer, audio, ranges, threads) for threads in sorted(set(args.threads))]
+    print(json.dumps({"model": recognizer.model_name, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Load test end-to-end: khởi động app với model giả, SQLite, HTTP/SMTP stand-in local
+rồi bắn đồng thời vào:
+- POST /api/check_text      (khoảng 10% tin toxic → ghi alert + broadcast)
+- POST /api/check_image     (ảnh JPEG tổng hợp, có lặp lại để thấy single-flight)
+- POST /api/check_urls_batch (URL trỏ vào HTTP stand-in)
+- /ws/alerts                (client giữ kết nối, đo độ trễ từ lúc gửi text toxic tới lúc nhận new_alert)
+
+Báo cáo throughput và p50/p95/p99 dạng JSON để so sánh giữa các phiên bản.
+
+Chạy:
+    python -m benchmarks.load [--duration 20] [--concurrency 8] [--ws-clients 20] [--output load.json]
+Hoặc chạy vào server đang có sẵn (không tự khởi động app):
+    python -m benchmarks.load --base-url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+from benchmarks.micro import synthetic_jpegs, synthetic_messages
+from benchmarks.report import summarize, write_report
+from benchmarks.stubs import HTTPStub, SMTPStub, write_config
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Scenario:
+    """Một loại request chạy bởi `concurrency` thread cho tới hết thời gian"""
+
+    def __init__(self, name: str, concurrency: int, make_request):
+        self.name = name
+        self.concurrency = concurrency
+        self.make_request = make_request
+        self.samples = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def run(self, base_url: str, deadline: float):
+        session = requests.Session()
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = self.make_request(session, base_url, rng)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                if ok:
+                    self.samples.append(elapsed)
+                else:
+                    self.errors += 1
+
+    def report(self, duration: float) -> dict:
+        return dict(summarize(self.samples, duration), errors=self.errors)
+
+class AlertListener:
+    """Các client /ws/alerts chạy chung một event loop trên thread riêng"""
+
+    def __init__(self, url: str, clients: int):
+        self.url = url
+        self.clients = clients
+        self.connected = 0
+        self.received = []  # (thời điểm nhận, content của alert)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(10)
+
+    async def _main(self):
+        await asyncio.gather(*(self._client() for _ in range(self.clients)), return_exceptions=True)
+
+    async def _client(self):
+        import websockets
+
+        async with websockets.connect(self.url) as ws:
+            self.connected += 1
+            while not self._stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                received_at = time.perf_counter()
+                data = json.loads(message)
+                if data.get("type") == "new_alert":
+                    self.received.append((received_at, data["data"].get("content")))
+
+def build_scenarios(args, url_stub: HTTPStub, sent_toxic: dict) -> list:
+    messages = synthetic_messages(500)
+    images = synthetic_jpegs(8)
+
+    def check_text(session, base_url, rng):
+        content = rng.choice(messages)
+        if rng.random() < args.toxic_ratio:
+            # Gắn marker duy nhất để đo thời gian tới lúc client WebSocket nhận alert
+            marker = uuid.uuid4().hex[:12]
+            content = f"đồ ngu {content} #{marker}"
+            sent_toxic[content] = time.perf_counter()
+        return session.post(f"{base_url}/api/check_text", json={"content": content}, timeout=30)
+
+    def check_image(session, base_url, rng):
+        files = {"file": ("bench.jpg", rng.choice(images), "image/jpeg")}
+        return session.post(f"{base_url}/api/check_image", files=files, timeout=30)
+
+    def check_urls_batch(session, base_url, rng):
+        urls = [url_stub.url(f"/bai-tap/{rng.randrange(50)}") for _ in range(args.urls_per_batch)]
+        return session.post(f"{base_url}/api/check_urls_batch", json={"urls": urls}, timeout=60)
+
+    return [
+        Scenario("check_text", args.concurrency, check_text),
+        Scenario("check_image", args.concurrency, check_image),
+        Scenario("check_urls_batch", max(1, args.concurrency // 2), check_urls_batch)
+    ]
+
+def start_server(args, workdir: str, smtp_port: int):
+    env = dict(os.environ, AICP_CONFIG=write_config(workdir, smtp_port=smtp_port))
+    command = [
+        sys.executable, "-m", "benchmarks.server",
+        "--port", str(args.port),
+        "--text-latency", str(args.text_latency),
+        "--image-latency", str(args.image_latency)
+    ]
+    # Chạy từ thư mục repo vì app dùng đường dẫn tương đối (templates, logs, temp)
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/metrics", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+
+    process.terminate()
+    raise SystemExit("Server did not become ready in time")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test end-to-end với model giả")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=8, help="Số thread cho mỗi loại request")
+    parser.add_argument("--ws-clients", type=int, default=20)
+    parser.add_argument("--toxic-ratio", type=float, default=0.1)
+    parser.add_argument("--urls-per-batch", type=int, default=5)
+    parser.add_argument("--text-latency", type=float, default=0.02, help="Độ trễ mỗi batch của text model giả (giây)")
+    parser.add_argument("--image-latency", type=float, default=0.03, help="Độ trễ mỗi batch của image model giả (giây)")
+    parser.add_argument("--page-delay", type=float, default=0.01, help="Độ trễ của HTTP stand-in (giây)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--base-url", help="Dùng server có sẵn thay vì tự khởi động")
+    parser.add_argument("--output", help="Ghi report JSON ra file")
+    args = parser.parse_args()
+
+    smtp = SMTPStub().start()
+    url_stub = HTTPStub(delay=args.page_delay).start()
+    workdir = tempfile.mkdtemp(prefix="aicp-load-")
+    process = None
+
+    try:
+        if args.base_url:
+            base_url = args.base_url.rstrip("/")
+        else:
+            process, base_url = start_server(args, workdir, smtp.port)
+
+        listener = AlertListener(base_url.replace("http", "ws", 1) + "/ws/alerts", args.ws_clients).start()
+        time.sleep(1.0)
+
+        sent_toxic = {}
+        scenarios = build_scenarios(args, url_stub, sent_toxic)
+        deadline = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(target=scenario.run, args=(base_url, deadline), daemon=True)
+            for scenario in scenarios
+            for _ in range(scenario.concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # Chờ các broadcast cuối cùng tới client
+        time.sleep(1.0)
+        listener.stop()
+
+        delivery = [received_at - sent_toxic[content] for received_at, content in listener.received if content in sent_toxic]
+        results = {scenario.name: scenario.report(elapsed) for scenario in scenarios}
+        results["ws_alerts"] = dict(
+            summarize(delivery),
+            clients_connected=listener.connected,
+            toxic_sent=len(sent_toxic),
+            messages_received=len(listener.received)
+        )
+        results["smtp_messages"] = len(smtp.messages)
+
+        params = {key: value for key, value in vars(args).items() if key not in ("output", "base_url")}
+        params["server"] = "external" if args.base_url else "stub"
+        write_report("load", results, params, args.output)
+
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+        smtp.stop()
+        url_stub.stop()
+
+if __name__ == "__main__":
+    main()
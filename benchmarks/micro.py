@@ -0,0 +1,142 @@
+"""
+Microbenchmark cho các hàm nóng trên dữ liệu tổng hợp:
+- advanced_vietnamese_text_check, lexical_prescreen, check_text
+- check_image (decode + classify) trên ảnh JPEG ngẫu nhiên
+- phân tích cấu trúc URL (không fetch trang)
+- tổng hợp thống kê alert từ SQLite và từ file JSON fallback
+
+Mặc định dùng model giả (--real-models để chạy model thật nếu đã tải).
+
+Chạy:
+    python -m benchmarks.micro [--iterations 2000] [--alerts 5000] [--output micro.json]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.report import summarize, write_report
+from benchmarks.stubs import install_model_stubs, write_config
+
+NEUTRAL_WORDS = [
+    "đi", "học", "chưa", "ok", "mai", "gặp", "nhé", "bài", "tập", "toán", "hôm", "nay",
+    "vui", "quá", "cả", "lớp", "thầy", "cô", "bạn", "mình", "chơi", "game", "tối", "về"
+]
+TOXIC_WORDS = ["ngu", "đồ ngu", "chết đi", "cút", "đánh", "khốn nạn"]
+
+def synthetic_messages(count: int, toxic_ratio: float = 0.1, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(NEUTRAL_WORDS) for _ in range(min(max(int(rng.lognormvariate(1.6, 0.9)), 1), 120))]
+        if rng.random() < toxic_ratio:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(TOXIC_WORDS))
+        messages.append(" ".join(words))
+    return messages
+
+def synthetic_urls(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    hosts = ["hoc24.vn", "vnexpress.net", "free-casino.tk", "a.b.c.example.com", "192.168.1.20", "bit.ly"]
+    paths = ["", "/bai-tap", "/xxx/video", "/login?next=/home", "/download/warez.zip"]
+    return [f"https://{rng.choice(hosts)}{rng.choice(paths)}" for _ in range(count)]
+
+def synthetic_jpegs(count: int, size: tuple = (640, 480), seed: int = 42) -> list:
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+def synthetic_alerts(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    types = {"TEXT": ["toxic", "suspicious"], "IMAGE": ["nsfw"], "URL": ["dangerous", "suspicious"], "VIDEO": ["suspicious"]}
+    alerts = []
+    for i in range(count):
+        alert_type = rng.choice(list(types))
+        alerts.append({
+            "type": alert_type,
+            "content": f"synthetic-{i}",
+            "result": {"label": rng.choice(types[alert_type]), "score": round(rng.random(), 3)},
+            "level": "warning"
+        })
+    return alerts
+
+def bench(fn, inputs: list, iterations: int) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        item = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - started, unit="us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark các hàm nóng")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--image-iterations", type=int, default=200)
+    parser.add_argument("--alerts", type=int, default=5000, help="Số alert tổng hợp cho bài tổng hợp thống kê")
+    parser.add_argument("--real-models", action="store_true", help="Dùng model thật thay vì model giả")
+    parser.add_argument("--text-latency", type=float, default=0.0, help="Độ trễ mỗi batch của text model giả (giây)")
+    parser.add_argument("--image-latency", type=float, default=0.0, help="Độ trễ mỗi batch của image model giả (giây)")
+    parser.add_argument("--output", help="Ghi report JSON ra file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    workdir = tempfile.mkdtemp(prefix="aicp-micro-")
+    # Config phải được đặt trước khi import src (database / config đọc lúc import)
+    os.environ["AICP_CONFIG"] = write_config(workdir)
+    if not args.real_models:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+    from src.filters import text_filter
+    from src.filters.image_filter import check_image
+    from src.routers.url_api import URLAnalysisResult
+    from src.routers import stats_api
+    from src.utils.alert_store import alert_store
+
+    if not args.real_models:
+        install_model_stubs(args.text_latency, args.image_latency)
+
+    messages = synthetic_messages(1000)
+    results = {
+        "advanced_vietnamese_text_check": bench(text_filter.advanced_vietnamese_text_check, messages, args.iterations),
+        "lexical_prescreen": bench(text_filter.lexical_prescreen, messages, args.iterations),
+        "check_text": bench(text_filter.check_text, messages, args.iterations),
+        "check_image": bench(check_image, synthetic_jpegs(16), args.image_iterations),
+        "url_structure": bench(URLAnalysisResult().analyze_url_structure, synthetic_urls(500), args.iterations)
+    }
+
+    # Tổng hợp thống kê: SQLite và JSON fallback (stats_api đọc logs/alerts.json theo thư mục hiện tại)
+    alerts = synthetic_alerts(args.alerts)
+    alert_store.insert_alerts(alerts)
+    results["stats_from_db"] = bench(lambda _: alert_store.alert_stats(), [None], 20)
+
+    os.chdir(workdir)
+    os.makedirs("logs", exist_ok=True)
+    with open("logs/alerts.json", "w", encoding="utf-8") as f:
+        for alert in alerts:
+            f.write(json.dumps(alert, ensure_ascii=False) + "\n")
+    results["stats_from_json"] = bench(lambda _: stats_api.get_stats_from_json(), [None], 20)
+
+    params = {
+        "iterations": args.iterations,
+        "image_iterations": args.image_iterations,
+        "alerts": args.alerts,
+        "models": "real" if args.real_models else "stub",
+        "text_latency": args.text_latency,
+        "image_latency": args.image_latency
+    }
+    write_report("micro", results, params, output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+So sánh độ trễ phía request khi gửi cảnh báo:
+- sync: mở kết nối SMTP mới và gửi email ngay trong request (cách cũ)
+- queued: notify_parent() đưa vào hàng đợi của NotificationDispatcher
+
+Chạy với SMTP stand-in local:
+    python -m benchmarks.notify_latency [--alerts 50] [--smtp-delay 0.2]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.stubs import SMTPStub
+from src.utils.notifier import EMAIL_DEFAULTS, NotificationDispatcher, build_alert_body
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark độ trễ gửi thông báo")
+    parser.add_argument("--alerts", type=int, default=50)
+    parser.add_argument("--smtp-delay", type=float, default=0.2, help="Độ trễ giả lập của SMTP server (giây)")
+    args = parser.parse_args()
+
+    smtp = SMTPStub(delay=args.smtp_delay).start()
+    config = dict(EMAIL_DEFAULTS, smtp_server="127.0.0.1", smtp_port=smtp.port, use_tls=False,
+                  sender_email="bench@localhost", sender_password="secret",
+                  recipient_email="parent@localhost", min_interval_seconds=2)
+    result = {"sample": {"label": "toxic", "score": 0.9}}
+
+    # Cách cũ: mỗi cảnh báo một kết nối SMTP, chặn request cho tới khi gửi xong
+    sync_dispatcher = NotificationDispatcher(config)
+    sync_latency = []
+    for i in range(args.alerts):
+        start = time.perf_counter()
+        sync_dispatcher._send(config["recipient_email"], "bench", build_alert_body("TEXT", f"message {i}", result["sample"]))
+        sync_dispatcher._close_smtp()
+        sync_latency.append(time.perf_counter() - start)
+    sync_messages = len(smtp.messages)
+
+    # Cách mới: enqueue và trả về ngay
+    dispatcher = NotificationDispatcher(config)
+    queued_latency = []
+    for i in range(args.alerts):
+        start = time.perf_counter()
+        dispatcher.enqueue("TEXT", f"message {i}", result["sample"])
+        queued_latency.append(time.perf_counter() - start)
+    dispatcher.stop(timeout=30)
+
+    print(json.dumps({
+        "alerts": args.alerts,
+        "smtp_delay_s": args.smtp_delay,
+        "sync": dict(summarize(sync_latency), emails=sync_messages),
+        "queued": dict(summarize(queued_latency), emails=len(smtp.messages) - sync_messages)
+    }, indent=2))
+
+    smtp.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Driver tải tổng hợp cho controller QoS, chạy trong process (không cần server hay model):
+request text đến theo tiến trình Poisson qua Scheduler thật; thời gian xử lý mỗi request phụ thuộc
+mức QoS lúc được cấp slot (mức thấp rẻ hơn, như bỏ model / không tải trang). Tốc độ đến đi qua
+các pha thấp -> tăng vọt -> thấp để kiểm tra controller hạ mức khi quá tải và nâng lại khi hết tải.
+
+Báo cáo diễn biến mức theo thời gian, độ trễ / số request bị từ chối / phân bố mức theo pha,
+và hai kiểm tra: có hạ mức trong pha tăng vọt, có về mức 0 ở cuối.
+
+Chạy:
+    python -m benchmarks.qos_driver [--phases 100:10 400:20 100:25] [--slots 8] [--service-ms 40 25 5 3]
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from benchmarks.report import summarize, write_report
+
+class _NoCpu:
+    """CPU của process driver không phản ánh tải mô phỏng nên bỏ qua tín hiệu CPU"""
+
+    def sample(self) -> float:
+        return 0.0
+
+def parse_phase(value: str):
+    rate, _, seconds = value.partition(":")
+    return float(rate), float(seconds)
+
+async def drive(controller, scheduler, phases: list, service_seconds: list, seed: int = 42):
+    from src.utils.scheduler import Rejected
+
+    rng = random.Random(seed)
+    samples = [{"latencies": [], "rejected": 0, "levels": Counter()} for _ in phases]
+    timeline = []
+    tasks = set()
+    started = time.monotonic()
+
+    async def request(phase: int):
+        t0 = time.monotonic()
+        try:
+            async with scheduler.slot("text"):
+                settings = controller.current()
+                await asyncio.sleep(service_seconds[settings["level"]])
+        except Rejected:
+            samples[phase]["rejected"] += 1
+            return
+        samples[phase]["latencies"].append(time.monotonic() - t0)
+        samples[phase]["levels"][settings["mode"]] += 1
+
+    async def control():
+        while True:
+            await asyncio.sleep(controller.config["interval_seconds"])
+            level = controller.update(controller.sample())
+            timeline.append({
+                "t": round(time.monotonic() - started, 2),
+                "level": level,
+                "queued": len(scheduler.classes["text"].waiters),
+                **{key: round(value, 4) for key, value in controller.signals.items()}
+            })
+
+    control_task = asyncio.create_task(control())
+    for phase, (rate, seconds) in enumerate(phases):
+        phase_end = time.monotonic() + seconds
+        while time.monotonic() < phase_end:
+            await asyncio.sleep(rng.expovariate(rate))
+            task = asyncio.create_task(request(phase))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    control_task.cancel()
+
+    results = {"phases": [], "timeline": timeline}
+    for (rate, seconds), phase in zip(phases, samples):
+        results["phases"].append({
+            "rate_per_s": rate,
+            "seconds": seconds,
+            "latency": summarize(phase["latencies"], seconds),
+            "rejected": phase["rejected"],
+            "levels": dict(phase["levels"])
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra controller QoS với tải tổng hợp")
+    parser.add_argument("--phases", nargs="+", type=parse_phase, default=[(100, 10), (400, 20), (100, 25)],
+                        help="Các pha rate:seconds (request/giây : thời gian)")
+    parser.add_argument("--slots", type=int, default=8, help="Số slot scheduler (năng lực xử lý song song)")
+    parser.add_argument("--service-ms", type=float, nargs="+", default=[40, 25, 5, 3],
+                        help="Thời gian xử lý một request ở từng mức QoS")
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--escalate-after", type=int, default=2)
+    parser.add_argument("--recover-after", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Ghi report JSON ra file")
+    args = parser.parse_args()
+
+    from src.utils.qos import QOS_CONFIG, QosController
+    from src.utils.scheduler import SCHEDULER_CONFIG, Scheduler
+
+    levels = QOS_CONFIG["levels"]
+    if len(args.service_ms) != len(levels):
+        parser.error(f"--service-ms needs {len(levels)} values (one per QoS level)")
+
+    scheduler = Scheduler(dict(
+        SCHEDULER_CONFIG,
+        max_concurrent=args.slots,
+        classes={"text": {"weight": 1, "max_concurrent": args.slots, "max_queue": 1000, "deadline_seconds": 2.0}},
+        rate_limits={}
+    ))
+    controller = QosController(dict(
+        QOS_CONFIG,
+        enabled=True,
+        interval_seconds=args.interval,
+        escalate_after=args.escalate_after,
+        recover_after=args.recover_after
+    ), scheduler, cpu=_NoCpu())
+
+    service_seconds = [ms / 1000 for ms in args.service_ms]
+    results = asyncio.run(drive(controller, scheduler, args.phases, service_seconds, args.seed))
+
+    # Pha tải cao nhất phải có lúc bị hạ mức, và mức phải về 0 trước khi kết thúc
+    peak = max(range(len(args.phases)), key=lambda index: args.phases[index][0])
+    peak_end = sum(seconds for _, seconds in args.phases[:peak + 1])
+    results["checks"] = {
+        "escalated_during_peak": any(
+            point["level"] > 0 for point in results["timeline"] if point["t"] <= peak_end
+        ),
+        "recovered_to_full": bool(results["timeline"]) and results["timeline"][-1]["level"] == 0,
+        "level_changes": controller.changes
+    }
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    params["capacity_per_s"] = [round(args.slots / seconds, 1) for seconds in service_seconds]
+    write_report("qos_driver", results, params, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Tóm tắt kết quả benchmark thành JSON ổn định để so sánh giữa các phiên bản.
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+def percentile(sorted_samples: list, q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(q * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+def summarize(samples: list, elapsed: float = None, unit: str = "ms") -> dict:
+    """p50/p95/p99 của các mẫu độ trễ (giây) và throughput nếu biết tổng thời gian"""
+    scale = 1000 if unit == "ms" else 1_000_000
+    ordered = sorted(samples)
+    summary = {"count": len(ordered)}
+    if elapsed:
+        summary["throughput_per_s"] = round(len(ordered) / elapsed, 2)
+    for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        summary[f"{name}_{unit}"] = round(percentile(ordered, q) * scale, 3)
+    if ordered:
+        summary[f"max_{unit}"] = round(ordered[-1] * scale, 3)
+    return summary
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+def write_report(name: str, results: dict, params: dict, output: str = None):
+    """In report ra stdout và ghi ra file nếu có `output`"""
+    report = {
+        "benchmark": name,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "params": params,
+        "results": results
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return report
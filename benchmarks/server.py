@@ -0,0 +1,30 @@
+"""
+Chạy app với model giả (độ trễ cố định mỗi batch) để load test không cần GPU / tải model.
+Config (SQLite, SMTP stand-in...) lấy từ AICP_CONFIG, thường do benchmarks.load tạo.
+
+Chạy:
+    AICP_CONFIG=/tmp/bench/config.json python -m benchmarks.server [--port 8765]
+"""
+import argparse
+import os
+
+def main():
+    parser = argparse.ArgumentParser(description="App với model giả cho load test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--text-latency", type=float, default=0.02)
+    parser.add_argument("--image-latency", type=float, default=0.03)
+    args = parser.parse_args()
+
+    # Không tải model thật từ Hugging Face, để filter rơi vào nhánh fallback rồi thay bằng model giả
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+    import uvicorn
+    from benchmarks.stubs import install_model_stubs
+    from src.app import app
+
+    install_model_stubs(args.text_latency, args.image_latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Các stand-in chạy local dùng cho benchmark: SMTP server tối giản, HTTP server trả trang tĩnh,
+model giả có độ trễ cố định và config trỏ vào SQLite tạm.
+"""
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self._reply("220 localhost stub SMTP")
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250-localhost")
+                self._reply("250 AUTH PLAIN LOGIN")
+            elif command.startswith("AUTH"):
+                self._reply("235 Authentication successful")
+            elif command.startswith("DATA"):
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data)
+                if server.delay:
+                    time.sleep(server.delay)
+                server.messages.append(b"".join(lines))
+                self._reply("250 OK")
+            elif command.startswith("QUIT"):
+                self._reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, NOOP, RSET...
+                self._reply("250 OK")
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """
+    SMTP server giả lập (không TLS) ghi lại các message nhận được.
+    `delay` mô phỏng độ trễ của SMTP thật khi nhận DATA.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.delay = delay
+        self.messages = []
+        self.connections = 0
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = self.server.page.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class HTTPStub(ThreadingHTTPServer):
+    """HTTP server giả lập trả cùng một trang HTML cho mọi path (thay website thật khi kiểm tra URL)"""
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0,
+                 page: str = "<html><head><title>Bài tập</title></head><body><p>Trang học tập cho trẻ em.</p></body></html>"):
+        super().__init__((host, port), _PageHandler)
+        self.delay = delay
+        self.page = page
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def url(self, path: str = "/") -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def write_config(directory: str, smtp_port: int = None, database: dict = None) -> str:
+    """
+    Ghi config.json cho benchmark: SQLite trong `directory` (hoặc section `database` truyền vào),
+    email trỏ vào SMTPStub (nếu có).
+    Trả về đường dẫn để đặt vào AICP_CONFIG trước khi import src.
+    """
+    config = {
+        "database": {"url": "sqlite:///" + os.path.join(os.path.abspath(directory), "bench.db")},
+        "logging": {"level": "WARNING"}
+    }
+    if database:
+        config["database"].update(database)
+    if smtp_port:
+        config["email"] = {
+            "smtp_server": "127.0.0.1", "smtp_port": smtp_port, "use_tls": False,
+            "sender_email": "bench@localhost", "sender_password": "secret",
+            "recipient_email": "parent@localhost", "min_interval_seconds": 5
+        }
+    path = os.path.join(directory, "config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return path
+
+class StubImageClassifier:
+    """Thay pipeline NSFW: cùng giao diện gọi theo list, mỗi batch tốn `latency` giây"""
+
+    def __init__(self, latency: float = 0.03):
+        self.latency = latency
+
+    def __call__(self, images, batch_size: int = 1):
+        time.sleep(self.latency)
+        return [[{"label": "normal", "score": 0.99}] for _ in images]
+
+def install_model_stubs(text_latency: float = 0.02, image_latency: float = 0.03):
+    """
+    Thay model thật bằng model giả có độ trễ cố định mỗi batch. Phần còn lại
+    (cascade, batcher, decode ảnh, single-flight) vẫn chạy code thật.
+    """
+    from src.filters import image_filter, text_filter
+
+    def classify_texts(texts):
+        time.sleep(text_latency)
+        return [text_filter.advanced_vietnamese_text_check(text)["label"] == "toxic" for text in texts]
+
+    def model_text_check(content):
+        if text_filter.text_batcher.submit(content).result():
+            return {"label": "toxic", "score": 0.9}
+        return {"label": "neutral", "score": 0.9}
+
+    text_filter.text_batcher.process_fn = classify_texts
+    text_filter.model_text_check = model_text_check
+    # Không có tokenizer thật: coi mọi text là một cửa sổ
+    text_filter.split_windows = lambda content: [(0, len(content))]
+    text_filter.tokenizer = text_filter.model = object()
+    text_filter.MODEL_AVAILABLE = True
+
+    image_filter.image_classifier = StubImageClassifier(image_latency)
+    image_filter.MODEL_AVAILABLE = True
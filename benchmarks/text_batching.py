@@ -0,0 +1,74 @@
+"""
+So sánh batch theo thứ tự đến (pad tới chuỗi dài nhất) với batch theo bucket độ dài
+trên phân bố độ dài giống chat thật: đa số tin ngắn, thỉnh thoảng có tin rất dài.
+
+Báo cáo tokens/giây (nếu model load được) và tỉ lệ padding thừa.
+
+Chạy:
+    python -m benchmarks.text_batching [--messages 2000] [--batch-size 32]
+"""
+import argparse
+import json
+import random
+import time
+
+from src.filters import text_filter
+
+WORDS = [
+    "đi", "học", "chưa", "ok", "mai", "gặp", "nhé", "bài", "tập", "toán", "hôm", "nay",
+    "vui", "quá", "cả", "lớp", "thầy", "cô", "bạn", "mình", "chơi", "game", "tối", "về"
+]
+
+def chat_messages(count: int, seed: int = 42) -> list:
+    """Độ dài (số từ) theo phân bố log-normal, cắt ở 300 từ"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        length = min(max(int(rng.lognormvariate(1.6, 0.9)), 1), 300)
+        messages.append(" ".join(rng.choice(WORDS) for _ in range(length)))
+    return messages
+
+def padding_report(messages: list, batch_size: int, bucketed: bool) -> dict:
+    lengths = [len(text_filter._encode(text)) for text in messages]
+    real = padded = 0
+    batches = text_filter.plan_batches(lengths, batch_size, bucketed)
+    for batch in batches:
+        longest = max(lengths[i] for i in batch)
+        real += sum(lengths[i] for i in batch)
+        padded += longest * len(batch)
+    return {
+        "batches": len(batches),
+        "real_tokens": real,
+        "padded_tokens": padded - real,
+        "padding_waste": round((padded - real) / padded, 4)
+    }
+
+def throughput(messages: list, batch_size: int, bucketed: bool) -> dict:
+    start = time.perf_counter()
+    text_filter.classify_texts(messages, batch_size=batch_size, bucketed=bucketed)
+    elapsed = time.perf_counter() - start
+    tokens = sum(len(text_filter._encode(text)) for text in messages)
+    return {"seconds": round(elapsed, 3), "tokens_per_second": round(tokens / elapsed, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch theo bucket độ dài cho text model")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=text_filter.TEXT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if text_filter.tokenizer is None:
+        raise SystemExit("Text tokenizer is not available")
+
+    messages = chat_messages(args.messages)
+    report = {"messages": len(messages), "batch_size": args.batch_size}
+
+    for name, bucketed in (("arrival_order", False), ("length_bucketed", True)):
+        report[name] = padding_report(messages, args.batch_size, bucketed)
+        if text_filter.MODEL_AVAILABLE:
+            report[name].update(throughput(messages, args.batch_size, bucketed))
+
+    report["token_cache_hit_rate"] = round(text_filter.get_batching_stats()["token_cache_hit_rate"], 4)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
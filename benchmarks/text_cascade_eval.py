@@ -0,0 +1,61 @@
+"""
+Đánh giá cascade của check_text trên tập dữ liệu có nhãn:
+recall/precision của cascade so với chỉ dùng model, và tỉ lệ request phải gọi model.
+
+Chạy:
+    python -m benchmarks.text_cascade_eval [--data benchmarks/data/text_labeled.jsonl]
+"""
+import argparse
+import json
+import time
+
+from src.filters import text_filter
+
+TOXIC_LABELS = ("toxic", "suspicious")
+
+def score(predictions: list, labels: list) -> dict:
+    tp = sum(1 for p, l in zip(predictions, labels) if p and l)
+    fp = sum(1 for p, l in zip(predictions, labels) if p and not l)
+    fn = sum(1 for p, l in zip(predictions, labels) if not p and l)
+    return {
+        "recall": round(tp / (tp + fn), 4) if tp + fn else 1.0,
+        "precision": round(tp / (tp + fp), 4) if tp + fp else 1.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Đánh giá cascade kiểm tra text")
+    parser.add_argument("--data", default="benchmarks/data/text_labeled.jsonl")
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+
+    texts = [sample["text"] for sample in samples]
+    labels = [sample["label"] in TOXIC_LABELS for sample in samples]
+
+    start = time.perf_counter()
+    cascade = [text_filter.check_text(text) for text in texts]
+    cascade_seconds = time.perf_counter() - start
+
+    report = {
+        "samples": len(samples),
+        "cascade": dict(
+            score([r["label"] in TOXIC_LABELS for r in cascade], labels),
+            seconds=round(cascade_seconds, 3),
+            model_invocation_rate=round(sum(1 for r in cascade if r.get("tier") == "model") / len(cascade), 4)
+        ),
+        "tiers": text_filter.get_cascade_stats()
+    }
+
+    if text_filter.MODEL_AVAILABLE:
+        start = time.perf_counter()
+        model_only = [text_filter.model_text_check(text) for text in texts]
+        report["model_only"] = dict(
+            score([r["label"] in TOXIC_LABELS for r in model_only], labels),
+            seconds=round(time.perf_counter() - start, 3)
+        )
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
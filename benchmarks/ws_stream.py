@@ -0,0 +1,98 @@
+"""
+Throughput của kiểm duyệt chat qua WebSocket /ws: mỗi client gửi liên tục tin
+{"type": "moderate", ...} (tối đa --window tin chưa có verdict) trên nhiều hội thoại,
+đo số tin/giây và độ trễ tới lúc nhận verdict.
+
+Chạy (tự khởi động app với model giả):
+    python -m benchmarks.ws_stream [--messages 20000] [--clients 4] [--window 256]
+Hoặc vào server có sẵn:
+    python -m benchmarks.ws_stream --base-url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from benchmarks.load import start_server
+from benchmarks.micro import synthetic_messages
+from benchmarks.report import summarize, write_report
+
+async def run_client(url: str, client_id: int, count: int, conversations: int, window: int, messages: list, latencies: list):
+    import websockets
+
+    sent_at = {}
+    slots = asyncio.Semaphore(window)
+
+    async with websockets.connect(url, max_size=None) as ws:
+        async def receive():
+            received = 0
+            while received < count:
+                data = json.loads(await ws.recv())
+                items = data["items"] if data.get("type") == "verdicts" else [data]
+                now = time.perf_counter()
+                for item in items:
+                    if item.get("type") != "verdict":
+                        continue
+                    latencies.append(now - sent_at.pop(item["message_id"]))
+                    received += 1
+                    slots.release()
+
+        receiver = asyncio.create_task(receive())
+        for i in range(count):
+            await slots.acquire()
+            message_id = f"{client_id}-{i}"
+            sent_at[message_id] = time.perf_counter()
+            await ws.send(json.dumps({
+                "type": "moderate",
+                "conversation_id": f"{client_id}-{i % conversations}",
+                "message_id": message_id,
+                "sender": f"user-{i % 7}",
+                "content": messages[i % len(messages)]
+            }, ensure_ascii=False))
+        await receiver
+
+async def run(url: str, args) -> dict:
+    messages = synthetic_messages(1000, toxic_ratio=args.toxic_ratio)
+    per_client = args.messages // args.clients
+    latencies = []
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(url, client_id, per_client, args.conversations, args.window, messages, latencies)
+        for client_id in range(args.clients)
+    ))
+    return summarize(latencies, time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput kiểm duyệt chat qua WebSocket")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--conversations", type=int, default=50, help="Số hội thoại mỗi client")
+    parser.add_argument("--window", type=int, default=256, help="Số tin tối đa chưa có verdict mỗi client")
+    parser.add_argument("--toxic-ratio", type=float, default=0.05)
+    parser.add_argument("--text-latency", type=float, default=0.02, help="Độ trễ mỗi batch của text model giả (giây)")
+    parser.add_argument("--image-latency", type=float, default=0.03)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--base-url", help="Dùng server có sẵn thay vì tự khởi động")
+    parser.add_argument("--output", help="Ghi report JSON ra file")
+    args = parser.parse_args()
+
+    process = None
+    try:
+        if args.base_url:
+            base_url = args.base_url.rstrip("/")
+        else:
+            process, base_url = start_server(args, tempfile.mkdtemp(prefix="aicp-ws-"), smtp_port=None)
+
+        results = {"verdicts": asyncio.run(run(base_url.replace("http", "ws", 1) + "/ws", args))}
+        params = {key: value for key, value in vars(args).items() if key not in ("output", "base_url")}
+        write_report("ws_stream", results, params, args.output)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+if __name__ == "__main__":
+    main()
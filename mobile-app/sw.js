@@ -1,5 +1,5 @@
 // Service Worker for AI Child Protection Mobile App
-const CACHE_NAME = 'ai-protection-v1';
+const CACHE_NAME = 'ai-protection-v3';
 const urlsToCache = [
     '/mobile',
     '/mobile/',
@@ -7,6 +7,281 @@ const urlsToCache = [
     '/mobile/sw.js'
 ];
 
+// Bộ luật lọc sơ bộ trên thiết bị: tải từ server, lưu trong cache riêng, đồng bộ delta theo version
+const RULES_CACHE = 'ai-protection-rules';
+const RULES_URL = '/api/rules/bundle';
+const POLICY_URL = '/api/rules/policy';
+const RULES_SYNC_INTERVAL = 5 * 60 * 1000;
+const PRESCREEN_PATHS = new Set(['/api/check_text', '/api/check_url', '/api/check_image']);
+
+let rules = null;       // {version, sections}
+let lookup = null;      // automaton và các Set dựng từ rules
+let lastSync = 0;
+let syncing = null;
+// Policy đã compile của các thiết bị có gửi X-Device-Id: deviceId -> {policy, syncedAt}
+const devicePolicies = new Map();
+
+function compilePolicy(policy) {
+    return Object.assign({}, policy, {
+        categories: new Set(policy.text_categories),
+        alertLabels: new Set(policy.text_alert_labels),
+        allowedDomains: new Set(policy.allowed_domains),
+        blockedDomains: new Set(policy.blocked_domains)
+    });
+}
+
+async function syncPolicy(deviceId) {
+    const response = await fetch(POLICY_URL, { headers: { 'X-Device-Id': deviceId }, cache: 'no-cache' });
+    if (response.ok) {
+        devicePolicies.set(deviceId, { policy: compilePolicy(await response.json()), syncedAt: Date.now() });
+    }
+}
+
+// Policy của thiết bị gửi request (profile của trẻ), null nếu chưa có: khi đó gửi server
+function policyFor(event) {
+    const deviceId = event.request.headers.get('x-device-id');
+    if (!deviceId) {
+        return lookup.policy;
+    }
+    const entry = devicePolicies.get(deviceId);
+    if (!entry || Date.now() - entry.syncedAt > RULES_SYNC_INTERVAL) {
+        event.waitUntil(syncPolicy(deviceId).catch((error) => console.log('[SW] Policy sync failed:', error)));
+    }
+    return entry ? entry.policy : null;
+}
+
+function setRules(bundle) {
+    const automaton = bundle.sections.text.automaton;
+    rules = bundle;
+    lookup = {
+        goto: automaton.chars.map((chars, node) => {
+            const edges = new Map();
+            Array.from(chars).forEach((char, index) => edges.set(char, automaton.next[node][index]));
+            return edges;
+        }),
+        denyDomains: new Set(bundle.sections.deny_domains),
+        allowDomains: new Set(bundle.sections.allow_domains),
+        textHashes: new Set(bundle.sections.text_hashes),
+        imageHashes: new Set(bundle.sections.image_hashes),
+        policy: compilePolicy(bundle.sections.policy)
+    };
+}
+
+async function loadRules() {
+    if (!rules) {
+        const stored = await (await caches.open(RULES_CACHE)).match(RULES_URL);
+        const bundle = stored && await stored.json();
+        // Bundle cũ chưa có policy thì bỏ, tải lại bản đầy đủ
+        if (bundle && bundle.sections.policy) {
+            setRules(bundle);
+        }
+    }
+    return rules;
+}
+
+function applyDelta(bundle, delta) {
+    const sections = Object.assign({}, bundle.sections, delta.replace);
+    delta.removed.forEach((name) => delete sections[name]);
+    Object.entries(delta.sets).forEach(([name, change]) => {
+        const items = new Set(sections[name] || []);
+        change.removed.forEach((item) => items.delete(item));
+        change.added.forEach((item) => items.add(item));
+        sections[name] = Array.from(items);
+    });
+    return { version: delta.version, sections };
+}
+
+// Gửi since=<version đang có>: server trả 304, delta (chỉ phần đổi) hoặc bundle đầy đủ
+function syncRules() {
+    if (!syncing) {
+        syncing = (async () => {
+            const current = await loadRules();
+            const response = await fetch(current ? `${RULES_URL}?since=${encodeURIComponent(current.version)}` : RULES_URL, { cache: 'no-cache' });
+            lastSync = Date.now();
+            if (response.status === 304 || !response.ok) {
+                return rules;
+            }
+
+            const data = await response.json();
+            const bundle = data.type === 'delta' ? applyDelta(current, data) : { version: data.version, sections: data.sections };
+            setRules(bundle);
+            await (await caches.open(RULES_CACHE)).put(RULES_URL, new Response(JSON.stringify(bundle), {
+                headers: { 'Content-Type': 'application/json' }
+            }));
+            console.log('[SW] Rules updated to version', bundle.version, `(${data.type})`);
+            return rules;
+        })()
+            .catch((error) => {
+                console.log('[SW] Rules sync failed:', error);
+                return rules;
+            })
+            .finally(() => {
+                syncing = null;
+            });
+    }
+    return syncing;
+}
+
+// 16 ký tự hex đầu của SHA-256, giống text_digest / image_digest trên server
+async function digest(data) {
+    const hash = new Uint8Array(await crypto.subtle.digest('SHA-256', data));
+    return Array.from(hash.slice(0, 8), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+// Giống Policy.label_text trên server: chỉ xét nhóm profile theo dõi, trung bình chia cho tổng số nhóm
+function labelText(policy, categories) {
+    const names = Object.keys(categories);
+    const scores = names.filter((name) => policy.categories.has(name)).map((name) => categories[name]);
+    const maxScore = Math.max(0, ...scores);
+    const average = names.length ? scores.reduce((sum, score) => sum + score, 0) / names.length : 0;
+    if (maxScore > policy.text_toxic_above) {
+        return { label: 'toxic', score: maxScore };
+    }
+    if (average > policy.text_suspicious_above) {
+        return { label: 'suspicious', score: average };
+    }
+    return { label: 'neutral', score: 0.9 };
+}
+
+// Cùng cách chấm với tầng lọc từ khoá trên server, rồi gán label theo policy của thiết bị
+// như server làm với kết quả tầng từ khoá; null = không chắc, gửi server
+async function prescreenText(content, policy) {
+    const text = rules.sections.text;
+    const lower = content.toLowerCase();
+    const words = lower.split(/\s+/).filter(Boolean);
+
+    if (words.length && lookup.textHashes.has(await digest(new TextEncoder().encode(words.join(' '))))) {
+        return { label: 'toxic', score: 1.0, tier: 'device_hash' };
+    }
+
+    const found = new Set();
+    let node = 0;
+    for (const char of lower) {
+        while (node && !lookup.goto[node].has(char)) {
+            node = text.automaton.fail[node];
+        }
+        node = lookup.goto[node].get(char) || 0;
+        text.automaton.out[node].forEach((id) => found.add(id));
+    }
+
+    const counts = text.categories.map(() => 0);
+    found.forEach((id) => { counts[text.keyword_category[id]] += 1; });
+    const scores = counts.map((count, index) => Math.min(count * text.weights[index], 1.0));
+    const categories = Object.fromEntries(text.categories.map((name, index) => [name, scores[index]]));
+    const maxScore = Math.max(...scores);
+
+    if (maxScore > text.flag_above) {
+        return Object.assign(labelText(policy, categories), { categories, tier: 'device_flag' });
+    }
+    if (maxScore === 0 && words.length <= text.clear_max_words) {
+        return Object.assign(labelText(policy, categories), { categories, tier: 'device_clear' });
+    }
+    return null;
+}
+
+// Danh sách của profile xét trước (giống Policy.domain_rule trên server), sau đó danh sách chung của bundle
+function domainRule(url, policy) {
+    let host;
+    try {
+        host = new URL(url.includes('://') ? url : `http://${url}`).hostname.toLowerCase();
+    } catch (error) {
+        return null;
+    }
+    const parts = host.split('.');
+    const suffixes = parts.map((_, index) => parts.slice(index).join('.'));
+    if (suffixes.some((suffix) => policy.blockedDomains.has(suffix))) {
+        return 'blocked';
+    }
+    if (suffixes.some((suffix) => policy.allowedDomains.has(suffix))) {
+        return 'allowed';
+    }
+    if (policy.allowlist_only) {
+        return 'blocked';
+    }
+    if (suffixes.some((suffix) => lookup.denyDomains.has(suffix))) {
+        return 'blocked';
+    }
+    if (suffixes.some((suffix) => lookup.allowDomains.has(suffix))) {
+        return 'allowed';
+    }
+    return null;
+}
+
+function localResponse(body) {
+    body.fidelity = { level: 0, mode: 'device' };
+    body.rules_version = rules.version;
+    return new Response(JSON.stringify(body), {
+        headers: { 'Content-Type': 'application/json', 'X-Rules-Version': rules.version }
+    });
+}
+
+// Trường hợp rõ ràng trả lời ngay trên thiết bị. Nội dung bị chặn vẫn được gửi server
+// ở nền để ghi cảnh báo cho phụ huynh; nội dung sạch / domain cho phép thì không cần gửi.
+async function prescreen(event) {
+    const forward = event.request.clone();
+    try {
+        if (!(await loadRules())) {
+            event.waitUntil(syncRules());
+            return fetch(forward);
+        }
+        if (Date.now() - lastSync > RULES_SYNC_INTERVAL) {
+            event.waitUntil(syncRules());
+        }
+
+        const policy = policyFor(event);
+        if (!policy) {
+            return fetch(forward);
+        }
+
+        const path = new URL(event.request.url).pathname;
+        let body = null;
+        let report = false;
+
+        if (path === '/api/check_text') {
+            const data = await event.request.json();
+            const result = await prescreenText(data.content || '', policy);
+            if (result) {
+                body = { input: data.content, result };
+                report = policy.alertLabels.has(result.label);
+            }
+        } else if (path === '/api/check_url') {
+            const data = await event.request.json();
+            const rule = domainRule(data.url || '', policy);
+            if (rule) {
+                const blocked = rule === 'blocked';
+                body = {
+                    url: data.url,
+                    label: blocked ? 'dangerous' : 'safe',
+                    score: blocked ? 1.0 : 0.0,
+                    risk_level: blocked ? 'high' : 'low',
+                    structure_analysis: { score: blocked ? 1.0 : 0.0, reasons: [`Domain is ${rule} on device`] },
+                    content_analysis: { score: 0.0, reasons: [], skipped: true },
+                    policy_rule: rule,
+                    tier: 'device_domain'
+                };
+                report = blocked;
+            }
+        } else {
+            const file = (await event.request.formData()).get('file');
+            if (file && lookup.imageHashes.has(await digest(await file.arrayBuffer()))) {
+                body = { filename: file.name, result: { label: 'nsfw', score: 1.0, tier: 'device_hash' } };
+                report = true;
+            }
+        }
+
+        if (!body) {
+            return fetch(forward);
+        }
+        if (report) {
+            event.waitUntil(fetch(forward).catch((error) => console.log('[SW] Report failed:', error)));
+        }
+        return localResponse(body);
+    } catch (error) {
+        console.log('[SW] Prescreen failed:', error);
+        return fetch(forward);
+    }
+}
+
 // Install Service Worker
 self.addEventListener('install', (event) => {
     console.log('[SW] Installing service worker...');
@@ -24,11 +299,37 @@ self.addEventListener('install', (event) => {
 
 // Fetch Service Worker
 self.addEventListener('fetch', (event) => {
+    // Kiểm tra text / URL / ảnh: lọc sơ bộ bằng bộ luật trên thiết bị trước
+    if (event.request.method === 'POST' && PRESCREEN_PATHS.has(new URL(event.request.url).pathname)) {
+        event.respondWith(prescreen(event));
+        return;
+    }
+
     // Only handle GET requests
     if (event.request.method !== 'GET') {
         return;
     }
 
+    // API: luôn hỏi server (trình duyệt tự gửi If-None-Match, server trả 304 nếu không đổi),
+    // chỉ dùng bản đã lưu khi offline
+    if (new URL(event.request.url).pathname.startsWith('/api/')) {
+        event.respondWith(
+            fetch(event.request)
+                .then((response) => {
+                    if (response.ok) {
+                        const responseToCache = response.clone();
+                        caches.open(CACHE_NAME).then((cache) => cache.put(event.request, responseToCache));
+                    }
+                    return response;
+                })
+                .catch(() => caches.match(event.request).then((response) => response || new Response('Offline content not available', {
+                    status: 503,
+                    statusText: 'Service Unavailable'
+                })))
+        );
+        return;
+    }
+
     event.respondWith(
         caches.match(event.request)
             .then((response) => {
@@ -75,16 +376,29 @@ self.addEventListener('activate', (event) => {
         caches.keys().then((cacheNames) => {
             return Promise.all(
                 cacheNames.map((cacheName) => {
-                    if (cacheName !== CACHE_NAME) {
+                    if (cacheName !== CACHE_NAME && cacheName !== RULES_CACHE) {
                         console.log('[SW] Deleting old cache:', cacheName);
                         return caches.delete(cacheName);
                     }
                 })
             );
-        })
+        }).then(() => syncRules())
     );
 });
 
+// Trang yêu cầu đồng bộ bộ luật (lúc mở app), trả lại version đang dùng
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'sync-rules') {
+        event.waitUntil(
+            syncRules().then((current) => {
+                if (event.source) {
+                    event.source.postMessage({ type: 'rules-version', version: current ? current.version : null });
+                }
+            })
+        );
+    }
+});
+
 // Handle background sync (if supported)
 self.addEventListener('sync', (event) => {
     console.log('[SW] Background sync:', event.tag);
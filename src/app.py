@@ -1,8 +1,22 @@
+from src.utils.log import configure_logging
+
+# Cấu hình logging trước khi import router để log lúc load model cũng đúng định dạng
+configure_logging()
+
+import time
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from src.routers import text_api, image_api, parent_alerts, stats_api, websocket_router, url_api, video_api, audio_api
+from src.routers import text_api, image_api, parent_alerts, stats_api, websocket_router, url_api, video_api, audio_api, jobs_api, metrics_api, admin_api, profiles_api, rules_api
+from src.utils.metrics import HTTP_REQUEST_SECONDS
+from src.utils.tracing import span
+from src.utils.notifier import dispatcher as notification_dispatcher
+from src.utils.jobs import job_manager
+from src.utils.alert_store import alert_store
+from src.utils.qos import qos
+from src.utils.policy import policy_store
+from src.utils.database import dispose_async_engines
 import os
 
 app = FastAPI(title="AI Child Protection – Online Safety (Upgraded)")
@@ -19,6 +33,55 @@ app.include_router(websocket_router.router, prefix="", tags=["WebSocket"])
 app.include_router(video_api.router, prefix="/api", tags=["Video"])
 app.include_router(audio_api.router, prefix="/api", tags=["Audio"])
 app.include_router(url_api.router, prefix="/api", tags=["URL"])
+app.include_router(jobs_api.router, prefix="/api", tags=["Jobs"])
+app.include_router(metrics_api.router, prefix="", tags=["Metrics"])
+app.include_router(admin_api.router, prefix="/api", tags=["Admin"])
+app.include_router(profiles_api.router, prefix="/api", tags=["Profiles"])
+app.include_router(rules_api.router, prefix="/api", tags=["Rules"])
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with span("http", method=request.method) as request_span:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            if request_span is not None:
+                response.headers["X-Trace-Id"] = request_span.trace_id
+            return response
+        finally:
+            # Dùng path template của route (vd. /api/jobs/{job_id}) để số label không tăng theo id
+            route = request.scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, path=path, status=status)
+            if request_span is not None:
+                request_span.name = f"{request.method} {path}"
+                request_span.set(status=status)
+
+@app.on_event("startup")
+async def start_job_workers():
+    # Khởi động worker pool và chạy lại các job chưa xong từ lần chạy trước
+    await job_manager.start()
+    # Bảo trì partition alert định kỳ (migrate bảng cũ, đóng / archive partition)
+    await alert_store.start()
+    # Controller QoS: hạ / nâng chất lượng phân tích theo tải
+    await qos.start()
+    # Nạp và compile profile của các thiết bị, kiểm tra thay đổi định kỳ
+    await policy_store.start()
+    # Build bundle luật cho app mobile, kiểm tra nguồn luật định kỳ
+    await rules_api.rules_bundle.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await job_manager.stop()
+    await alert_store.stop()
+    await qos.stop()
+    await policy_store.stop()
+    await rules_api.rules_bundle.stop()
+    await dispose_async_engines()
+    # Gửi nốt email cảnh báo đang chờ trước khi tắt
+    notification_dispatcher.stop()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
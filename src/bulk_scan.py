@@ -0,0 +1,348 @@
+"""
+Quét offline hàng loạt: thư mục (backup thiết bị) và corpus JSONL (log chat xuất ra).
+
+    python -m src.bulk_scan PATH [PATH ...] --output results.jsonl [--workers N] [--resume] [--load-alerts]
+
+- File ảnh / video / .txt trong thư mục được quét đệ quy.
+- Mỗi dòng của file .jsonl là một item: {"id"?, "text" | "content" | "image" | "video"}.
+- Kết quả ghi dần ra JSONL hoặc CSV (theo đuôi file output). Với --resume các item
+  đã có trong file output được bỏ qua nên chạy lại sau khi bị ngắt không làm lại từ đầu.
+- --load-alerts ghi các item bị đánh dấu vào bảng alerts (không gửi email / WebSocket).
+"""
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from src.utils.log import configure_logging
+from src.utils.policy import default_policy
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.wmv')
+TEXT_EXTENSIONS = ('.txt',)
+
+# Số item mỗi task gửi sang worker: đủ lớn để model chạy theo batch, đủ nhỏ để checkpoint dày
+CHUNK_SIZES = {"text": 256, "image": 32, "video": 1}
+
+CSV_FIELDS = ["id", "kind", "source", "label", "score", "flagged", "error"]
+
+# --- Đọc input ---
+
+def iter_items(paths: list):
+    """Sinh (kind, id, source): source là path với ảnh/video, nội dung với text"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield from _file_item(os.path.join(root, name))
+        elif path.lower().endswith(".jsonl"):
+            yield from _corpus_items(path)
+        else:
+            yield from _file_item(path)
+
+def _file_item(path: str):
+    lower = path.lower()
+    if lower.endswith(IMAGE_EXTENSIONS):
+        yield "image", path, path
+    elif lower.endswith(VIDEO_EXTENSIONS):
+        yield "video", path, path
+    elif lower.endswith(TEXT_EXTENSIONS):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield "text", path, f.read()
+
+def _corpus_items(path: str):
+    base = os.path.dirname(path)
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping invalid JSON at %s:%d", path, line_number)
+                continue
+
+            item_id = str(record.get("id", f"{path}:{line_number}"))
+            if record.get("text") is not None or record.get("content") is not None:
+                yield "text", item_id, record.get("text", record.get("content"))
+            elif record.get("image"):
+                yield "image", item_id, os.path.join(base, record["image"])
+            elif record.get("video"):
+                yield "video", item_id, os.path.join(base, record["video"])
+
+def iter_chunks(items, skip_ids: set):
+    """Gom item theo loại thành chunk (kind, [(id, source), ...])"""
+    pending = {kind: [] for kind in CHUNK_SIZES}
+    for kind, item_id, source in items:
+        if item_id in skip_ids:
+            continue
+        pending[kind].append((item_id, source))
+        if len(pending[kind]) >= CHUNK_SIZES[kind]:
+            yield kind, pending[kind]
+            pending[kind] = []
+    for kind, chunk in pending.items():
+        if chunk:
+            yield kind, chunk
+
+# --- Worker (chạy trong process con) ---
+
+def _init_worker(torch_threads: int):
+    # Chia core cho các process để torch không tranh nhau thread
+    import torch
+    torch.set_num_threads(torch_threads)
+
+def scan_chunk(kind: str, chunk: list):
+    """Trả về (records, giây xử lý) cho một chunk"""
+    started = time.perf_counter()
+
+    if kind == "text":
+        from src.filters.text_filter import check_texts
+        results = check_texts([source for _, source in chunk])
+    elif kind == "image":
+        from src.filters.image_filter import classify_images, decode_images
+        decoded = decode_images([source for _, source in chunk])
+        ok = [image for image, _ in decoded if image is not None]
+        classified = iter(classify_images(ok))
+        results = [
+            next(classified) if image is not None else {"label": "error", "score": 0.0, "error": error}
+            for image, error in decoded
+        ]
+    else:
+        results = [_scan_video(source) for _, source in chunk]
+
+    records = [make_record(kind, item_id, source, result) for (item_id, source), result in zip(chunk, results)]
+    return records, time.perf_counter() - started
+
+def is_flagged(kind: str, result: dict) -> bool:
+    """Cùng quy tắc cảnh báo với server (policy mặc định): đổi ngưỡng / nhãn trong config thì bulk scan đổi theo"""
+    if kind == "text":
+        return default_policy.alerts_text(result)
+    if kind == "image":
+        return default_policy.alerts_image(result)
+    return result.get("label", "").lower() == "suspicious"
+
+def make_record(kind: str, item_id: str, source, result: dict) -> dict:
+    return {
+        "id": item_id,
+        "kind": kind,
+        # Text không ghi lại nội dung ra output, chỉ ghi id
+        "source": source if kind != "text" else None,
+        "label": result.get("label"),
+        "score": result.get("score"),
+        "flagged": is_flagged(kind, result),
+        "error": result.get("error"),
+        "result": result
+    }
+
+def _scan_video(path: str) -> dict:
+    from src.filters.video_filter import scan_video_frames
+    from src.utils.media import VideoDecoder
+
+    try:
+        with VideoDecoder(path) as video:
+            frames = scan_video_frames(video, sample_rate=30)
+    except Exception as e:
+        return {"label": "error", "score": 0.0, "error": str(e)}
+
+    suspicious = frames["suspicious_frames"]
+    return dict(
+        frames,
+        label="suspicious" if suspicious else "safe",
+        score=min(suspicious * 0.1, 1.0)
+    )
+
+# --- Output / checkpoint ---
+
+def load_checkpoint(output: str, fmt: str) -> set:
+    """
+    Đọc id các item đã xong từ file output; dòng cuối bị ghi dở (process bị kill) được cắt bỏ
+    để ghi tiếp an toàn.
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+
+    good_end = 0
+    with open(output, "rb") as f:
+        if fmt == "jsonl":
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    done.add(json.loads(raw.decode("utf-8", errors="replace"))["id"])
+                except (ValueError, KeyError):
+                    break
+                good_end += len(raw)
+        else:
+            # Field có xuống dòng (trong ngoặc kép) trải qua nhiều dòng nên phải đọc bằng csv.reader;
+            # strict để record bị ghi dở giữa field báo lỗi thay vì trả về một dòng thiếu
+            consumed = [0]
+            reader = csv.reader(_complete_lines(f, consumed), strict=True)
+            try:
+                if next(reader) == CSV_FIELDS:
+                    good_end = consumed[0]
+                    for row in reader:
+                        if len(row) != len(CSV_FIELDS):
+                            break
+                        done.add(row[0])
+                        good_end = consumed[0]
+            except (csv.Error, StopIteration):
+                pass
+
+    with open(output, "r+b") as f:
+        f.truncate(good_end)
+    return done
+
+def _complete_lines(f, consumed: list):
+    """
+    Sinh các dòng đã ghi đủ (kết thúc bằng newline) và cộng dồn số byte vào `consumed[0]`.
+    csv.reader chỉ lấy dòng khi cần nên sau mỗi record, `consumed[0]` là vị trí cuối record đó.
+    """
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            return
+        consumed[0] += len(raw)
+        yield raw.decode("utf-8", errors="replace")
+
+class ResultWriter:
+    def __init__(self, output: str, fmt: str):
+        self.fmt = fmt
+        is_new = not os.path.exists(output) or os.path.getsize(output) == 0
+        self._file = open(output, "a", encoding="utf-8", newline="")
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            if is_new:
+                self._csv.writeheader()
+
+    def write(self, records: list):
+        for record in records:
+            if self.fmt == "csv":
+                self._csv.writerow(record)
+            else:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        # Flush sau mỗi chunk: file output cũng là checkpoint để --resume
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def load_alerts(records: list):
+    """Ghi các item bị đánh dấu vào partition alert theo lô"""
+    from src.utils.alert_store import alert_store
+
+    alert_store.insert_alerts([
+        {
+            "time": datetime.datetime.utcnow(),
+            "type": f"BULK_{record['kind'].upper()}",
+            "content": record["id"],
+            "result": record["result"],
+            "level": "warning"
+        }
+        for record in records
+    ])
+
+# --- Main ---
+
+def default_workers() -> int:
+    # Mỗi process giữ một bản model riêng: dùng nửa số core, mỗi process ít nhất 2 thread torch
+    return max(1, (os.cpu_count() or 2) // 2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quét offline hàng loạt ảnh, text và video")
+    parser.add_argument("paths", nargs="+", help="Thư mục, file hoặc corpus .jsonl")
+    parser.add_argument("--output", "-o", required=True, help="File kết quả .jsonl hoặc .csv")
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--resume", action="store_true", help="Bỏ qua các item đã có trong file output")
+    parser.add_argument("--load-alerts", action="store_true", help="Ghi item bị đánh dấu vào bảng alerts")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+
+    fmt = "csv" if args.output.lower().endswith(".csv") else "jsonl"
+    if os.path.exists(args.output) and not args.resume:
+        parser.error(f"{args.output} already exists (use --resume to continue it)")
+    done = load_checkpoint(args.output, fmt) if args.resume else set()
+    if done:
+        logger.info("Resuming: %d item(s) already scanned", len(done))
+
+    writer = ResultWriter(args.output, fmt)
+    stats = {kind: {"items": 0, "flagged": 0, "errors": 0, "worker_seconds": 0.0} for kind in CHUNK_SIZES}
+    torch_threads = max(1, (os.cpu_count() or 1) // args.workers)
+    started = time.perf_counter()
+
+    chunks = iter_chunks(iter_items(args.paths), done)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(torch_threads,)) as pool:
+        in_flight = {}
+
+        def submit_next() -> bool:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            submit(chunk)
+            return True
+
+        def submit(chunk):
+            in_flight[pool.submit(scan_chunk, *chunk)] = chunk
+
+        # Giữ tối đa 2 chunk mỗi worker để không đọc trước toàn bộ input vào bộ nhớ
+        while len(in_flight) < args.workers * 2 and submit_next():
+            pass
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, items = in_flight.pop(future)
+                try:
+                    records, seconds = future.result()
+                except BrokenProcessPool:
+                    # Worker chết (OOM / crash): dừng, các item chưa ghi sẽ được quét lại với --resume
+                    raise
+                except Exception as e:
+                    if len(items) > 1:
+                        # Quét lại từng item để lỗi của một item không kéo theo cả chunk
+                        logger.warning("%s chunk of %d item(s) failed (%s), retrying item by item", kind, len(items), e)
+                        for item in items:
+                            submit((kind, [item]))
+                        continue
+                    logger.warning("Failed to scan %s %s: %s", kind, items[0][0], e)
+                    records = [make_record(kind, item_id, source, {"label": "error", "score": 0.0, "error": str(e)}) for item_id, source in items]
+                    seconds = 0.0
+                writer.write(records)
+
+                flagged = [record for record in records if record["flagged"]]
+                if flagged and args.load_alerts:
+                    load_alerts(flagged)
+
+                stats[kind]["items"] += len(records)
+                stats[kind]["flagged"] += len(flagged)
+                stats[kind]["errors"] += sum(1 for record in records if record["error"])
+                stats[kind]["worker_seconds"] += seconds
+                submit_next()
+
+    writer.close()
+    elapsed = time.perf_counter() - started
+
+    report = {"seconds": round(elapsed, 2), "workers": args.workers, "skipped": len(done), "modalities": {}}
+    for kind, kind_stats in stats.items():
+        if not kind_stats["items"]:
+            continue
+        report["modalities"][kind] = dict(
+            kind_stats,
+            worker_seconds=round(kind_stats["worker_seconds"], 2),
+            items_per_second=round(kind_stats["items"] / elapsed, 2),
+            items_per_worker_second=round(kind_stats["items"] / kind_stats["worker_seconds"], 2) if kind_stats["worker_seconds"] else None
+        )
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
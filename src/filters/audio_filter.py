@@ -0,0 +1,243 @@
+import logging
+import speech_recognition as sr
+import threading
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.filters.text_filter import check_text
+from src.utils.batcher import MicroBatcher
+from src.utils.config import get_section
+from src.utils.metrics import MODEL_INFERENCE_SECONDS, MODEL_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CONFIG = get_section("audio", {
+    "recognizer": "google",
+    "language": "vi-VN",
+    "local_model": "nguyenvulebinh/wav2vec2-base-vietnamese-250h",
+    "local_batch_size": 8,
+    "max_concurrent_segments": 4
+})
+
+# Định dạng chuẩn cho nhận dạng giọng nói: mono, 16 kHz, 16-bit PCM
+TARGET_SAMPLE_RATE = 16000
+
+# Tham số tách đoạn theo khoảng lặng (ms / dB)
+MIN_SILENCE_LEN = 500
+SILENCE_THRESH_OFFSET = -16
+KEEP_SILENCE = 200
+MAX_SEGMENT_MS = 30000
+
+# Số đoạn được nhận dạng song song tối đa (dùng chung cho mọi request)
+MAX_CONCURRENT_SEGMENTS = AUDIO_CONFIG["max_concurrent_segments"]
+
+TOXIC_LABELS = ["toxic", "suspicious"]
+
+_recognition_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SEGMENTS, thread_name_prefix="speech-recognition")
+
+class GoogleRecognizer:
+    """
+    Backend nhận dạng qua Google Web Speech API (cần kết nối mạng).
+    Mọi backend chỉ cần có `name` và `recognize(segment) -> str`.
+    """
+    name = "google"
+
+    def __init__(self, language: str = "vi-VN"):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, segment: AudioSegment) -> str:
+        audio_data = sr.AudioData(segment.raw_data, segment.frame_rate, segment.sample_width)
+        try:
+            return self._recognizer.recognize_google(audio_data, language=self.language)
+        except sr.UnknownValueError:
+            # Đoạn không có lời nói rõ ràng
+            return ""
+
+class LocalRecognizer:
+    """
+    Backend nhận dạng offline bằng model ASR tiếng Việt chạy trên CPU (wav2vec2).
+    Model chỉ load một lần và dùng chung; các đoạn từ nhiều request đến cùng lúc
+    được gom thành batch để decode chung.
+    """
+    name = "local"
+
+    _pipeline = None
+    _load_lock = threading.Lock()
+
+    def __init__(self, model_name: str = AUDIO_CONFIG["local_model"], batch_size: int = AUDIO_CONFIG["local_batch_size"]):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._batcher = MicroBatcher(self._transcribe_batch, max_batch_size=batch_size, max_wait=0.02, name="asr-batcher")
+
+    def _get_pipeline(self):
+        if LocalRecognizer._pipeline is None:
+            with LocalRecognizer._load_lock:
+                if LocalRecognizer._pipeline is None:
+                    from transformers import pipeline
+                    logger.info("Loading local ASR model: %s", self.model_name)
+                    LocalRecognizer._pipeline = pipeline("automatic-speech-recognition", model=self.model_name, device=-1)
+        return LocalRecognizer._pipeline
+
+    def _transcribe_batch(self, samples: list):
+        asr = self._get_pipeline()
+        inputs = [{"raw": audio, "sampling_rate": TARGET_SAMPLE_RATE} for audio in samples]
+        MODEL_BATCH_SIZE.observe(len(samples), model="asr")
+        with MODEL_INFERENCE_SECONDS.time(model="asr"):
+            outputs = asr(inputs, batch_size=self.batch_size)
+        return [output["text"] for output in outputs]
+
+    def submit(self, segment: AudioSegment):
+        """
+        Đưa đoạn thẳng vào batcher và trả về Future, không chiếm thread của
+        `_recognition_pool` (pool chỉ có `max_concurrent_segments` thread, nhỏ hơn
+        `local_batch_size` thì batch không bao giờ đầy).
+        """
+        segment = normalize_audio(segment)
+        samples = np.array(segment.get_array_of_samples(), dtype=np.float32) / 32768.0
+        return self._batcher.submit(samples)
+
+    def recognize(self, segment: AudioSegment) -> str:
+        return self.submit(segment).result()
+
+RECOGNIZER_BACKENDS = {
+    "google": lambda: GoogleRecognizer(language=AUDIO_CONFIG["language"]),
+    "local": LocalRecognizer
+}
+
+_recognizer = None
+
+def get_recognizer():
+    """Lấy backend nhận dạng đang dùng (chọn qua config `audio.recognizer`, mặc định Google)"""
+    global _recognizer
+    if _recognizer is None:
+        _recognizer = RECOGNIZER_BACKENDS[AUDIO_CONFIG["recognizer"]]()
+    return _recognizer
+
+def set_recognizer(recognizer):
+    """Thay backend nhận dạng, ví dụ một stand-in chạy local khi test"""
+    global _recognizer
+    _recognizer = recognizer
+
+def normalize_audio(audio: AudioSegment) -> AudioSegment:
+    """Chuyển về mono 16 kHz 16-bit để mọi backend dùng chung"""
+    return audio.set_channels(1).set_frame_rate(TARGET_SAMPLE_RATE).set_sample_width(2)
+
+def segment_audio(audio: AudioSegment, max_segment_ms: int = MAX_SEGMENT_MS):
+    """
+    Tách audio thành các đoạn có tiếng nói dựa trên khoảng lặng.
+    Các đoạn ngắn liền nhau được gộp lại, đoạn dài bị cắt theo max_segment_ms.
+    Trả về list (start_ms, end_ms).
+    """
+    if len(audio) == 0 or audio.dBFS == float("-inf"):
+        return []
+
+    ranges = detect_nonsilent(
+        audio,
+        min_silence_len=MIN_SILENCE_LEN,
+        silence_thresh=audio.dBFS + SILENCE_THRESH_OFFSET
+    )
+
+    segments = []
+    for start, end in ranges:
+        start = max(start - KEEP_SILENCE, 0)
+        end = min(end + KEEP_SILENCE, len(audio))
+
+        # Gộp với đoạn trước nếu tổng độ dài vẫn nằm trong giới hạn (giảm số lần gọi recognizer)
+        if segments and end - segments[-1][0] <= max_segment_ms:
+            segments[-1] = (segments[-1][0], end)
+            continue
+
+        # Cắt đoạn quá dài
+        while end - start > max_segment_ms:
+            segments.append((start, start + max_segment_ms))
+            start += max_segment_ms
+        segments.append((start, end))
+
+    return segments
+
+def analyze_speech(audio: AudioSegment, recognizer=None, on_partial=None):
+    """
+    Nhận dạng song song từng đoạn, kiểm tra transcript từng phần ngay khi có
+    và dừng sớm khi phát hiện lời nói độc hại.
+
+    `on_partial(index, text, analysis)` được gọi cho mỗi đoạn nhận dạng xong.
+    """
+    recognizer = recognizer or get_recognizer()
+    audio = normalize_audio(audio)
+    ranges = segment_audio(audio)
+
+    if not ranges:
+        return {
+            "transcription": "",
+            "analysis": {"label": "neutral", "score": 0.9},
+            "has_speech": False,
+            "segments": 0,
+            "recognizer": recognizer.name
+        }
+
+    # Backend có `submit` (local) tự gom batch; backend khác chạy trong pool
+    submit = getattr(recognizer, "submit", None) or (lambda segment: _recognition_pool.submit(recognizer.recognize, segment))
+    futures = {
+        submit(audio[start:end]): index
+        for index, (start, end) in enumerate(ranges)
+    }
+
+    transcripts = {}
+    errors = []
+    flagged = None
+
+    for future in as_completed(futures):
+        index = futures[future]
+        try:
+            text = future.result().strip()
+        except Exception as e:
+            errors.append(str(e))
+            continue
+
+        if not text:
+            continue
+
+        transcripts[index] = text
+        analysis = check_text(text)
+
+        if on_partial:
+            on_partial(index, text, analysis)
+
+        if analysis["label"].lower() in TOXIC_LABELS:
+            flagged = {
+                "analysis": analysis,
+                "segment": index,
+                "start": ranges[index][0] / 1000,
+                "end": ranges[index][1] / 1000
+            }
+            # Dừng sớm: huỷ các đoạn chưa bắt đầu nhận dạng
+            for pending in futures:
+                pending.cancel()
+            break
+
+    transcription = " ".join(transcripts[i] for i in sorted(transcripts))
+
+    result = {
+        "transcription": transcription,
+        "has_speech": bool(transcription),
+        "segments": len(ranges),
+        "recognized_segments": len(transcripts),
+        "recognizer": recognizer.name,
+        "early_exit": flagged is not None
+    }
+
+    if flagged:
+        result["analysis"] = flagged["analysis"]
+        result["flagged_segment"] = {k: flagged[k] for k in ("segment", "start", "end")}
+    elif transcription:
+        # Kiểm tra thêm toàn bộ transcript để bắt nội dung trải dài qua nhiều đoạn
+        result["analysis"] = check_text(transcription)
+    else:
+        result["analysis"] = {"label": "neutral", "score": 0.9}
+
+    if errors:
+        result["error"] = f"Recognition service error: {errors[0]}"
+
+    return result
@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict, deque
+from src.filters.text_filter import advanced_vietnamese_text_check, check_text_async
+from src.utils.config import get_section
+from src.utils.policy import Policy, default_policy
+
+CONVERSATION_CONFIG = get_section("chat_moderation", {
+    # Số tin gần nhất được giữ cho mỗi cuộc hội thoại và thời gian tối đa giữa chúng (giây)
+    "context_messages": 6,
+    "context_seconds": 120,
+    # Số tin toxic/suspicious của cùng một người gửi trong cửa sổ thì coi là quấy rối liên tục
+    "harassment_threshold": 3,
+    # Giới hạn số hội thoại giữ trong bộ nhớ mỗi worker (bỏ hội thoại ít dùng nhất)
+    "max_conversations": 10000
+})
+
+FLAGGED_LABELS = ("toxic", "suspicious")
+
+class ConversationContext:
+    """Các tin gần nhất của một cuộc hội thoại: (thời điểm, người gửi, nội dung, label)"""
+
+    def __init__(self, size: int):
+        self.messages = deque(maxlen=size)
+
+    def recent(self, now: float, max_age: float, sender=None) -> list:
+        return [
+            message for message in self.messages
+            if now - message[0] <= max_age and (sender is None or message[1] == sender)
+        ]
+
+    def add(self, now: float, sender, content: str, label: str):
+        self.messages.append((now, sender, content, label))
+
+class ConversationModerator:
+    """
+    Kiểm duyệt tin nhắn theo luồng: mỗi tin được chấm riêng (cascade + text_batcher),
+    sau đó xét thêm ngữ cảnh các tin trước trong cùng hội thoại để bắt:
+    - lời lẽ độc hại bị tách ra nhiều tin ngắn (mỗi tin riêng lẻ trông vô hại)
+    - một người gửi liên tục nhiều tin xúc phạm trong thời gian ngắn
+    """
+
+    def __init__(self, config: dict = CONVERSATION_CONFIG):
+        self.config = config
+        self._conversations = OrderedDict()
+
+    def _context(self, key: tuple) -> ConversationContext:
+        context = self._conversations.get(key)
+        if context is None:
+            context = self._conversations[key] = ConversationContext(self.config["context_messages"])
+            if len(self._conversations) > self.config["max_conversations"]:
+                self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(key)
+        return context
+
+    def end_conversation(self, conversation_id: str, owner: str = None):
+        self._conversations.pop((owner, conversation_id), None)
+
+    def conversation_count(self) -> int:
+        return len(self._conversations)
+
+    async def moderate(self, conversation_id: str, content: str, sender=None, use_model: bool = True,
+                       policy: Policy = default_policy, owner: str = None) -> dict:
+        """
+        `owner`: thiết bị / client gửi tin. conversation_id do client tự đặt nên ngữ cảnh
+        được tách theo (owner, conversation_id), hai thiết bị trùng id không dùng chung ngữ cảnh.
+        """
+        result = policy.apply_text(await check_text_async(content, use_model and policy.text_model))
+        label = result["label"]
+        reasons = []
+
+        now = time.monotonic()
+        context = self._context((owner, conversation_id))
+        previous = context.recent(now, self.config["context_seconds"], sender)
+
+        # Các tin chưa bị đánh dấu liền trước của cùng người gửi (tin đã bị đánh dấu không ghép lại lần nữa)
+        unflagged = []
+        for message in reversed(previous):
+            if message[3] in FLAGGED_LABELS:
+                break
+            unflagged.append(message[2])
+
+        if label not in FLAGGED_LABELS and unflagged:
+            # Ghép lại để bắt từ ngữ độc hại bị tách ra nhiều tin ngắn
+            combined = policy.apply_text(advanced_vietnamese_text_check(" ".join(reversed(unflagged)) + " " + content))
+            if combined["label"] in FLAGGED_LABELS:
+                label = combined["label"]
+                reasons.append("split_across_messages")
+                result = dict(result, score=combined["score"], context_categories=combined["categories"])
+
+        flagged_before = sum(1 for message in previous if message[3] in FLAGGED_LABELS)
+        if label in FLAGGED_LABELS and flagged_before + 1 >= self.config["harassment_threshold"]:
+            label = "toxic"
+            reasons.append("repeated_harassment")
+
+        context.add(now, sender, content, label)
+
+        return dict(
+            result,
+            label=label,
+            message_label=result["label"],
+            context_reasons=reasons,
+            context_messages=len(previous)
+        )
+
+moderator = ConversationModerator()
@@ -1,23 +1,80 @@
+import logging
 from transformers import pipeline
+import io
 import os
 from PIL import Image
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.batcher import MicroBatcher
+from src.utils.metrics import MODEL_INFERENCE_SECONDS, MODEL_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Kích thước đầu vào của model ViT (Falconsai dùng 224x224)
+MODEL_INPUT_SIZE = 224
+
+# Batch size khi chạy model và thời gian tối đa chờ gom batch giữa các request (giây)
+IMAGE_BATCH_SIZE = 16
+IMAGE_BATCH_WAIT = 0.01
+
+# Thread pool dùng để decode nhiều ảnh song song (PIL nhả GIL khi decode)
+_decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="image-decode")
 
 # Mô hình phát hiện NSFW (ảnh không phù hợp)
 try:
     image_classifier = pipeline("image-classification", model="Falconsai/nsfw_image_detection")
     MODEL_AVAILABLE = True
 except Exception as e:
-    print(f"[WARNING] Failed to load NSFW model: {e}")
+    logger.warning("Failed to load NSFW model: %s", e)
     MODEL_AVAILABLE = False
 
-def check_image(image_path: str):
+def load_image(source, target_size: int = MODEL_INPUT_SIZE):
+    """
+    Decode ảnh đúng một lần từ path, bytes, file-like, PIL Image hoặc NumPy array (RGB).
+    Với JPEG dùng draft mode để decoder tự thu nhỏ gần với kích thước đầu vào của model.
+    Trả về (image, meta) với meta gồm kích thước gốc và dung lượng (bytes) nếu biết.
+    """
+    byte_size = None
+
+    if isinstance(source, Image.Image):
+        img = source
+    elif isinstance(source, np.ndarray):
+        # Frame đã decode (video): không có dung lượng file đã nén, source.nbytes là kích thước
+        # buffer pixel và sẽ làm heuristic dung lượng của simple_image_check đánh dấu mọi frame lớn
+        img = Image.fromarray(source)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        byte_size = len(source)
+        img = Image.open(io.BytesIO(source))
+    elif isinstance(source, str):
+        byte_size = os.path.getsize(source)
+        img = Image.open(source)
+    else:
+        # file-like object (UploadFile.file, BytesIO, ...)
+        data = source.read()
+        byte_size = len(data)
+        img = Image.open(io.BytesIO(data))
+
+    width, height = img.size
+
+    # Draft mode chỉ có tác dụng với JPEG, các format khác bỏ qua
+    if img.format == "JPEG":
+        img.draft("RGB", (target_size, target_size))
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    else:
+        img.load()
+
+    return img, {"width": width, "height": height, "bytes": byte_size}
+
+def check_image(image):
     """
     Kiểm tra hình ảnh có an toàn hay không.
+    `image` có thể là path, bytes, file-like, PIL Image hoặc NumPy array (RGB).
     Trả về kết quả phân tích với label và score.
     """
     # Kiểm tra file tồn tại
-    if not os.path.exists(image_path):
+    if isinstance(image, str) and not os.path.exists(image):
         return {
             "label": "error",
             "score": 0.0,
@@ -25,54 +82,82 @@ def check_image(image_path: str):
         }
 
     try:
-        # Nếu model khả dụng, sử dụng AI
-        if MODEL_AVAILABLE:
-            result = image_classifier(image_path)[0]
-            return {
-                "label": result["label"],
-                "score": float(result["score"])
-            }
-        else:
-            # Fallback: Kiểm tra đơn giản dựa trên kích thước và format
-            return simple_image_check(image_path)
-
+        img, meta = load_image(image)
     except Exception as e:
-        print(f"[ERROR] Image analysis failed: {e}")
-        # Fallback khi AI model gặp lỗi
-        return simple_image_check(image_path)
+        return {
+            "label": "error",
+            "score": 0.0,
+            "error": str(e)
+        }
+
+    return classify_images([(img, meta)])[0]
+
+def decode_images(sources, target_size: int = MODEL_INPUT_SIZE):
+    """
+    Decode song song nhiều ảnh bằng thread pool.
+    Trả về list (decoded, error) cùng thứ tự; decoded là (image, meta) hoặc None nếu lỗi.
+    """
+    def _decode(source):
+        try:
+            return load_image(source, target_size), None
+        except Exception as e:
+            return None, str(e)
+
+    return list(_decode_pool.map(_decode, sources))
 
-def simple_image_check(image_path: str):
+def classify_images(decoded: list, batch_size: int = IMAGE_BATCH_SIZE):
     """
-    Kiểm tra hình ảnh đơn giản dựa trên metadata
+    Phân loại nhiều ảnh đã decode ((image, meta)) trong một lần gọi pipeline.
     """
+    if not decoded:
+        return []
+
     try:
-        with Image.open(image_path) as img:
-            # Kiểm tra kích thước file (MB)
-            file_size = os.path.getsize(image_path) / (1024 * 1024)
-
-            # Kiểm tra kích thước ảnh
-            width, height = img.size
-
-            # Logic đơn giản: Ảnh lớn có thể đáng ngờ
-            if file_size > 5.0:  # > 5MB
-                return {
-                    "label": "suspicious",
-                    "score": 0.7
-                }
-            elif width * height > 1000000:  # > 1 megapixel
-                return {
-                    "label": "suspicious",
-                    "score": 0.5
-                }
-            else:
-                return {
-                    "label": "safe",
-                    "score": 0.9
+        # Nếu model khả dụng, sử dụng AI
+        if MODEL_AVAILABLE:
+            MODEL_BATCH_SIZE.observe(len(decoded), model="image")
+            with MODEL_INFERENCE_SECONDS.time(model="image"):
+                outputs = image_classifier([img for img, _ in decoded], batch_size=batch_size)
+            return [
+                {
+                    "label": output[0]["label"],
+                    "score": float(output[0]["score"])
                 }
+                for output in outputs
+            ]
 
     except Exception as e:
+        logger.error("Image analysis failed: %s", e)
+
+    # Fallback: Kiểm tra đơn giản dựa trên kích thước và format
+    return [simple_image_check(meta) for _, meta in decoded]
+
+# Gom các ảnh từ nhiều request đến cùng lúc vào chung một lần forward
+image_batcher = MicroBatcher(classify_images, max_batch_size=IMAGE_BATCH_SIZE, max_wait=IMAGE_BATCH_WAIT, name="image-batcher")
+
+def simple_image_check(meta: dict):
+    """
+    Kiểm tra hình ảnh đơn giản dựa trên metadata đã đọc khi decode
+    """
+    # Kiểm tra kích thước file (MB)
+    file_size = (meta.get("bytes") or 0) / (1024 * 1024)
+
+    # Kiểm tra kích thước ảnh
+    width, height = meta["width"], meta["height"]
+
+    # Logic đơn giản: Ảnh lớn có thể đáng ngờ
+    if file_size > 5.0:  # > 5MB
         return {
-            "label": "error",
-            "score": 0.0,
-            "error": str(e)
+            "label": "suspicious",
+            "score": 0.7
+        }
+    elif width * height > 1000000:  # > 1 megapixel
+        return {
+            "label": "suspicious",
+            "score": 0.5
+        }
+    else:
+        return {
+            "label": "safe",
+            "score": 0.9
         }
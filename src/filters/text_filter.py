@@ -1,6 +1,18 @@
+import logging
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import torch
+import asyncio
 import re
+import threading
+import time
+from collections import OrderedDict
+from src.utils.batcher import MicroBatcher
+from src.utils.config import get_section
+from src.utils.metrics import MODEL_INFERENCE_SECONDS, MODEL_BATCH_SIZE
+from src.utils.policy import default_policy
+from src.utils.rules_bundle import rule_lists
+
+logger = logging.getLogger(__name__)
 
 PREFIX_TOXIC = "toxic-speech-detection: "
 MODEL_NAME = "tarudesu/ViHateT5-base-HSD"
@@ -15,99 +27,68 @@ def load_model():
     global MODEL_AVAILABLE, tokenizer, model
 
     try:
-        print(f"[INFO] Loading text classification model: {MODEL_NAME}")
+        logger.info("Loading text classification model: %s", MODEL_NAME)
         tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
         model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
         MODEL_AVAILABLE = True
-        print("[INFO] Text classification model loaded successfully")
+        logger.info("Text classification model loaded successfully")
         return True
     except Exception as e:
-        print(f"[WARNING] Failed to load text model: {e}")
+        logger.warning("Failed to load text model: %s", e)
         MODEL_AVAILABLE = False
         return False
 
 # Try to load model on import
 load_model()
 
-def advanced_vietnamese_text_check(content: str):
-    """
-    Advanced Vietnamese text analysis with multiple detection layers
-    """
-    content_lower = content.lower()
-
-    # Multi-layer detection system
-    detection_results = {
-        "cyberbullying": 0.0,
-        "sexual_content": 0.0,
-        "scam": 0.0,
-        "hate_speech": 0.0,
-        "violence": 0.0
-    }
-
+# Từ khoá và trọng số cho từng nhóm nội dung (dùng chung cho phân tích nhiều lớp và tầng lọc nhanh)
+CATEGORY_KEYWORDS = {
     # 1. Cyberbullying Detection (Bắt nạt mạng)
-    cyberbullying_keywords = [
+    "cyberbullying": ([
         'đồ ngu', 'đồ đần', 'đồ chó', 'đồ khốn', 'thằng ngu', 'con đĩ', 'mày ngu',
         'tao đánh', 'tao giết', 'tao đâm', 'mày chết đi', 'mày biến đi',
         'stupid', 'idiot', 'bitch', 'asshole', 'bastard', 'loser', 'ugly'
-    ]
-
-    cyberbullying_count = sum(1 for keyword in cyberbullying_keywords if keyword in content_lower)
-    detection_results["cyberbullying"] = min(cyberbullying_count * 0.3, 1.0)
-
+    ], 0.3),
     # 2. Sexual Content Detection (Nội dung gợi dục)
-    sexual_keywords = [
+    "sexual_content": ([
         'địt', 'đụ', 'cặc', 'lồn', 'buồi', 'vú', 'mông', 'khỏa thân',
         'phim sex', 'phim người lớn', 'sex', 'porn', 'fuck', 'suck', 'lick'
-    ]
-
-    sexual_count = sum(1 for keyword in sexual_keywords if keyword in content_lower)
-    detection_results["sexual_content"] = min(sexual_count * 0.4, 1.0)
-
+    ], 0.4),
     # 3. Scam Detection (Lừa đảo)
-    scam_keywords = [
+    "scam": ([
         'chuyển khoản', 'gửi tiền', 'stk', 'số tài khoản', 'mật khẩu',
         'thông tin cá nhân', 'click vào link', 'trúng thưởng', 'giải thưởng',
         'khuyến mãi', 'giảm giá sốc', 'miễn phí', 'tặng quà'
-    ]
-
-    scam_count = sum(1 for keyword in scam_keywords if keyword in content_lower)
-    detection_results["scam"] = min(scam_count * 0.2, 1.0)
-
+    ], 0.2),
     # 4. Hate Speech Detection (Ngôn từ thù địch)
-    hate_keywords = [
+    "hate_speech": ([
         'phân biệt', 'kì thị', 'dân tộc', 'tôn giáo', 'chủng tộc',
         'ghét', 'khinh', 'xem thường', 'hạ đẳng', 'tồi tệ'
-    ]
-
-    hate_count = sum(1 for keyword in hate_keywords if keyword in content_lower)
-    detection_results["hate_speech"] = min(hate_count * 0.35, 1.0)
-
+    ], 0.35),
     # 5. Violence Detection (Bạo lực)
-    violence_keywords = [
+    "violence": ([
         'đánh nhau', 'giết', 'chém', 'đâm', 'bắn', 'đấm', 'đá',
         'hành hạ', 'tra tấn', 'tàn nhẫn', 'máu me', 'xác chết'
-    ]
+    ], 0.4)
+}
 
-    violence_count = sum(1 for keyword in violence_keywords if keyword in content_lower)
-    detection_results["violence"] = min(violence_count * 0.4, 1.0)
+def advanced_vietnamese_text_check(content: str):
+    """
+    Advanced Vietnamese text analysis with multiple detection layers
+    """
+    content_lower = content.lower()
 
-    # Calculate overall score
-    max_score = max(detection_results.values())
-    total_score = sum(detection_results.values()) / len(detection_results)
+    # Multi-layer detection system
+    detection_results = {}
+    for category, (keywords, weight) in CATEGORY_KEYWORDS.items():
+        count = sum(1 for keyword in keywords if keyword in content_lower)
+        detection_results[category] = min(count * weight, 1.0)
 
     # Determine primary category
     primary_category = max(detection_results.keys(), key=lambda k: detection_results[k])
 
-    # Classification logic
-    if max_score > 0.7:
-        label = "toxic"
-        confidence = max_score
-    elif total_score > 0.4:
-        label = "suspicious"
-        confidence = total_score
-    else:
-        label = "neutral"
-        confidence = 0.9
+    # Classification logic: ngưỡng của policy mặc định; profile của từng trẻ gán lại label bằng Policy.apply_text
+    label, confidence = default_policy.label_text(detection_results)
 
     return {
         "label": label,
@@ -117,37 +98,359 @@ def advanced_vietnamese_text_check(content: str):
         "analysis": "multi_layer_detection"
     }
 
-def check_text(content: str):
+# Cấu hình cascade: tầng từ khoá xử lý các trường hợp dễ, chỉ phần mơ hồ mới gọi transformer
+CASCADE_CONFIG = get_section("text_cascade", {
+    "enabled": True,
+    # Điểm danh mục cao nhất vượt ngưỡng này thì kết luận toxic ngay, không cần model
+    "flag_above": 0.7,
+    # Không trúng từ khoá nào và ngắn hơn số từ này thì kết luận neutral ngay
+    "clear_max_words": 8
+})
+
+# Thống kê theo tầng: số lần xử lý và tổng thời gian (giây)
+CASCADE_STATS = {tier: {"count": 0, "seconds": 0.0} for tier in ("known_hash", "lexical_clear", "lexical_flag", "model", "lexical_fallback", "lexical_shed")}
+_stats_lock = threading.Lock()
+
+def _record_tier(tier: str, started: float):
+    elapsed = time.perf_counter() - started
+    with _stats_lock:
+        CASCADE_STATS[tier]["count"] += 1
+        CASCADE_STATS[tier]["seconds"] += elapsed
+
+def get_cascade_stats():
+    """Tỉ lệ xử lý và độ trễ trung bình của từng tầng"""
+    with _stats_lock:
+        total = sum(stats["count"] for stats in CASCADE_STATS.values())
+        return {
+            tier: {
+                "count": stats["count"],
+                "hit_rate": stats["count"] / total if total else 0.0,
+                "avg_latency_ms": stats["seconds"] / stats["count"] * 1000 if stats["count"] else 0.0
+            }
+            for tier, stats in CASCADE_STATS.items()
+        }
+
+def lexical_prescreen(content: str):
     """
-    Check text content for toxicity
+    Tầng lọc nhanh dựa trên advanced_vietnamese_text_check.
+    Trả về kết quả nếu đủ chắc chắn, None nếu cần chuyển cho transformer.
+    """
+    result = advanced_vietnamese_text_check(content)
+    max_score = max(result["categories"].values())
+
+    if max_score > CASCADE_CONFIG["flag_above"]:
+        return dict(result, label="toxic", score=max_score)
+
+    if max_score == 0.0 and len(content.split()) <= CASCADE_CONFIG["clear_max_words"]:
+        return result
+
+    return None
+
+# Độ dài tối đa (token) model nhận cho một lần chạy
+MAX_LENGTH = 256
+
+# Chế độ văn bản dài: cửa sổ token chồng lấn nhau thay vì cắt bỏ phần sau 256 token
+WINDOW_OVERLAP = 64
+WINDOW_BATCH_SIZE = 8
+MAX_WINDOWS = 64
+
+_prefix_tokens = None
+
+# Batch theo độ dài token: mỗi bucket chỉ pad tới chuỗi dài nhất trong batch của nó
+LENGTH_BUCKETS = (16, 32, 64, 128, MAX_LENGTH)
+TEXT_BATCH_SIZE = 32
+TEXT_BATCH_WAIT = 0.005
+TOKEN_CACHE_SIZE = 4096
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_hits = 0
+_token_cache_misses = 0
+
+BATCHING_STATS = {"batches": 0, "real_tokens": 0, "padded_tokens": 0}
+
+def _is_toxic_output(decoded: str) -> bool:
+    # decoded có thể là "toxic" / "not_toxic" hoặc text mô tả
+    label = decoded.lower().strip()
+
+    # có thể thêm logic nếu decoded chứa từ "toxic" thì mark toxic, ngược lại neutral
+    return "toxic" in label or "hate" in label or "offensive" in label
+
+def _encode(text: str) -> list:
+    """Tokenize (có prefix) với cache LRU cho các chuỗi lặp lại"""
+    global _token_cache_hits, _token_cache_misses
+    with _token_cache_lock:
+        input_ids = _token_cache.get(text)
+        if input_ids is not None:
+            _token_cache.move_to_end(text)
+            _token_cache_hits += 1
+            return input_ids
+
+    input_ids = tokenizer(PREFIX_TOXIC + text, truncation=True, max_length=MAX_LENGTH)["input_ids"]
+
+    with _token_cache_lock:
+        _token_cache_misses += 1
+        _token_cache[text] = input_ids
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+    return input_ids
+
+def _bucket_of(length: int) -> int:
+    for bucket in LENGTH_BUCKETS:
+        if length <= bucket:
+            return bucket
+    return LENGTH_BUCKETS[-1]
+
+def plan_batches(lengths: list, batch_size: int = TEXT_BATCH_SIZE, bucketed: bool = True) -> list:
+    """
+    Chia chỉ số các chuỗi thành batch. Khi bucketed, chuỗi được nhóm theo bucket độ dài
+    và sắp xếp trong bucket để mỗi batch chỉ pad tới chuỗi dài nhất của chính nó.
+    """
+    if not bucketed:
+        order = list(range(len(lengths)))
+        return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+    buckets = {}
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        buckets.setdefault(_bucket_of(lengths[index]), []).append(index)
+
+    batches = []
+    for bucket in sorted(buckets):
+        indices = buckets[bucket]
+        batches.extend(indices[i:i + batch_size] for i in range(0, len(indices), batch_size))
+    return batches
+
+def classify_texts(texts: list, batch_size: int = TEXT_BATCH_SIZE, bucketed: bool = True) -> list:
+    """
+    Chạy model cho nhiều đoạn text, trả về list bool toxic cùng thứ tự.
+    Batch được tạo theo bucket độ dài token để giảm padding thừa.
+    """
+    encoded = [_encode(text) for text in texts]
+    flags = [False] * len(texts)
+
+    for batch in plan_batches([len(ids) for ids in encoded], batch_size, bucketed):
+        inputs = tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+
+        MODEL_BATCH_SIZE.observe(len(batch), model="text")
+        with MODEL_INFERENCE_SECONDS.time(model="text"), torch.no_grad():
+            outputs = model.generate(**inputs, max_length=10)  # output text nhỏ
+
+        real_tokens = sum(len(encoded[i]) for i in batch)
+        with _stats_lock:
+            BATCHING_STATS["batches"] += 1
+            BATCHING_STATS["real_tokens"] += real_tokens
+            BATCHING_STATS["padded_tokens"] += inputs["input_ids"].numel() - real_tokens
+
+        for index, decoded in zip(batch, tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+            flags[index] = _is_toxic_output(decoded)
+
+    return flags
+
+def get_batching_stats():
+    """Thống kê padding và cache tokenize của text model"""
+    with _stats_lock:
+        stats = dict(BATCHING_STATS)
+    total = stats["real_tokens"] + stats["padded_tokens"]
+    stats["padding_waste"] = stats["padded_tokens"] / total if total else 0.0
+    lookups = _token_cache_hits + _token_cache_misses
+    stats["token_cache_hits"] = _token_cache_hits
+    stats["token_cache_misses"] = _token_cache_misses
+    stats["token_cache_hit_rate"] = _token_cache_hits / lookups if lookups else 0.0
+    return stats
+
+# Gom các text từ nhiều request đồng thời vào chung batch (theo bucket độ dài)
+text_batcher = MicroBatcher(classify_texts, max_batch_size=TEXT_BATCH_SIZE, max_wait=TEXT_BATCH_WAIT, name="text-batcher")
+
+def split_windows(content: str):
+    """
+    Chia text thành các cửa sổ token chồng lấn nhau, trả về list (start_char, end_char).
+    Trả về một cửa sổ duy nhất nếu text vừa với model.
+    """
+    global _prefix_tokens
+    if _prefix_tokens is None:
+        _prefix_tokens = len(tokenizer(PREFIX_TOXIC, add_special_tokens=False)["input_ids"])
+
+    # Chừa chỗ cho prefix và token kết thúc
+    window_size = MAX_LENGTH - _prefix_tokens - 1
+
+    # Text ngắn (mỗi token ít nhất một ký tự) chắc chắn vừa một cửa sổ, khỏi tokenize thêm
+    if len(content) <= window_size:
+        return [(0, len(content))]
+
+    if tokenizer.is_fast:
+        offsets = tokenizer(content, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    else:
+        # Tokenizer chậm không có offset: xấp xỉ mỗi từ ~ 2 token
+        offsets = [match.span() for match in re.finditer(r"\S+", content)]
+        window_size //= 2
+
+    if len(offsets) <= window_size:
+        return [(0, len(content))]
+
+    step = window_size - WINDOW_OVERLAP
+    windows = []
+    for start in range(0, len(offsets), step):
+        end = min(start + window_size, len(offsets))
+        windows.append((offsets[start][0], offsets[end - 1][1]))
+        if end == len(offsets):
+            break
+
+    return windows
+
+def model_text_check(content: str):
+    """
+    Chạy ViHateT5 cho một đoạn text.
+    Text dài hơn giới hạn của model được chấm theo từng cửa sổ chồng lấn, theo batch,
+    và dừng sớm ngay khi một batch có cửa sổ toxic.
+    """
+    windows = split_windows(content)
+
+    if len(windows) == 1:
+        if text_batcher.submit(content).result():
+            return {"label": "toxic", "score": 0.9}
+        return {"label": "neutral", "score": 0.9}
+
+    # Giới hạn số cửa sổ để latency có trần với transcript rất dài
+    scored_windows = windows[:MAX_WINDOWS]
+    toxic_spans = []
+    scored = 0
+
+    for batch_start in range(0, len(scored_windows), WINDOW_BATCH_SIZE):
+        batch = scored_windows[batch_start:batch_start + WINDOW_BATCH_SIZE]
+        flags = classify_texts([content[start:end] for start, end in batch])
+        scored += len(batch)
+
+        toxic_spans.extend({"start": start, "end": end} for (start, end), toxic in zip(batch, flags) if toxic)
+        if toxic_spans:
+            break
+
+    result = {
+        "label": "toxic" if toxic_spans else "neutral",
+        "score": 0.9,
+        "mode": "sliding_window",
+        "windows": len(windows),
+        "scored_windows": scored
+    }
+    if toxic_spans:
+        result["spans"] = toxic_spans
+    if len(windows) > MAX_WINDOWS and not toxic_spans:
+        result["truncated"] = True
+
+    return result
+
+def _model_ready() -> bool:
+    return MODEL_AVAILABLE and model is not None and tokenizer is not None
+
+def _lexical_result(content: str, tier: str, started: float) -> dict:
+    result = advanced_vietnamese_text_check(content)
+    _record_tier(tier, started)
+    return dict(result, tier=tier)
+
+def _prescreen(content: str, use_model: bool, started: float):
+    """
+    Phần chung của check_text / check_texts / check_text_async trước model: trả về kết quả cuối
+    nếu không cần model (text rỗng, QoS tắt model, model không có, tầng từ khoá đủ chắc), None nếu cần model.
     """
     if not content or not content.strip():
         return {"label": "neutral", "score": 0.9}
 
-    # Try AI model first if available
-    if MODEL_AVAILABLE and model is not None and tokenizer is not None:
-        try:
-            # thêm prefix
-            input_text = PREFIX_TOXIC + content
-            inputs = tokenizer(input_text, return_tensors="pt", truncation=True, padding=True, max_length=256)
+    # Trùng digest trong danh sách hash của rules bundle: thiết bị trả toxic ngay, server cũng vậy
+    if rule_lists.known_text(content):
+        _record_tier("known_hash", started)
+        return {"label": "toxic", "score": 1.0, "tier": "known_hash"}
+
+    if not use_model:
+        return _lexical_result(content, "lexical_shed", started)
+
+    # Dùng bộ lọc từ khoá khi model không có
+    if not _model_ready():
+        return _lexical_result(content, "lexical_fallback", started)
+
+    # Tầng 1: lọc nhanh bằng từ khoá
+    if CASCADE_CONFIG["enabled"]:
+        result = lexical_prescreen(content)
+        if result is not None:
+            tier = "lexical_flag" if result["label"] == "toxic" else "lexical_clear"
+            _record_tier(tier, started)
+            return dict(result, tier=tier)
 
-            with torch.no_grad():
-                outputs = model.generate(**inputs, max_length=10)  # output text nhỏ
+    return None
+
+def _model_result(result: dict, started: float) -> dict:
+    _record_tier("model", started)
+    return dict(result, tier="model")
+
+def _model_failed(content: str, error: Exception, started: float) -> dict:
+    """Model lỗi: dùng kết quả của bộ lọc từ khoá"""
+    logger.error("AI text analysis failed: %s", error)
+    return _lexical_result(content, "lexical_fallback", started)
+
+def _model_check(content: str, started: float) -> dict:
+    # Tầng 2: transformer cho các trường hợp mơ hồ
+    try:
+        return _model_result(model_text_check(content), started)
+    except Exception as e:
+        return _model_failed(content, e, started)
+
+def check_text(content: str, use_model: bool = True):
+    """
+    Check text content for toxicity
+    `use_model=False` (QoS khi quá tải): chỉ dùng bộ lọc từ khoá, tier "lexical_shed".
+    """
+    started = time.perf_counter()
+    result = _prescreen(content, use_model, started)
+    if result is not None:
+        return result
+    return _model_check(content, started)
 
-            decoded = tokenizer.decode(outputs[0], skip_special_tokens=True)
-            # decoded có thể là "toxic" / "not_toxic" hoặc text mô tả
-            label = decoded.lower().strip()
+def check_texts(contents: list) -> list:
+    """
+    Phiên bản theo lô của check_text cho xử lý offline (bulk scan): tầng từ khoá chạy
+    từng text, các text còn lại vừa một cửa sổ được chạy model chung trong một lần
+    classify_texts (batch theo bucket độ dài) thay vì đi qua text_batcher từng cái.
+    """
+    results = [None] * len(contents)
+    pending = []
 
-            # có thể thêm logic nếu decoded chứa từ "toxic" thì mark toxic, ngược lại neutral
-            if "toxic" in label or "hate" in label or "offensive" in label:
-                return {"label": "toxic", "score": 0.9}
+    for index, content in enumerate(contents):
+        started = time.perf_counter()
+        results[index] = _prescreen(content, True, started)
+        if results[index] is None:
+            if len(split_windows(content)) > 1:
+                results[index] = _model_check(content, started)
             else:
-                return {"label": "neutral", "score": 0.9}
+                pending.append(index)
 
+    if pending:
+        started = time.perf_counter()
+        try:
+            flags = classify_texts([contents[index] for index in pending])
         except Exception as e:
-            print(f"[ERROR] AI text analysis failed: {e}")
-            # Fallback to advanced analysis
-            return advanced_vietnamese_text_check(content)
-    else:
-        # Use advanced analysis when model not available
-        return advanced_vietnamese_text_check(content)
+            for index in pending:
+                results[index] = _model_failed(contents[index], e, started)
+        else:
+            for index, toxic in zip(pending, flags):
+                results[index] = _model_result({"label": "toxic" if toxic else "neutral", "score": 0.9}, started)
+
+    return results
+
+async def check_text_async(content: str, use_model: bool = True):
+    """
+    Phiên bản async của check_text cho luồng stream (WebSocket): tầng từ khoá chạy ngay
+    trên event loop, tin một cửa sổ chờ text_batcher mà không chiếm thread nào.
+    Text dài (nhiều cửa sổ) vẫn chạy model trong thread.
+    """
+    started = time.perf_counter()
+    result = _prescreen(content, use_model, started)
+    if result is not None:
+        return result
+
+    if len(split_windows(content)) > 1:
+        return await asyncio.get_running_loop().run_in_executor(None, _model_check, content, started)
+
+    try:
+        toxic = await text_batcher.run(content)
+    except Exception as e:
+        return _model_failed(content, e, started)
+    return _model_result({"label": "toxic" if toxic else "neutral", "score": 0.9}, started)
@@ -0,0 +1,65 @@
+import time
+import cv2
+from src.filters.image_filter import check_image
+from src.utils.media import VideoDecoder
+from src.utils.policy import Policy, default_policy
+from src.utils.tracing import current_span
+
+# Số frame bị đánh dấu tối đa gửi kèm mỗi lần báo tiến độ
+PROGRESS_DETAILS_LIMIT = 20
+PROGRESS_INTERVAL = 0.5
+
+def scan_video_frames(video: VideoDecoder, sample_rate: int = 30, on_progress=None, policy: Policy = default_policy):
+    """
+    Quét các frame được lấy mẫu (chạy đồng bộ, nên gọi trong thread).
+    `on_progress(progress)` được gọi sau mỗi frame được phân tích.
+    Frame bị đánh dấu theo `policy.alerts_image`.
+    """
+    analyzed_frames = 0
+    suspicious_frames = []
+    last_report = 0.0
+    # Tách thời gian decode frame và thời gian model để biết chỗ chậm
+    decode_seconds = 0.0
+    classify_seconds = 0.0
+    step_started = time.perf_counter()
+
+    for frame_index, frame in video.sampled_frames(sample_rate):
+        analyzed_frames += 1
+
+        # OpenCV trả về BGR, chuyển sang RGB và phân tích trực tiếp trong bộ nhớ
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        classify_started = time.perf_counter()
+        decode_seconds += classify_started - step_started
+
+        # Analyze frame
+        result = check_image(rgb_frame)
+        step_started = time.perf_counter()
+        classify_seconds += step_started - classify_started
+
+        if policy.alerts_image(result):
+            suspicious_frames.append({
+                "frame": frame_index,
+                "timestamp": frame_index / video.fps if video.fps else 0.0,
+                "result": result
+            })
+
+        # Báo tiến độ tối đa mỗi PROGRESS_INTERVAL giây
+        if on_progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            on_progress({
+                "frames_analyzed": analyzed_frames,
+                "frames_expected": video.frame_count // sample_rate,
+                "suspicious_frames": len(suspicious_frames),
+                "details": suspicious_frames[-PROGRESS_DETAILS_LIMIT:]
+            })
+
+    frames_span = current_span()
+    if frames_span is not None:
+        frames_span.set(frames=analyzed_frames, decode_seconds=decode_seconds, classify_seconds=classify_seconds)
+
+    return {
+        "total_frames": video.frame_count,
+        "analyzed_frames": analyzed_frames,
+        "suspicious_frames": len(suspicious_frames),
+        "details": suspicious_frames
+    }
@@ -0,0 +1,82 @@
+import hmac
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from typing import Optional
+from src.utils import tracing
+from src.utils.config import get_section
+from src.utils.profiler import profiler
+from src.utils.qos import qos
+
+ADMIN_CONFIG = get_section("admin", {
+    # Để trống thì các endpoint admin bị tắt
+    "token": "",
+    "max_profile_seconds": 120
+})
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_CONFIG["token"]:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (admin.token is not configured)")
+    # So sánh thời gian hằng để không lộ token qua thời gian phản hồi
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_CONFIG["token"].encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+class TracingInput(BaseModel):
+    enabled: bool
+
+class QosInput(BaseModel):
+    # None = trả về điều khiển tự động
+    level: Optional[int] = None
+
+class ProfileInput(BaseModel):
+    seconds: float = 10.0
+    interval_ms: float = 10.0
+
+@router.get("/admin/tracing")
+async def get_tracing():
+    return tracing.exporter.get_stats()
+
+@router.post("/admin/tracing")
+async def set_tracing(data: TracingInput):
+    """Bật/tắt tracing lúc đang chạy, không cần restart"""
+    tracing.set_enabled(data.enabled)
+    return tracing.exporter.get_stats()
+
+@router.get("/admin/qos")
+async def get_qos():
+    return qos.get_stats()
+
+@router.post("/admin/qos")
+async def pin_qos(data: QosInput):
+    """Cố định mức QoS (vd. trước một đợt tải đã biết), level null để trả về tự động"""
+    try:
+        qos.pin(data.level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return qos.get_stats()
+
+@router.post("/admin/profile")
+async def start_profile(data: ProfileInput):
+    """Lấy mẫu stack của mọi thread trong `seconds` giây, kết quả ghi ra file .folded"""
+    if not 0 < data.seconds <= ADMIN_CONFIG["max_profile_seconds"]:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {ADMIN_CONFIG['max_profile_seconds']}]")
+    if data.interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+
+    try:
+        return profiler.start(data.seconds, data.interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/admin/profile")
+async def profile_status():
+    return {"current": profiler.status(), "profiles": profiler.list_profiles()}
+
+@router.get("/admin/profiles/{name}")
+async def download_profile(name: str):
+    if name not in profiler.list_profiles():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(os.path.join(profiler.output_dir, name), media_type="text/plain", filename=name)
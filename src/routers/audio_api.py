@@ -1,87 +1,44 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import speech_recognition as sr
+import logging
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 import tempfile
 import os
 import uuid
-from pydub import AudioSegment
-from src.filters.text_filter import check_text
+from src.filters.audio_filter import analyze_speech
+from src.utils.media import decode_audio_pcm, download_to_file, remove_temp_file
 from src.utils.logger import log_alert
 import asyncio
 from src.utils.notifier import notify_parent
+from src.utils.policy import SPEECH_ALERT_LABELS, Policy, default_policy, policy_store
+from src.utils.scheduler import scheduler, client_id
+from src.utils.tracing import span, bind
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def convert_audio_to_wav(audio_path: str, output_path: str):
+def analyze_audio_content(audio_path: str, recognizer=None, on_partial=None):
     """
-    Convert audio file to WAV format for better recognition
+    Analyze audio content for inappropriate speech.
+    Audio được decode thẳng ra PCM 16 kHz mono trong bộ nhớ, tách theo khoảng lặng
+    và nhận dạng song song từng đoạn, dừng sớm khi phát hiện lời nói độc hại.
     """
     try:
-        audio = AudioSegment.from_file(audio_path)
-        audio.export(output_path, format="wav")
-        return True
-    except Exception as e:
-        print(f"[ERROR] Audio conversion failed: {e}")
-        return False
+        with span("decode_audio"):
+            audio = decode_audio_pcm(audio_path)
+        with span("analyze_speech") as speech_span:
+            result = analyze_speech(audio, recognizer=recognizer, on_partial=on_partial)
+            if speech_span is not None:
+                speech_span.set(segments=result.get("segments", 0), early_exit=result.get("early_exit", False))
+
+        if result["transcription"]:
+            logger.debug("Recognized text: %s", result["transcription"])
+        else:
+            logger.debug("Could not understand audio")
 
-def analyze_audio_content(audio_path: str):
-    """
-    Analyze audio content for inappropriate speech
-    """
-    try:
-        # Initialize recognizer
-        recognizer = sr.Recognizer()
-
-        # Convert to WAV if needed
-        if not audio_path.endswith('.wav'):
-            wav_path = audio_path.replace(os.path.splitext(audio_path)[1], '.wav')
-            if convert_audio_to_wav(audio_path, wav_path):
-                audio_path = wav_path
-
-        # Load audio file
-        with sr.AudioFile(audio_path) as source:
-            # Record audio
-            audio_data = recognizer.record(source)
-
-            # Try to recognize speech
-            try:
-                text = recognizer.recognize_google(audio_data, language='vi-VN')
-                print(f"[AUDIO] Recognized text: {text}")
-
-                # Analyze recognized text
-                if text.strip():
-                    result = check_text(text)
-                    return {
-                        "transcription": text,
-                        "analysis": result,
-                        "has_speech": True
-                    }
-                else:
-                    return {
-                        "transcription": "",
-                        "analysis": {"label": "neutral", "score": 0.9},
-                        "has_speech": False
-                    }
-
-            except sr.UnknownValueError:
-                print("[AUDIO] Could not understand audio")
-                return {
-                    "transcription": "",
-                    "analysis": {"label": "neutral", "score": 0.9},
-                    "has_speech": False,
-                    "error": "Could not understand audio"
-                }
-
-            except sr.RequestError as e:
-                print(f"[AUDIO] Recognition service error: {e}")
-                return {
-                    "transcription": "",
-                    "analysis": {"label": "neutral", "score": 0.9},
-                    "has_speech": False,
-                    "error": f"Recognition service error: {e}"
-                }
+        return result
 
     except Exception as e:
-        print(f"[ERROR] Audio analysis failed: {e}")
+        logger.error("Audio analysis failed: %s", e)
         return {
             "transcription": "",
             "analysis": {"label": "neutral", "score": 0.9},
@@ -89,8 +46,44 @@ def analyze_audio_content(audio_path: str):
             "error": str(e)
         }
 
+async def analyze_audio_file(audio_path: str, filename: str, on_progress=None, policy: Policy = default_policy):
+    """
+    Phân tích một file audio đã có trên đĩa, log và thông báo nếu đáng ngờ.
+    `on_progress(progress)` được gọi mỗi khi nhận dạng xong một đoạn.
+    """
+    on_partial = None
+    if on_progress:
+        recognized = []
+
+        def on_partial(index, text, analysis):
+            recognized.append(index)
+            on_progress({"segments_recognized": len(recognized), "last_segment": index, "last_label": analysis["label"]})
+
+    # Analyze audio (chạy trong thread để không chặn event loop)
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, bind(analyze_audio_content, audio_path, on_partial=on_partial))
+
+    # Determine if content is suspicious (ngưỡng text theo profile)
+    result["analysis"] = policy.apply_text(result["analysis"])
+    is_suspicious = result["analysis"]["label"].lower() in SPEECH_ALERT_LABELS
+
+    # Add metadata
+    result.update({
+        "filename": filename,
+        "label": "suspicious" if is_suspicious else "safe",
+        "score": result["analysis"]["score"],
+        "policy": policy.name
+    })
+
+    # Log and notify if suspicious content detected
+    if is_suspicious:
+        await log_alert("AUDIO", filename, result)
+        notify_parent("AUDIO", filename, result)
+
+    return result
+
 @router.post("/check_audio")
-async def check_audio_api(file: UploadFile = File(...)):
+async def check_audio_api(request: Request, file: UploadFile = File(...)):
     """
     Check uploaded audio for inappropriate speech content
     """
@@ -110,44 +103,25 @@ async def check_audio_api(file: UploadFile = File(...)):
 
     try:
         # Save uploaded file to temp location
-        with open(temp_name, "wb") as buffer:
+        with span("save_upload"), open(temp_name, "wb") as buffer:
             content = await file.read()
             buffer.write(content)
 
-        # Analyze audio
-        result = analyze_audio_content(temp_name)
-
-        # Determine if content is suspicious
-        is_suspicious = result["analysis"]["label"].lower() in ["toxic", "suspicious"]
-
-        # Add metadata
-        result.update({
-            "filename": filename,
-            "label": "suspicious" if is_suspicious else "safe",
-            "score": result["analysis"]["score"]
-        })
-
-        # Log and notify if suspicious content detected
-        if is_suspicious:
-            await log_alert("AUDIO", filename, result)
-            notify_parent("AUDIO", filename, result)
-
-        return result
+        async with scheduler.slot("media", client_id(request)):
+            return await analyze_audio_file(temp_name, filename, policy=policy_store.for_connection(request))
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[ERROR] Audio processing failed: {e}")
+        logger.error("Audio processing failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Audio processing failed: {str(e)}")
 
     finally:
         # Clean up temp file
-        try:
-            if os.path.exists(temp_name):
-                os.remove(temp_name)
-        except Exception as e:
-            print(f"[WARNING] Failed to clean up temp file {temp_name}: {e}")
+        remove_temp_file(temp_name)
 
 @router.post("/check_audio_url")
-async def check_audio_url_api(url: dict):
+async def check_audio_url_api(url: dict, request: Request):
     """
     Check audio from URL for inappropriate content
     """
@@ -156,32 +130,32 @@ async def check_audio_url_api(url: dict):
     if not audio_url:
         raise HTTPException(status_code=400, detail="URL is required")
 
-    try:
-        # Download audio temporarily
-        import requests
-        response = requests.get(audio_url, stream=True)
-        response.raise_for_status()
-
-        # Get file extension from URL or default to mp3
-        file_extension = os.path.splitext(audio_url)[1] or '.mp3'
-
-        # Create temp file
-        temp_dir = "temp"
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_name = os.path.join(temp_dir, f"{uuid.uuid4()}{file_extension}")
+    # Get file extension from URL or default to mp3
+    file_extension = os.path.splitext(audio_url)[1] or '.mp3'
 
-        with open(temp_name, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+    # Create temp file
+    temp_dir = "temp"
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_name = os.path.join(temp_dir, f"{uuid.uuid4()}{file_extension}")
 
-        # Analyze audio
-        result = await check_audio_api(UploadFile(filename="url_audio" + file_extension, file=open(temp_name, "rb")))
+    try:
+        async with scheduler.slot("media", client_id(request)):
+            # Download audio temporarily
+            # Tải trong thread, không chặn event loop trong lúc chờ mạng / ghi file
+            with span("download"):
+                await asyncio.get_running_loop().run_in_executor(None, bind(download_to_file, audio_url, temp_name))
 
-        return result
+            # Analyze audio trực tiếp từ file đã tải, không copy lại lần nữa
+            return await analyze_audio_file(temp_name, "url_audio" + file_extension, policy=policy_store.for_connection(request))
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"URL audio processing failed: {str(e)}")
 
+    finally:
+        remove_temp_file(temp_name)
+
 @router.post("/check_microphone")
 async def check_microphone_api(data: dict):
     """
@@ -1,54 +1,185 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from src.filters.image_filter import check_image
+import logging
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from typing import List
+from src.filters.image_filter import MODEL_INPUT_SIZE, decode_images, image_batcher
 from src.utils.logger import log_alert
 import asyncio
 from src.utils.notifier import notify_parent
-import shutil, os, uuid, tempfile
+from src.utils.policy import policy_store
+from src.utils.qos import qos
+from src.utils.rules_bundle import rule_lists
+from src.utils.scheduler import scheduler, client_id
+from src.utils.singleflight import singleflight, content_key
+from src.utils.tracing import span, bind
+import io, zipfile
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+# Số ảnh tối đa cho một request batch (album chat thường 10–50 ảnh)
+MAX_BATCH_IMAGES = 100
+# Giới hạn kích thước sau giải nén của ảnh trong zip (chống zip bomb): mỗi ảnh / tổng cả request
+MAX_ZIP_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_ZIP_TOTAL_BYTES = 200 * 1024 * 1024
+
+async def analyze_images(sources: list, image_size: int = MODEL_INPUT_SIZE):
+    """
+    Decode song song trong thread pool rồi đưa từng ảnh vào image_batcher,
+    để ảnh của request này chạy chung forward pass với các request khác.
+    `image_size` nhỏ hơn kích thước model (QoS khi quá tải) thì JPEG được decode thu nhỏ hơn nữa.
+    Ảnh trùng digest trong danh sách hash của rules bundle được đánh dấu như trên thiết bị, không chạy model.
+    """
+    results = [{"label": "nsfw", "score": 1.0, "tier": "known_hash"} if rule_lists.known_image(source) else None
+               for source in sources]
+    pending = [index for index, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    loop = asyncio.get_running_loop()
+    with span("decode_images", images=len(pending), image_size=image_size):
+        decoded = await loop.run_in_executor(None, bind(decode_images, [sources[index] for index in pending], image_size))
+
+    async def _classify(item):
+        image, error = item
+        if image is None:
+            return {"label": "error", "score": 0.0, "error": error}
+        return await image_batcher.run(image)
+
+    with span("classify_images"):
+        classified = await asyncio.gather(*(_classify(item) for item in decoded))
+    for index, result in zip(pending, classified):
+        results[index] = result
+    return results
+
+async def analyze_image(content: bytes, image_size: int = MODEL_INPUT_SIZE):
+    return (await analyze_images([content], image_size))[0]
+
+def extract_zip_images(filename: str, content: bytes, max_images: int = MAX_BATCH_IMAGES,
+                       max_total_bytes: int = MAX_ZIP_TOTAL_BYTES):
+    """
+    Lấy các file ảnh trong file zip (đọc trong bộ nhớ).
+    Số ảnh và kích thước khai báo trong zip được kiểm tra trước khi giải nén (zipfile không
+    giải nén quá file_size khai báo); vượt giới hạn -> ValueError. `max_images` / `max_total_bytes`
+    là phần còn lại của request (đã trừ ảnh của các file trước), thông báo lỗi ghi đúng giới hạn đó.
+    """
+    entries = []
+    total_bytes = 0
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if len(entries) >= max_images:
+                raise ValueError(f"Too many images in {filename} (max {max_images})")
+            if info.file_size > MAX_ZIP_IMAGE_BYTES:
+                raise ValueError(f"Image too large in {filename}: {info.filename}")
+            total_bytes += info.file_size
+            if total_bytes > max_total_bytes:
+                limit = (f"{max_total_bytes // (1024 * 1024)}MB" if max_total_bytes >= 1024 * 1024
+                         else f"{max_total_bytes // 1024}KB")
+                raise ValueError(f"Zip content too large in {filename} (max {limit})")
+            entries.append(info)
+
+        return [(f"{filename}/{info.filename}", archive.read(info)) for info in entries]
+
 @router.post("/check_image")
-async def check_image_api(file: UploadFile = File(...)):
+async def check_image_api(request: Request, file: UploadFile = File(...)):
     """
     Check uploaded image for inappropriate content
     """
     filename = file.filename or "unknown"
 
     # Validate file type
-    if not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
+    if not filename.lower().endswith(IMAGE_EXTENSIONS):
         raise HTTPException(status_code=400, detail="Invalid file type. Only image files are allowed.")
 
-    # Create temp directory if it doesn't exist
-    temp_dir = "temp"
-    os.makedirs(temp_dir, exist_ok=True)
-
-    # Generate unique temp file path
-    file_extension = os.path.splitext(filename)[1]
-    temp_name = os.path.join(temp_dir, f"{uuid.uuid4()}{file_extension}")
-
     try:
-        # Save uploaded file to temp location
-        with open(temp_name, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Check image content
-        result = check_image(temp_name)
+        # Đọc ảnh vào bộ nhớ và phân tích trực tiếp, không ghi file tạm
+        with span("read_upload"):
+            content = await file.read()
+        policy = policy_store.for_connection(request)
+        # Chỉ lần phân tích thật chiếm slot; request trùng ảnh chờ kết quả mà không giữ slot
+        scheduler.check_rate("image", client_id(request))
+        settings = qos.current()
+        size = settings["image_size"]
+        result = await singleflight.do(content_key(f"image:{size}", content), scheduler.run, "image", analyze_image, content, size)
 
         # Log and notify if unsafe content detected
-        if result.get("label", "").lower() in ["nsfw", "porn", "unsafe", "suspicious"]:
+        if policy.alerts_image(result):
             await log_alert("IMAGE", filename, result)
             notify_parent("IMAGE", filename, result)
 
-        return {"filename": filename, "result": result}
+        return {"filename": filename, "result": result, "fidelity": qos.fidelity(settings), "policy": policy.name}
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[ERROR] Image processing failed: {e}")
+        logger.error("Image processing failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Image processing failed: {str(e)}")
 
-    finally:
-        # Clean up temp file
-        try:
-            if os.path.exists(temp_name):
-                os.remove(temp_name)
-        except Exception as e:
-            print(f"[WARNING] Failed to clean up temp file {temp_name}: {e}")
+@router.post("/check_images")
+async def check_images_api(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Check multiple images (multipart list and/or zip archives) in one request
+    """
+    images = []
+    zip_bytes = 0
+
+    for file in files:
+        filename = file.filename or "unknown"
+        with span("read_upload"):
+            content = await file.read()
+
+        if filename.lower().endswith(".zip"):
+            try:
+                extracted = extract_zip_images(
+                    filename, content, MAX_BATCH_IMAGES - len(images), MAX_ZIP_TOTAL_BYTES - zip_bytes
+                )
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"Invalid zip archive: {filename}")
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            images.extend(extracted)
+            zip_bytes += sum(len(data) for _, data in extracted)
+        elif filename.lower().endswith(IMAGE_EXTENSIONS):
+            images.append((filename, content))
+        else:
+            raise HTTPException(status_code=400, detail=f"Invalid file type: {filename}. Only image or zip files are allowed.")
+
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in request")
+
+    if len(images) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Too many images (max {MAX_BATCH_IMAGES})")
+
+    try:
+        # Mỗi ảnh tính một token rate limit
+        async with scheduler.slot("image", client_id(request), cost=len(images)):
+            settings = qos.current()
+            results = await analyze_images([content for _, content in images], settings["image_size"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Batch image processing failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Batch image processing failed: {str(e)}")
+
+    policy = policy_store.for_connection(request)
+    flagged = 0
+    for (filename, _), result in zip(images, results):
+        if policy.alerts_image(result):
+            flagged += 1
+            await log_alert("IMAGE", filename, result)
+            notify_parent("IMAGE", filename, result)
+
+    return {
+        "total": len(images),
+        "flagged": flagged,
+        "fidelity": qos.fidelity(settings),
+        "policy": policy.name,
+        "results": [
+            {"filename": filename, "result": result}
+            for (filename, _), result in zip(images, results)
+        ]
+    }
@@ -0,0 +1,135 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+import asyncio
+import os
+import uuid
+from src.routers.video_api import analyze_video_file
+from src.routers.audio_api import analyze_audio_file
+from src.utils.jobs import job_manager, JOBS_DIR
+from src.utils.media import download_to_file, remove_temp_file
+from src.utils.policy import policy_store
+from src.utils.scheduler import scheduler, client_id
+
+router = APIRouter()
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.wmv')
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac', '.ogg', '.aac')
+
+async def fetch_source(job: dict, default_extension: str):
+    """
+    Trả về (path, downloaded): file upload đã nằm sẵn trong JOBS_DIR,
+    còn job từ URL thì tải về file tạm trong worker.
+    """
+    source = job["source"]
+    if not source.startswith(("http://", "https://")):
+        return source, False
+
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    extension = os.path.splitext(source)[1] or default_extension
+    path = os.path.join(JOBS_DIR, f"{uuid.uuid4()}{extension}")
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, download_to_file, source, path)
+    return path, True
+
+def job_device(request: Request):
+    """Thiết bị có profile gửi job (None = policy mặc định), lưu vào job để chạy với đúng profile"""
+    return policy_store.for_connection(request).profile
+
+async def run_video_job(job: dict, report_progress):
+    path, downloaded = await fetch_source(job, ".mp4")
+    try:
+        # Job nền dùng chung slot lớp media với request đồng bộ, không có deadline và rate limit
+        async with scheduler.slot("media", deadline=0):
+            return await analyze_video_file(path, job["filename"], on_progress=report_progress, policy=policy_store.get(job["device_id"]))
+    finally:
+        if downloaded:
+            remove_temp_file(path)
+
+async def run_audio_job(job: dict, report_progress):
+    path, downloaded = await fetch_source(job, ".mp3")
+    try:
+        async with scheduler.slot("media", deadline=0):
+            return await analyze_audio_file(path, job["filename"], on_progress=report_progress, policy=policy_store.get(job["device_id"]))
+    finally:
+        if downloaded:
+            remove_temp_file(path)
+
+job_manager.register("video", run_video_job)
+job_manager.register("audio", run_audio_job)
+
+async def save_upload(file: UploadFile, extensions: tuple, kind: str):
+    filename = file.filename or "unknown"
+
+    # Validate file type
+    if not filename.lower().endswith(extensions):
+        raise HTTPException(status_code=400, detail=f"Invalid file type. Only {kind} files are allowed.")
+
+    # File được giữ tới khi job xong để có thể chạy lại sau khi restart
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = os.path.join(JOBS_DIR, f"{uuid.uuid4()}{os.path.splitext(filename)[1]}")
+    with open(path, "wb") as buffer:
+        while chunk := await file.read(1024 * 1024):
+            buffer.write(chunk)
+
+    return filename, path
+
+@router.post("/jobs/video")
+async def submit_video_job(request: Request, file: UploadFile = File(...)):
+    """
+    Submit a video for background analysis; returns a job ID immediately
+    """
+    scheduler.check_rate("media", client_id(request))
+    filename, path = await save_upload(file, VIDEO_EXTENSIONS, "video")
+    job_id = await job_manager.submit("video", filename, path, job_device(request))
+    return {"job_id": job_id, "status": "queued"}
+
+@router.post("/jobs/video_url")
+async def submit_video_url_job(url: dict, request: Request):
+    """
+    Submit a video URL for background analysis
+    """
+    scheduler.check_rate("media", client_id(request))
+    video_url = url.get("url")
+
+    if not video_url:
+        raise HTTPException(status_code=400, detail="URL is required")
+
+    job_id = await job_manager.submit("video", "url_video.mp4", video_url, job_device(request))
+    return {"job_id": job_id, "status": "queued"}
+
+@router.post("/jobs/audio")
+async def submit_audio_job(request: Request, file: UploadFile = File(...)):
+    """
+    Submit an audio file for background analysis
+    """
+    scheduler.check_rate("media", client_id(request))
+    filename, path = await save_upload(file, AUDIO_EXTENSIONS, "audio")
+    job_id = await job_manager.submit("audio", filename, path, job_device(request))
+    return {"job_id": job_id, "status": "queued"}
+
+@router.post("/jobs/audio_url")
+async def submit_audio_url_job(url: dict, request: Request):
+    """
+    Submit an audio URL for background analysis
+    """
+    scheduler.check_rate("media", client_id(request))
+    audio_url = url.get("url")
+
+    if not audio_url:
+        raise HTTPException(status_code=400, detail="URL is required")
+
+    extension = os.path.splitext(audio_url)[1] or ".mp3"
+    job_id = await job_manager.submit("audio", "url_audio" + extension, audio_url, job_device(request))
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Poll job status, progress (frames analyzed, partial suspicious frames) and result
+    """
+    job = await job_manager.get(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    return job
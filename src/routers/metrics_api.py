@@ -0,0 +1,104 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from src.filters.text_filter import text_batcher, get_batching_stats, get_cascade_stats
+from src.filters.conversation_filter import moderator
+from src.filters.image_filter import image_batcher
+from src.routers.rules_api import rules_bundle
+from src.routers.websocket_router import get_connection_count
+from src.utils.jobs import job_manager
+from src.utils.metrics import CallbackGauge, render_metrics
+from src.utils.notifier import dispatcher
+from src.utils.qos import qos
+from src.utils.response_cache import response_cache
+from src.utils.scheduler import scheduler
+from src.utils.singleflight import singleflight
+
+router = APIRouter()
+
+# Các giá trị đã có sẵn ở từng module được đọc lúc scrape, không tốn gì trên đường xử lý request
+CallbackGauge(
+    "aicp_queue_depth", "Items waiting in background queues",
+    lambda: {
+        ("image_batcher",): image_batcher.qsize(),
+        ("text_batcher",): text_batcher.qsize(),
+        ("notifier",): dispatcher.qsize(),
+        ("jobs",): job_manager.qsize()
+    },
+    ("queue",)
+)
+CallbackGauge(
+    "aicp_singleflight_in_flight", "Distinct checks currently in flight",
+    lambda: singleflight.get_stats()["in_flight"]
+)
+CallbackGauge(
+    "aicp_singleflight_calls_total", "Checks executed vs coalesced onto an in-flight call",
+    lambda: {("executed",): singleflight.executed, ("coalesced",): singleflight.coalesced},
+    ("outcome",), type="counter"
+)
+CallbackGauge(
+    "aicp_token_cache_lookups_total", "Text tokenizer cache lookups",
+    lambda: {
+        ("hit",): get_batching_stats()["token_cache_hits"],
+        ("miss",): get_batching_stats()["token_cache_misses"]
+    },
+    ("result",), type="counter"
+)
+CallbackGauge(
+    "aicp_text_cascade_total", "Texts decided by each cascade tier",
+    lambda: {(tier,): stats["count"] for tier, stats in get_cascade_stats().items()},
+    ("tier",), type="counter"
+)
+CallbackGauge(
+    "aicp_websocket_connections", "Open WebSocket connections",
+    get_connection_count
+)
+CallbackGauge(
+    "aicp_chat_conversations", "Conversations with moderation context held in memory",
+    moderator.conversation_count
+)
+
+CallbackGauge(
+    "aicp_response_cache_requests_total", "Dashboard response cache lookups (not_modified counts 304s among hits and misses)",
+    lambda: {
+        ("hit",): response_cache.hits,
+        ("miss",): response_cache.misses,
+        ("not_modified",): response_cache.not_modified
+    },
+    ("result",), type="counter"
+)
+
+CallbackGauge(
+    "aicp_scheduler_queued", "Analysis requests waiting for a scheduler slot",
+    lambda: {(name,): len(work_class.waiters) for name, work_class in scheduler.classes.items()},
+    ("class",)
+)
+CallbackGauge(
+    "aicp_scheduler_in_flight", "Analysis requests holding a scheduler slot",
+    lambda: {(name,): work_class.in_flight for name, work_class in scheduler.classes.items()},
+    ("class",)
+)
+CallbackGauge(
+    "aicp_scheduler_admitted_total", "Analysis requests admitted by the scheduler",
+    lambda: {(name,): work_class.admitted for name, work_class in scheduler.classes.items()},
+    ("class",), type="counter"
+)
+
+CallbackGauge(
+    "aicp_rules_bundle_requests_total", "Mobile rules bundle requests by response type",
+    lambda: {(kind,): count for kind, count in rules_bundle.served.items()},
+    ("response",), type="counter"
+)
+
+CallbackGauge(
+    "aicp_qos_level", "Effective analysis fidelity level (0 = full)",
+    lambda: qos.current()["level"]
+)
+CallbackGauge(
+    "aicp_qos_level_changes_total", "Automatic QoS level changes",
+    lambda: qos.changes, type="counter"
+)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
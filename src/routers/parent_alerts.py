@@ -1,46 +1,64 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from src.utils.database import get_db, Alert
-import json, os
+import logging
+import datetime
+from fastapi import APIRouter, HTTPException, Request
+from src.utils.alert_store import alert_store
+from src.utils.logger import read_json_alerts
+from src.utils.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_alerts_from_db(db: Session, limit: int):
-    """Get alerts from database"""
+async def get_alerts_from_db(limit: int, since: datetime.datetime = None, until: datetime.datetime = None, alert_type: str = None):
+    """Get alerts from database (chỉ đọc các partition trong khoảng thời gian, từ replica nếu có)"""
     try:
-        alerts = db.query(Alert).order_by(Alert.time.desc()).limit(limit).all()
-        return [alert.__dict__ for alert in alerts]
+        return await alert_store.recent_alerts_async(limit, since=since, until=until, alert_type=alert_type)
     except Exception as e:
-        print(f"[DB READ ERROR] {e}")
-        return []
+        logger.error("DB read failed: %s", e)
+        return None
 
-def get_alerts_from_json(limit: int):
-    """Get alerts from JSON file as fallback"""
+def get_alerts_from_json(limit: int, since: datetime.datetime = None, until: datetime.datetime = None, alert_type: str = None):
+    """Get alerts from JSON file as fallback (cùng bộ lọc với DB)"""
     try:
-        file_path = "logs/alerts.json"
-        if not os.path.exists(file_path):
-            return []
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()[-limit:]  # lấy log mới nhất
-            return [json.loads(line) for line in lines]
+        return read_json_alerts(since, until, alert_type)[-limit:]  # lấy log mới nhất
     except Exception as e:
-        print(f"[JSON READ ERROR] {e}")
+        logger.error("JSON read failed: %s", e)
         return []
 
-@router.get("/alerts")
-async def get_alerts(limit: int = 20, db: Session = Depends(get_db)):
+async def load_alerts(limit: int, since: datetime.datetime = None, until: datetime.datetime = None, alert_type: str = None):
     """
     Get alerts with hybrid approach: Try DB first, fallback to JSON
     """
     # Try database first
-    db_alerts = get_alerts_from_db(db, limit)
+    db_alerts = await get_alerts_from_db(limit, since, until, alert_type)
 
-    # If no DB alerts, try JSON fallback
-    if not db_alerts:
-        json_alerts = get_alerts_from_json(limit)
+    # Chỉ dùng JSON khi đọc DB lỗi; DB trả rỗng (không có alert khớp bộ lọc) là kết quả hợp lệ
+    if db_alerts is None:
+        json_alerts = get_alerts_from_json(limit, since, until, alert_type)
         if json_alerts:
-            print(f"[JSON FALLBACK] Serving {len(json_alerts)} alerts from JSON file")
+            logger.info("JSON fallback: serving %d alerts from JSON file", len(json_alerts))
         return json_alerts
 
     return db_alerts
+
+@router.get("/alerts")
+async def get_alerts(request: Request, limit: int = 20, since: datetime.datetime = None, until: datetime.datetime = None, type: str = None):
+    """
+    `since` / `until` (ISO, UTC) và `type` lọc alert; chỉ các partition giao với khoảng thời gian được đọc.
+    Response được cache tới khi có alert mới (ETag / If-None-Match -> 304).
+    """
+    return await response_cache.respond(request, lambda: load_alerts(limit, since, until, type))
+
+@router.get("/alerts/{alert_id}/details")
+async def get_alert_details(alert_id: str):
+    """
+    Chi tiết lớn của alert (vd. danh sách frame video bị đánh dấu), không trả kèm trong /alerts.
+    `result.details_count` cho biết alert có chi tiết hay không.
+    """
+    try:
+        details = await alert_store.alert_details_async(alert_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if details is None:
+        raise HTTPException(status_code=404, detail="Alert details not found")
+    return details
@@ -0,0 +1,53 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from src.routers.admin_api import require_admin
+from src.utils.policy import policy_store
+
+# Sửa profile thay đổi ngưỡng cảnh báo nên cần cùng token với các endpoint admin
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+class ProfileInput(BaseModel):
+    name: Optional[str] = None
+    # None = age band / độ nhạy mặc định trong config
+    age_band: Optional[str] = None
+    sensitivity: Optional[str] = None
+    # Nhóm nội dung text được theo dõi; None = tất cả
+    categories: Optional[List[str]] = None
+    allowed_domains: List[str] = []
+    blocked_domains: List[str] = []
+    # Chỉ cho phép allowed_domains, URL khác bị chặn mà không cần phân tích
+    allowlist_only: bool = False
+    # Tắt bớt phần phân tích tốn kém
+    url_fetch: bool = True
+    text_model: bool = True
+    video_audio: bool = True
+
+@router.get("/profiles")
+async def list_profiles():
+    return {"default": policy_store.default.describe(), "profiles": policy_store.profiles()}
+
+@router.get("/profiles/{device_id}")
+async def get_profile(device_id: str):
+    policy = policy_store.get(device_id)
+    if policy is policy_store.default:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return policy.describe()
+
+@router.put("/profiles/{device_id}")
+async def put_profile(device_id: str, data: ProfileInput):
+    """Tạo / sửa profile; policy được compile lại ngay, trả về bảng ngưỡng đã compile"""
+    loop = asyncio.get_running_loop()
+    try:
+        policy = await loop.run_in_executor(None, policy_store.put, device_id, data.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return policy.describe()
+
+@router.delete("/profiles/{device_id}")
+async def delete_profile(device_id: str):
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, policy_store.delete, device_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {"deleted": device_id}
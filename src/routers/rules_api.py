@@ -0,0 +1,72 @@
+from fastapi import APIRouter, HTTPException, Request
+from src.filters.text_filter import CATEGORY_KEYWORDS, CASCADE_CONFIG
+from src.utils.policy import Policy, default_policy, normalize_domains, policy_store
+from src.utils.rules_bundle import RULES_BUNDLE_CONFIG, RulesBundle, compile_automaton, read_digests, rule_lists
+
+router = APIRouter()
+
+# Phần Policy app cần để ra cùng verdict với server (tên profile không gửi xuống)
+POLICY_FIELDS = (
+    "text_toxic_above", "text_suspicious_above", "text_categories", "text_alert_labels",
+    "allowed_domains", "blocked_domains", "allowlist_only"
+)
+
+def policy_rules(policy: Policy) -> dict:
+    described = policy.describe()
+    return {field: described[field] for field in POLICY_FIELDS}
+
+def collect_rules() -> dict:
+    """Nguồn luật cho bundle: từ khoá / ngưỡng của tầng lọc từ khoá, domain và hash trong config"""
+    categories = list(CATEGORY_KEYWORDS)
+    keywords, keyword_category = [], []
+    for index, (keywords_of_category, _) in enumerate(CATEGORY_KEYWORDS.values()):
+        for keyword in keywords_of_category:
+            keywords.append(keyword.lower())
+            keyword_category.append(index)
+
+    return {
+        # Cùng cách chấm với advanced_vietnamese_text_check + lexical_prescreen:
+        # điểm nhóm = min(số từ khoá trúng * weight, 1)
+        "text": {
+            "categories": categories,
+            "weights": [weight for _, weight in CATEGORY_KEYWORDS.values()],
+            "keyword_category": keyword_category,
+            "automaton": compile_automaton(keywords),
+            "flag_above": CASCADE_CONFIG["flag_above"],
+            "clear_max_words": CASCADE_CONFIG["clear_max_words"]
+        },
+        # Policy của thiết bị không có profile; thiết bị có profile lấy qua /rules/policy
+        "policy": policy_rules(default_policy),
+        "deny_domains": sorted(normalize_domains(RULES_BUNDLE_CONFIG["deny_domains"])),
+        "allow_domains": sorted(normalize_domains(RULES_BUNDLE_CONFIG["allow_domains"])),
+        "text_hashes": read_digests(RULES_BUNDLE_CONFIG["text_hash_file"]),
+        "image_hashes": read_digests(RULES_BUNDLE_CONFIG["image_hash_file"])
+    }
+
+# Server dùng cùng danh sách domain / hash với thiết bị (rule_lists)
+rules_bundle = RulesBundle(
+    collect_rules, set_sections=("deny_domains", "allow_domains", "text_hashes", "image_hashes"), on_refresh=rule_lists.update
+)
+
+@router.get("/rules/bundle")
+async def get_rules_bundle(request: Request, since: str = None):
+    """
+    Bundle luật cho app lọc sơ bộ trên thiết bị.
+    `since`: version app đang có -> 304 nếu vẫn mới nhất, delta nếu server còn giữ version đó, ngược lại bản đầy đủ.
+    """
+    if not RULES_BUNDLE_CONFIG["enabled"]:
+        raise HTTPException(status_code=404, detail="Rules bundle is disabled")
+    if not await rules_bundle.ensure_built():
+        raise HTTPException(status_code=503, detail="Rules bundle is not available")
+    return rules_bundle.respond(request, since)
+
+@router.get("/rules/policy")
+async def get_rules_policy(request: Request):
+    """
+    Policy đã compile của thiết bị (header X-Device-Id): ngưỡng text, nhóm được theo dõi, domain
+    cho phép / chặn của profile. App áp dụng cùng policy với server khi trả kết quả trên thiết bị.
+    """
+    if not RULES_BUNDLE_CONFIG["enabled"]:
+        raise HTTPException(status_code=404, detail="Rules bundle is disabled")
+    policy = policy_store.for_connection(request)
+    return dict(policy_rules(policy), profile=policy.profile is not None)
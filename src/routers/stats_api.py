@@ -1,52 +1,29 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from src.utils.database import get_db, Alert
+import logging
+import datetime
+from fastapi import APIRouter, Request
+from src.utils.alert_store import alert_store
+from src.utils.logger import read_json_alerts
+from src.utils.response_cache import response_cache
 from collections import Counter
-import json, os
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_stats_from_db(db: Session):
-    """Get stats from database"""
+async def get_stats_from_db(since: datetime.datetime = None, until: datetime.datetime = None):
+    """Get stats from database: đếm bằng GROUP BY trên các partition trong khoảng thời gian (từ replica nếu có)"""
     try:
-        alerts = db.query(Alert).all()
-
-        total_alerts = len(alerts)
-        alerts_by_type = Counter(alert.type for alert in alerts)
-
-        labels_by_type = {}
-        for alert in alerts:
-            alert_type = alert.type
-            label = alert.result["label"]
-            if alert_type not in labels_by_type:
-                labels_by_type[alert_type] = Counter()
-            labels_by_type[alert_type][label] += 1
-
-        return {
-            "total_alerts": total_alerts,
-            "alerts_by_type": alerts_by_type,
-            "labels_by_type": labels_by_type,
-            "source": "database"
-        }
+        stats = await alert_store.alert_stats_async(since, until)
+        stats["source"] = "database"
+        return stats
     except Exception as e:
-        print(f"[DB STATS ERROR] {e}")
+        logger.error("DB stats failed: %s", e)
         return None
 
-def get_stats_from_json():
-    """Get stats from JSON file as fallback"""
+def get_stats_from_json(since: datetime.datetime = None, until: datetime.datetime = None):
+    """Get stats from JSON file as fallback (cùng khoảng thời gian với DB)"""
     try:
-        file_path = "logs/alerts.json"
-        if not os.path.exists(file_path):
-            return {
-                "total_alerts": 0,
-                "alerts_by_type": {},
-                "labels_by_type": {},
-                "source": "json"
-            }
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            alerts = [json.loads(line) for line in lines]
+        alerts = read_json_alerts(since, until)
 
         total_alerts = len(alerts)
         alerts_by_type = Counter(alert["type"] for alert in alerts)
@@ -66,7 +43,7 @@ def get_stats_from_json():
             "source": "json"
         }
     except Exception as e:
-        print(f"[JSON STATS ERROR] {e}")
+        logger.error("JSON stats failed: %s", e)
         return {
             "total_alerts": 0,
             "alerts_by_type": {},
@@ -74,19 +51,26 @@ def get_stats_from_json():
             "source": "error"
         }
 
-@router.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
+async def load_stats(since: datetime.datetime = None, until: datetime.datetime = None):
     """
     Get stats with hybrid approach: Try DB first, fallback to JSON
     """
     # Try database first
-    db_stats = get_stats_from_db(db)
+    db_stats = await get_stats_from_db(since, until)
 
-    # If DB fails or returns no data, try JSON fallback
-    if db_stats is None or db_stats["total_alerts"] == 0:
-        json_stats = get_stats_from_json()
+    # Chỉ dùng JSON khi đọc DB lỗi; khoảng thời gian không có alert nào là kết quả hợp lệ
+    if db_stats is None:
+        json_stats = get_stats_from_json(since, until)
         if json_stats["total_alerts"] > 0:
-            print(f"[JSON FALLBACK] Serving stats from JSON file ({json_stats['total_alerts']} alerts)")
+            logger.info("JSON fallback: serving stats from JSON file (%d alerts)", json_stats["total_alerts"])
         return json_stats
 
     return db_stats
+
+@router.get("/stats")
+async def get_stats(request: Request, since: datetime.datetime = None, until: datetime.datetime = None):
+    """
+    `since` / `until` (ISO, UTC) giới hạn khoảng thời gian thống kê.
+    Response được cache tới khi có alert mới (ETag / If-None-Match -> 304).
+    """
+    return await response_cache.respond(request, lambda: load_stats(since, until))
@@ -1,9 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
 from src.filters.text_filter import check_text
 from src.utils.logger import log_alert
 import asyncio
 from src.utils.notifier import notify_parent
+from src.utils.policy import policy_store
+from src.utils.qos import qos
+from src.utils.scheduler import scheduler, client_id
+from src.utils.singleflight import singleflight, content_key
+from src.utils.tracing import span, bind
 
 router = APIRouter()
 
@@ -11,12 +16,29 @@ class TextInput(BaseModel):
     content: str
 
 @router.post("/check_text")
-async def check_text_api(data: TextInput):
-    result = check_text(data.content)
+async def check_text_api(data: TextInput, request: Request):
+    # Chạy trong thread để các request đồng thời được gom batch chung cho model;
+    # các request trùng nội dung đang chạy cùng lúc dùng chung một kết quả
+    loop = asyncio.get_running_loop()
+    policy = policy_store.for_connection(request)
+    with span("check_text") as text_span:
+        # Request nào cũng tính rate limit, nhưng chỉ lần chạy thật (không phải request trùng
+        # đang chờ kết quả) mới chiếm slot của scheduler
+        scheduler.check_rate("text", client_id(request))
+        settings = qos.current()
+        use_model = settings["text_model"] and policy.text_model
+        key = content_key("text" if use_model else "text_lexical", data.content)
+        result = await singleflight.do(
+            key, scheduler.run, "text", loop.run_in_executor, None, bind(check_text, data.content, use_model)
+        )
+        # Kết quả dùng chung giữa các request trùng nội dung; ngưỡng của profile áp dụng riêng cho từng request
+        result = policy.apply_text(result)
+        if text_span is not None:
+            text_span.set(tier=result.get("tier"), label=result["label"], fidelity=settings["mode"])
 
-    # Nếu toxic thì log + notify
-    if result["label"].lower() == "toxic":
+    # Nhãn cần cảnh báo tuỳ profile (mặc định chỉ toxic) thì log + notify
+    if policy.alerts_text(result):
         await log_alert("TEXT", data.content, result)
         notify_parent("TEXT", data.content, result)
 
-    return {"input": data.content, "result": result}
+    return {"input": data.content, "result": result, "fidelity": qos.fidelity(settings), "policy": policy.name}
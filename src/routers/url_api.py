@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 import requests
 import re
@@ -9,9 +9,19 @@ from fake_useragent import UserAgent
 from src.utils.logger import log_alert
 import asyncio
 from src.utils.notifier import notify_parent
+from src.utils.policy import Policy, default_policy, policy_store
+from src.utils.qos import qos
+from src.utils.rules_bundle import rule_lists
+from src.utils.scheduler import scheduler, client_id, Rejected
+from src.utils.singleflight import singleflight, url_key
+from src.utils.tracing import span, bind
 
 router = APIRouter()
 
+# Số URL tối đa cho một request batch: mỗi URL tính một token rate limit và chiếm slot riêng khi
+# được phân tích, giới hạn này chỉ chặn request quá lớn giữ kết nối lâu
+MAX_BATCH_URLS = 30
+
 class URLInput(BaseModel):
     url: str
 
@@ -130,32 +140,28 @@ class URLAnalysisResult:
         except Exception as e:
             return 0.0, [f"Could not analyze content: {str(e)}"]
 
-def analyze_url_safety(url: str):
+def analyze_url_safety(url: str, fetch_content: bool = True):
     """
     Comprehensive URL safety analysis
+    `fetch_content=False` (QoS khi quá tải): không tải trang, điểm chỉ dựa trên cấu trúc URL.
     """
     analyzer = URLAnalysisResult()
 
     # Analyze URL structure
     structure_score, structure_reasons = analyzer.analyze_url_structure(url)
 
-    # Analyze content
-    content_score, content_reasons = analyzer.analyze_content(url)
-
-    # Combine scores
-    total_score = (structure_score + content_score) / 2
-    all_reasons = structure_reasons + content_reasons
+    if fetch_content:
+        # Analyze content
+        content_score, content_reasons = analyzer.analyze_content(url)
 
-    # Determine risk level
-    if total_score > 0.7:
-        risk_level = "high"
-        label = "dangerous"
-    elif total_score > 0.4:
-        risk_level = "medium"
-        label = "suspicious"
+        # Combine scores
+        total_score = (structure_score + content_score) / 2
     else:
-        risk_level = "low"
-        label = "safe"
+        content_score, content_reasons = 0.0, []
+        total_score = structure_score
+
+    # Determine risk level (ngưỡng của policy mặc định; profile gán lại bằng apply_url_policy)
+    label, risk_level = default_policy.url_label(total_score)
 
     return {
         "url": url,
@@ -168,40 +174,92 @@ def analyze_url_safety(url: str):
         },
         "content_analysis": {
             "score": content_score,
-            "reasons": content_reasons
+            "reasons": content_reasons,
+            "skipped": not fetch_content
         },
-        "recommendation": get_recommendation(total_score, all_reasons)
+        "recommendation": get_recommendation(label)
     }
 
-def get_recommendation(score: float, reasons: list):
+RECOMMENDATIONS = {
+    "dangerous": "BLOCKED: This URL appears to be dangerous and should not be accessed.",
+    "suspicious": "WARNING: This URL may contain inappropriate content. Parental supervision recommended.",
+    "safe": "SAFE: This URL appears to be safe for access."
+}
+
+def get_recommendation(label: str):
     """Get recommendation based on analysis"""
-    if score > 0.7:
-        return "BLOCKED: This URL appears to be dangerous and should not be accessed."
-    elif score > 0.4:
-        return "WARNING: This URL may contain inappropriate content. Parental supervision recommended."
-    else:
-        return "SAFE: This URL appears to be safe for access."
+    return RECOMMENDATIONS[label]
+
+def apply_url_policy(result: dict, policy: Policy) -> dict:
+    """Gán lại label theo ngưỡng của profile; kết quả gốc dùng chung giữa các request nên không sửa tại chỗ"""
+    label, risk_level = policy.url_label(result["score"])
+    return dict(result, label=label, risk_level=risk_level, recommendation=get_recommendation(label), policy=policy.name)
+
+def domain_rule_result(url: str, rule: str, policy: Policy, source: str = "profile") -> dict:
+    """Kết quả cho URL thuộc danh sách cho phép / chặn (của profile hoặc của rules bundle): không phân tích, không tải trang"""
+    label, score = ("dangerous", 1.0) if rule == "blocked" else ("safe", 0.0)
+    reasons = [f"Domain is {rule} by {source}"]
+    return {
+        "url": url,
+        "label": label,
+        "score": score,
+        "risk_level": "high" if label == "dangerous" else "low",
+        "structure_analysis": {"score": score, "reasons": reasons},
+        "content_analysis": {"score": 0.0, "reasons": [], "skipped": True},
+        "recommendation": get_recommendation(label),
+        "policy": policy.name,
+        "policy_rule": rule
+    }
+
+async def analyze_url_shared(url: str, fetch_content: bool = True, policy: Policy = default_policy):
+    """
+    Chạy analyze_url_safety trong thread; các request cùng URL (đã chuẩn hoá)
+    đang chạy đồng thời chỉ fetch trang một lần. Domain trong danh sách của profile, rồi
+    danh sách chung của rules bundle (cùng thứ tự với app), được trả kết quả ngay;
+    profile tắt `url_fetch` thì chỉ phân tích cấu trúc.
+    """
+    rule = policy.domain_rule(url)
+    if rule is not None:
+        return domain_rule_result(url, rule, policy)
+    rule = rule_lists.domain_rule(url)
+    if rule is not None:
+        return domain_rule_result(url, rule, policy, "rules bundle")
+
+    fetch_content = fetch_content and policy.url_fetch
+    loop = asyncio.get_running_loop()
+    key = url_key(url) if fetch_content else url_key(url) + ":structure"
+    with span("analyze_url", fetch_content=fetch_content):
+        # Slot của scheduler chỉ được chiếm bởi lần phân tích thật, request trùng URL chỉ chờ
+        result = await singleflight.do(
+            key, scheduler.run, "url", loop.run_in_executor, None, bind(analyze_url_safety, url, fetch_content)
+        )
+    return apply_url_policy(result, policy)
 
 @router.post("/check_url")
-async def check_url_api(data: URLInput):
+async def check_url_api(data: URLInput, request: Request):
     """
     Check URL for malicious or inappropriate content
     """
     try:
-        result = analyze_url_safety(data.url)
+        policy = policy_store.for_connection(request)
+        scheduler.check_rate("url", client_id(request))
+        settings = qos.current()
+        result = dict(await analyze_url_shared(data.url, settings["url_fetch"], policy), fidelity=qos.fidelity(settings))
 
         # Log if suspicious
-        if result["score"] > 0.4:
+        if result["label"] != "safe":
             await log_alert("URL", data.url, result)
             notify_parent("URL", data.url, result)
 
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"URL analysis failed: {str(e)}")
 
 @router.post("/check_urls_batch")
-async def check_urls_batch_api(urls: dict):
+async def check_urls_batch_api(urls: dict, request: Request):
     """
     Check multiple URLs for safety
     """
@@ -210,16 +268,25 @@ async def check_urls_batch_api(urls: dict):
     if not url_list:
         raise HTTPException(status_code=400, detail="URLs list is required")
 
+    if len(url_list) > MAX_BATCH_URLS:
+        raise HTTPException(status_code=400, detail=f"Too many URLs (max {MAX_BATCH_URLS})")
+
     results = []
+    policy = policy_store.for_connection(request)
+    # Mỗi URL tính một token rate limit; từng URL chiếm slot khi thực sự được phân tích
+    scheduler.check_rate("url", client_id(request), cost=len(url_list))
+    settings = qos.current()
     for url in url_list:
         try:
-            result = analyze_url_safety(url)
+            result = await analyze_url_shared(url, settings["url_fetch"], policy)
             results.append(result)
 
             # Log if suspicious
-            if result["score"] > 0.4:
+            if result["label"] != "safe":
                 await log_alert("URL_BATCH", url, result)
 
+        except Rejected as e:
+            results.append({"url": url, "error": e.reason, "label": "error", "score": 0.0, "retry_after": e.retry_after})
         except Exception as e:
             results.append({
                 "url": url,
@@ -228,7 +295,7 @@ async def check_urls_batch_api(urls: dict):
                 "score": 0.0
             })
 
-    return {"results": results}
+    return {"results": results, "fidelity": qos.fidelity(settings), "policy": policy.name}
 
 @router.get("/url_threats")
 async def get_url_threats():
@@ -1,67 +1,140 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-import cv2
-import numpy as np
+import logging
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Request
 import tempfile
 import os
 import uuid
-import moviepy as mp
-from src.filters.image_filter import check_image
+import time
+from src.filters.video_filter import scan_video_frames
+from src.filters.audio_filter import analyze_speech
 from src.utils.logger import log_alert
+from src.utils.media import VideoDecoder, decode_audio_pcm, download_to_file, has_audio_stream, remove_temp_file
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
 from src.utils.notifier import notify_parent
+from src.utils.policy import SPEECH_ALERT_LABELS, Policy, default_policy, policy_store
+from src.utils.qos import qos
+from src.utils.scheduler import scheduler, client_id
+from src.utils.tracing import span, bind
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-async def analyze_video_frames(video_path: str, sample_rate: int = 30):
+# Pool riêng cho nhánh audio của video, không tranh thread với nhánh frame
+_audio_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="video-audio")
+
+async def analyze_video_frames(video: VideoDecoder, sample_rate: int = 30, on_progress=None, policy: Policy = default_policy):
     """
     Analyze video frames for inappropriate content
     """
     try:
-        cap = cv2.VideoCapture(video_path)
-        frame_count = 0
-        suspicious_frames = []
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            frame_count += 1
-
-            # Sample frames at specified rate
-            if frame_count % sample_rate == 0:
-                # Convert frame to image for analysis
-                temp_frame_path = f"temp/frame_{frame_count}.jpg"
-                cv2.imwrite(temp_frame_path, frame)
-
-                # Analyze frame
-                result = check_image(temp_frame_path)
-
-                if result.get("label", "").lower() in ["nsfw", "porn", "unsafe", "suspicious"]:
-                    suspicious_frames.append({
-                        "frame": frame_count,
-                        "timestamp": frame_count / cap.get(cv2.CAP_PROP_FPS),
-                        "result": result
-                    })
-
-                # Clean up temp frame
-                os.remove(temp_frame_path)
-
-        cap.release()
-
-        return {
-            "total_frames": total_frames,
-            "analyzed_frames": frame_count // sample_rate,
-            "suspicious_frames": len(suspicious_frames),
-            "details": suspicious_frames
-        }
+        # Decode và phân tích frame trong thread để không chặn event loop
+        loop = asyncio.get_running_loop()
+        with span("video_frames"):
+            return await loop.run_in_executor(None, bind(scan_video_frames, video, sample_rate, on_progress, policy))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Video analysis failed: {str(e)}")
 
+def analyze_video_audio(video_path: str, policy: Policy = default_policy):
+    """
+    Tách track audio của video (một lần decode ra PCM) và kiểm tra lời nói.
+    Chạy đồng bộ, nên gọi trong thread. Profile tắt `video_audio` thì bỏ qua.
+    """
+    started = time.perf_counter()
+    if not policy.video_audio:
+        return {"has_audio": None, "label": "safe", "skipped": True, "seconds": 0.0}
+
+    try:
+        with span("video_audio_probe"):
+            audio_present = has_audio_stream(video_path)
+        if not audio_present:
+            return {"has_audio": False, "label": "safe", "seconds": time.perf_counter() - started}
+
+        with span("decode_audio"):
+            audio = decode_audio_pcm(video_path)
+        with span("analyze_speech"):
+            result = analyze_speech(audio)
+        result["analysis"] = policy.apply_text(result["analysis"])
+        is_suspicious = result["analysis"]["label"].lower() in SPEECH_ALERT_LABELS
+        result.update({
+            "has_audio": True,
+            "label": "suspicious" if is_suspicious else "safe",
+            "score": result["analysis"]["score"]
+        })
+
+    except Exception as e:
+        logger.error("Video audio analysis failed: %s", e)
+        result = {"has_audio": True, "label": "error", "error": str(e)}
+
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+async def analyze_video_file(video_path: str, filename: str, on_progress=None, policy: Policy = default_policy):
+    """
+    Phân tích một file video đã có trên đĩa: metadata và frame dùng chung một decoder,
+    track audio được kiểm tra song song trên pool riêng.
+    """
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    # Mức QoS giữ nguyên suốt một video để kết quả nhất quán
+    settings = qos.current()
+
+    # Nhánh audio chạy song song với nhánh frame nên tổng thời gian ~ nhánh chậm hơn
+    audio_task = loop.run_in_executor(_audio_pool, bind(analyze_video_audio, video_path, policy))
+
+    try:
+        with span("video_open"):
+            video = VideoDecoder(video_path)
+        with video:
+            # Analyze video frames
+            frames_started = time.perf_counter()
+            analysis_result = await analyze_video_frames(video, sample_rate=settings["video_sample_rate"], on_progress=on_progress, policy=policy)
+            frames_seconds = time.perf_counter() - frames_started
+    finally:
+        audio_result = await audio_task
+
+    # Determine overall result
+    frames_suspicious = analysis_result["suspicious_frames"] > 0
+    audio_suspicious = audio_result["label"] == "suspicious"
+    is_suspicious = frames_suspicious or audio_suspicious
+
+    score = min(analysis_result["suspicious_frames"] * 0.1, 1.0)
+    if audio_suspicious:
+        score = max(score, audio_result["score"])
+
+    result = {
+        "filename": filename,
+        "duration": video.duration,
+        "fps": video.fps,
+        "total_frames": analysis_result["total_frames"],
+        "analyzed_frames": analysis_result["analyzed_frames"],
+        "suspicious_frames": analysis_result["suspicious_frames"],
+        "suspicious_percentage": (analysis_result["suspicious_frames"] / max(analysis_result["analyzed_frames"], 1)) * 100,
+        "details": analysis_result["details"],
+        "audio": audio_result,
+        "flagged_modalities": [name for name, flagged in (("frames", frames_suspicious), ("audio", audio_suspicious)) if flagged],
+        "timing": {
+            "frames_seconds": frames_seconds,
+            "audio_seconds": audio_result["seconds"],
+            "total_seconds": time.perf_counter() - started
+        },
+        "label": "suspicious" if is_suspicious else "safe",
+        "score": score,
+        "sample_rate": settings["video_sample_rate"],
+        "fidelity": qos.fidelity(settings),
+        "policy": policy.name
+    }
+
+    # Log and notify if suspicious content detected
+    if is_suspicious:
+        await log_alert("VIDEO", filename, result)
+        notify_parent("VIDEO", filename, result)
+
+    return result
+
 @router.post("/check_video")
-async def check_video_api(file: UploadFile = File(...)):
+async def check_video_api(request: Request, file: UploadFile = File(...)):
     """
     Check uploaded video for inappropriate content
     """
@@ -81,55 +154,25 @@ async def check_video_api(file: UploadFile = File(...)):
 
     try:
         # Save uploaded file to temp location
-        with open(temp_name, "wb") as buffer:
+        with span("save_upload"), open(temp_name, "wb") as buffer:
             content = await file.read()
             buffer.write(content)
 
-        # Get video info
-        clip = mp.VideoFileClip(temp_name)
-        duration = clip.duration
-        fps = clip.fps
-
-        # Analyze video frames
-        analysis_result = await analyze_video_frames(temp_name, sample_rate=30)
-
-        # Determine overall result
-        is_suspicious = analysis_result["suspicious_frames"] > 0
-
-        result = {
-            "filename": filename,
-            "duration": duration,
-            "fps": fps,
-            "total_frames": analysis_result["total_frames"],
-            "analyzed_frames": analysis_result["analyzed_frames"],
-            "suspicious_frames": analysis_result["suspicious_frames"],
-            "suspicious_percentage": (analysis_result["suspicious_frames"] / max(analysis_result["analyzed_frames"], 1)) * 100,
-            "details": analysis_result["details"],
-            "label": "suspicious" if is_suspicious else "safe",
-            "score": min(analysis_result["suspicious_frames"] * 0.1, 1.0)
-        }
-
-        # Log and notify if suspicious content detected
-        if is_suspicious:
-            await log_alert("VIDEO", filename, result)
-            notify_parent("VIDEO", filename, result)
-
-        return result
+        async with scheduler.slot("media", client_id(request)):
+            return await analyze_video_file(temp_name, filename, policy=policy_store.for_connection(request))
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[ERROR] Video processing failed: {e}")
+        logger.error("Video processing failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Video processing failed: {str(e)}")
 
     finally:
         # Clean up temp file
-        try:
-            if os.path.exists(temp_name):
-                os.remove(temp_name)
-        except Exception as e:
-            print(f"[WARNING] Failed to clean up temp file {temp_name}: {e}")
+        remove_temp_file(temp_name)
 
 @router.post("/check_video_url")
-async def check_video_url_api(url: dict):
+async def check_video_url_api(url: dict, request: Request):
     """
     Check video from URL for inappropriate content
     """
@@ -138,27 +181,26 @@ async def check_video_url_api(url: dict):
     if not video_url:
         raise HTTPException(status_code=400, detail="URL is required")
 
-    try:
-        # Download video temporarily
-        import requests
-        response = requests.get(video_url, stream=True)
-        response.raise_for_status()
-
-        # Create temp file
-        temp_dir = "temp"
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_name = os.path.join(temp_dir, f"{uuid.uuid4()}.mp4")
-
-        with open(temp_name, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        # Analyze video
-        with open(temp_name, "rb") as video_file:
-            upload_file = UploadFile(filename="url_video.mp4", file=video_file)
-            result = await check_video_api(upload_file)
-
-        return result
+    # Create temp file
+    temp_dir = "temp"
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_name = os.path.join(temp_dir, f"{uuid.uuid4()}.mp4")
 
+    try:
+        # Chiếm slot từ lúc tải: tải video cũng tốn băng thông và I/O
+        async with scheduler.slot("media", client_id(request)):
+            # Download video temporarily
+            # Tải trong thread, không chặn event loop trong lúc chờ mạng / ghi file
+            with span("download"):
+                await asyncio.get_running_loop().run_in_executor(None, bind(download_to_file, video_url, temp_name))
+
+            # Analyze video trực tiếp từ file đã tải, không copy lại lần nữa
+            return await analyze_video_file(temp_name, "url_video.mp4", policy=policy_store.for_connection(request))
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"URL video processing failed: {str(e)}")
+
+    finally:
+        remove_temp_file(temp_name)
@@ -1,7 +1,15 @@
+import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 import json
 import asyncio
 from typing import List, Dict, Any
+from src.filters.conversation_filter import moderator
+from src.utils.metrics import WS_BROADCAST_SECONDS, CHAT_MESSAGES
+from src.utils.policy import policy_store
+from src.utils.qos import qos
+from src.utils.scheduler import scheduler, client_id, Rejected
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -13,11 +21,11 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
-        print(f"[WS] Client connected. Total connections: {len(self.active_connections)}")
+        logger.info("Client connected. Total connections: %d", len(self.active_connections))
 
     def disconnect(self, websocket: WebSocket):
         self.active_connections.remove(websocket)
-        print(f"[WS] Client disconnected. Total connections: {len(self.active_connections)}")
+        logger.info("Client disconnected. Total connections: %d", len(self.active_connections))
 
     async def broadcast(self, message: Dict[str, Any]):
         """Broadcast message to all connected clients"""
@@ -27,12 +35,13 @@ class ConnectionManager:
         message_json = json.dumps(message, ensure_ascii=False)
         disconnected_clients = []
 
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message_json)
-            except Exception as e:
-                print(f"[WS] Error sending to client: {e}")
-                disconnected_clients.append(connection)
+        with WS_BROADCAST_SECONDS.time(type=message.get("type", "")):
+            for connection in self.active_connections:
+                try:
+                    await connection.send_text(message_json)
+                except Exception as e:
+                    logger.warning("Error sending to client: %s", e)
+                    disconnected_clients.append(connection)
 
         # Clean up disconnected clients
         for client in disconnected_clients:
@@ -40,24 +49,153 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+class ModerationStream:
+    """
+    Kiểm duyệt chat theo luồng trên một kết nối WebSocket.
+    Tin nhận được chạy song song (tối đa MAX_IN_FLIGHT tin mỗi kết nối), verdict được
+    trả về ngay khi có kèm message_id, không theo thứ tự gửi. Tin của cùng một hội thoại
+    được kiểm duyệt lần lượt theo thứ tự nhận để ngữ cảnh (tin bị tách, quấy rối lặp lại)
+    thấy đủ các tin trước; các hội thoại khác nhau vẫn chạy song song. Một task ghi duy nhất
+    gộp các verdict đang chờ thành một frame để giảm overhead khi tải cao.
+    """
+
+    MAX_IN_FLIGHT = 256
+    MAX_VERDICTS_PER_FRAME = 128
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.client = client_id(websocket)
+        # Chủ ngữ cảnh hội thoại: device id nếu có, ngược lại định danh client
+        self.owner = websocket.headers.get(policy_store.config["device_header"]) or self.client
+        # Profile của thiết bị lấy một lần khi mở kết nối
+        self.policy = policy_store.for_connection(websocket)
+        self._outbox = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.MAX_IN_FLIGHT)
+        self._tasks = set()
+        # conversation_id -> [Lock, số tin đang chờ / chạy]; Lock của asyncio cấp theo thứ tự chờ
+        self._conversations = {}
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def submit(self, message: Dict[str, Any]):
+        # Hết slot thì ngừng đọc thêm tin từ client (backpressure)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._moderate(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def end_conversation(self, conversation_id: str):
+        moderator.end_conversation(conversation_id, self.owner)
+
+    async def send(self, message: Dict[str, Any]):
+        await self._outbox.put(message)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        self._writer.cancel()
+
+    async def _moderate(self, message: Dict[str, Any]):
+        conversation_id = str(message.get("conversation_id", ""))
+        entry = self._conversations.get(conversation_id)
+        if entry is None:
+            entry = self._conversations[conversation_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Task được tạo theo thứ tự nhận nên cũng chờ Lock theo thứ tự đó
+            async with entry[0]:
+                await self._moderate_in_order(conversation_id, message)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._conversations[conversation_id]
+            self._slots.release()
+
+    async def _moderate_in_order(self, conversation_id: str, message: Dict[str, Any]):
+        verdict = {"type": "verdict", "conversation_id": conversation_id, "message_id": message.get("message_id")}
+        try:
+            content = message.get("content") or ""
+            async with scheduler.slot("text", self.client):
+                settings = qos.current()
+                result = await moderator.moderate(conversation_id, content, message.get("sender"), settings["text_model"], self.policy, self.owner)
+            verdict.update(result, fidelity=qos.fidelity(settings))
+            CHAT_MESSAGES.inc(label=result["label"])
+            await self._outbox.put(verdict)
+
+            if self.policy.alerts_text(result):
+                await _report_chat_alert(conversation_id, content, result)
+        except Rejected as e:
+            # Quá tải / vượt rate limit: client nên gửi lại tin sau retry_after giây
+            verdict.update({"label": "error", "error": e.reason, "retry_after": e.retry_after})
+            await self._outbox.put(verdict)
+        except Exception as e:
+            logger.error("Chat moderation failed: %s", e)
+            verdict.update({"label": "error", "error": str(e)})
+            await self._outbox.put(verdict)
+
+    async def _write_loop(self):
+        while True:
+            items = [await self._outbox.get()]
+            while len(items) < self.MAX_VERDICTS_PER_FRAME and not self._outbox.empty():
+                items.append(self._outbox.get_nowait())
+
+            if len(items) == 1:
+                payload = items[0]
+            else:
+                payload = {"type": "verdicts", "items": items}
+            try:
+                await self.websocket.send_text(json.dumps(payload, ensure_ascii=False))
+            except Exception as e:
+                logger.warning("Error sending to client: %s", e)
+                return
+
+async def _report_chat_alert(conversation_id: str, content: str, result: Dict[str, Any]):
+    # Import muộn: logger import websocket_router để broadcast
+    from src.utils.logger import log_alert
+    from src.utils.notifier import notify_parent
+
+    await log_alert("CHAT", content, dict(result, conversation_id=conversation_id))
+    notify_parent("CHAT", content, result)
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time updates"""
-    await manager.connect(websocket)
+    """
+    WebSocket endpoint for streaming chat moderation.
+    Tin JSON {"type": "moderate", "conversation_id", "message_id", "content", "sender"?}
+    (hoặc {"type": "moderate_batch", "messages": [...]}) được kiểm duyệt, các tin khác được echo lại.
+    Kết nối của thiết bị trẻ không nhận broadcast cảnh báo / job (dashboard dùng /ws/alerts).
+    """
+    await websocket.accept()
+    stream = ModerationStream(websocket)
 
     try:
         while True:
             # Keep connection alive and handle any client messages
             data = await websocket.receive_text()
 
-            # Echo back for testing
-            await websocket.send_text(f"Echo: {data}")
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+
+            if not isinstance(message, dict):
+                # Echo back for testing
+                await websocket.send_text(f"Echo: {data}")
+            elif message.get("type") == "moderate":
+                await stream.submit(message)
+            elif message.get("type") == "moderate_batch":
+                for item in message.get("messages") or []:
+                    await stream.submit(item)
+            elif message.get("type") == "end_conversation":
+                stream.end_conversation(str(message.get("conversation_id", "")))
+            else:
+                await stream.send({"type": "error", "error": f"Unknown message type: {message.get('type')}"})
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
-        print(f"[WS] Error: {e}")
-        manager.disconnect(websocket)
+        logger.error("WebSocket error: %s", e)
+    finally:
+        await stream.close()
 
 @router.websocket("/ws/alerts")
 async def alerts_websocket(websocket: WebSocket):
@@ -79,12 +217,12 @@ async def alerts_websocket(websocket: WebSocket):
                     "timestamp": asyncio.get_event_loop().time()
                 }, ensure_ascii=False))
             except Exception as e:
-                print(f"[WS] Error sending heartbeat: {e}")
+                logger.warning("Error sending heartbeat: %s", e)
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
-        print(f"[WS] Error: {e}")
+        logger.error("WebSocket error: %s", e)
         manager.disconnect(websocket)
 
 # Function to broadcast alerts to all connected clients
@@ -108,6 +246,16 @@ async def broadcast_stats(stats_data: Dict[str, Any]):
 
     await manager.broadcast(message)
 
+async def broadcast_job_update(job_data: Dict[str, Any]):
+    """Broadcast job progress / completion to all connected clients"""
+    message = {
+        "type": "job_update",
+        "data": job_data,
+        "timestamp": asyncio.get_event_loop().time()
+    }
+
+    await manager.broadcast(message)
+
 # Get connection count
 def get_connection_count():
     """Get number of active WebSocket connections"""
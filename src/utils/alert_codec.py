@@ -0,0 +1,121 @@
+"""
+Mã hoá gọn alert để lưu trữ.
+
+- `result` được lưu dạng nhị phân: 1 byte version + JSON (không khoảng trắng) nén zlib với
+  preset dictionary gồm các key / label hay gặp, nên cả result nhỏ cũng nén được.
+  Version cho phép đổi dictionary / định dạng mà vẫn đọc được dữ liệu cũ.
+- Khi đọc, result chỉ được giải nén lúc thực sự truy cập (`LazyResult`).
+- Nội dung alert được lưu một lần theo hash (`content_hash`), các alert trùng nội dung chỉ tham chiếu.
+- Chi tiết lớn (vd. danh sách frame bị đánh dấu của video) được tách ra bảng phụ, chỉ đọc khi xem chi tiết.
+"""
+import hashlib
+import json
+import zlib
+from collections.abc import Mapping
+
+CODEC_VERSION = 1
+
+# Preset dictionary của version 1: key / giá trị mà các kết quả trong src/ thật sự ghi vào alert
+# (check_text, analyze_url_safety, ảnh, video, audio, chat), dạng JSON gọn như encode_result.
+# Chuỗi hay gặp đặt cuối (zlib ưu tiên khoảng cách gần).
+# KHÔNG sửa dictionary này khi đã có dữ liệu version 1; muốn đổi thì thêm version mới.
+_ZDICT_V1_TOKENS = (
+    # Audio (AUDIO và track audio của VIDEO)
+    '"flagged_segment":{"segment":', '"start":', '"end":', '"recognizer":"', '"transcription":"', '"has_speech":',
+    '"segments":', '"recognized_segments":', '"early_exit":', '"has_audio":', '"seconds":',
+    # Video (chi tiết frame nằm ở bảng phụ)
+    '"details":[{"frame":', '"timestamp":', '"result":{', '"details_count":', '"sample_rate":', '"flagged_modalities":["',
+    '"timing":{"frames_seconds":', '"audio_seconds":', '"total_seconds":', '"filename":"', '"duration":', '"fps":',
+    '"total_frames":', '"analyzed_frames":', '"suspicious_frames":', '"suspicious_percentage":', '"audio":{',
+    # Chat
+    '"conversation_id":"', '"message_label":"', '"context_reasons":[', '"context_messages":',
+    # URL
+    '"recommendation":"WARNING: This URL may contain inappropriate content. Parental supervision recommended."',
+    '"content_analysis":{', '"skipped":', '"Uses IP address instead of domain"', '"Suspicious top-level domain"',
+    '"Contains suspicious keyword: ', '"structure_analysis":{', '"reasons":[', '"url":"', '"risk_level":"medium"',
+    # Text
+    '"analysis":"multi_layer_detection"', '"primary_category":"', '"categories":{"cyberbullying":', '"sexual_content":',
+    '"scam":', '"hate_speech":', '"violence":', '"tier":"', '"analysis":{',
+    # Chung
+    '"fidelity":{"level":', '"mode":"', '"policy":"default"', '"label":"safe"', '"label":"nsfw"', '"label":"suspicious"',
+    '"label":"toxic"', '"score":0.', '{"label":"',
+)
+_ZDICT_V1 = "".join(_ZDICT_V1_TOKENS).encode("utf-8")
+
+_ZDICTS = {1: _ZDICT_V1}
+_ZDICT_TOKENS = {1: _ZDICT_V1_TOKENS}
+
+# Các key chứa chi tiết lớn, tách khỏi result chính
+DETAIL_KEYS = ("details",)
+
+def _payload(result) -> str:
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def encode_result(result: dict) -> bytes:
+    payload = _payload(result).encode("utf-8")
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, _ZDICTS[CODEC_VERSION])
+    return bytes([CODEC_VERSION]) + compressor.compress(payload) + compressor.flush()
+
+def unused_dictionary_tokens(results, version: int = CODEC_VERSION) -> list:
+    """
+    Các chuỗi của preset dictionary không xuất hiện trong JSON đã mã hoá của `results`
+    (result thật, sau split_details); dùng để kiểm tra dictionary trước khi cố định version.
+    """
+    payloads = []
+    for result in results:
+        compact, details = split_details(result)
+        payloads.append(_payload(compact))
+        if details is not None:
+            payloads.append(_payload(details))
+    return [token for token in _ZDICT_TOKENS[version] if not any(token in payload for payload in payloads)]
+
+def decode_result(data: bytes) -> dict:
+    if data is None:
+        return None
+    version = data[0]
+    if version not in _ZDICTS:
+        raise ValueError(f"Unknown alert result encoding version: {version}")
+    decompressor = zlib.decompressobj(-15, _ZDICTS[version])
+    return json.loads(decompressor.decompress(data[1:]) + decompressor.flush())
+
+def split_details(result: dict):
+    """(result không kèm chi tiết lớn, chi tiết hoặc None)"""
+    if not isinstance(result, dict) or not any(key in result for key in DETAIL_KEYS):
+        return result, None
+
+    compact = {key: value for key, value in result.items() if key not in DETAIL_KEYS}
+    details = {key: result[key] for key in DETAIL_KEYS if key in result}
+    # Giữ số lượng để dashboard biết có chi tiết mà không cần đọc bảng phụ
+    compact["details_count"] = sum(len(value) if isinstance(value, list) else 1 for value in details.values())
+    return compact, details
+
+def content_hash(content: str) -> str:
+    return hashlib.blake2b((content or "").encode("utf-8"), digest_size=16).hexdigest()
+
+class LazyResult(Mapping):
+    """Result đã mã hoá, chỉ giải nén khi được đọc; dùng như dict read-only"""
+
+    __slots__ = ("raw", "_decoded")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._decoded = None
+
+    def _value(self) -> dict:
+        if self._decoded is None:
+            self._decoded = decode_result(self.raw) or {}
+        return self._decoded
+
+    def __getitem__(self, key):
+        return self._value()[key]
+
+    def __iter__(self):
+        return iter(self._value())
+
+    def __len__(self):
+        return len(self._value())
+
+    def __repr__(self):
+        if self._decoded is None:
+            return f"LazyResult(<{len(self.raw)} bytes>)"
+        return f"LazyResult({self._decoded!r})"
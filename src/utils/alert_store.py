@@ -0,0 +1,689 @@
+"""
+Lưu alert theo partition thời gian.
+
+- Mỗi tháng (hoặc mỗi ngày, `alerts.partition`) là một bảng riêng `alerts_YYYYMM` / `alerts_YYYYMMDD`
+  có index theo time và (type, label). Trên SQLite đây chính là cách "partition" duy nhất;
+  trên Postgres các bảng nhỏ cũng giúp VACUUM / DROP nhanh như partition native.
+- Bảng `alert_partitions` ghi khoảng thời gian của từng partition; query theo khoảng thời gian
+  chỉ đụng tới các partition giao với khoảng đó (partition pruning).
+- Partition đã đóng được tính sẵn thống kê type/label một lần, dashboard không phải đếm lại.
+- Nội dung được lưu một lần trong `alert_contents` (theo hash), result lưu dạng nhị phân nén
+  và chi tiết theo frame nằm ở bảng phụ `alerts_YYYYMM_details` (xem src/utils/alert_codec.py).
+- Partition cũ hơn `retention_days` được xuất ra file JSONL nén gzip trong `archive_dir`
+  rồi DROP bảng; thống kê của nó vẫn giữ trong `alert_partitions`.
+
+Bảo trì (chuyển dữ liệu bảng `alerts` cũ, đóng và archive partition) chạy định kỳ trong app
+hoặc bằng tay:
+    python -m src.utils.alert_store [maintain|migrate|list]
+"""
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from sqlalchemy import Table, Column, Integer, String, DateTime, LargeBinary, MetaData, Index, select, insert, update, delete, func, union
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from src.utils.alert_codec import encode_result, decode_result, split_details, content_hash, LazyResult
+from src.utils.config import get_section
+from src.utils.database import engine, get_async_engine, SessionLocal, Alert, AlertPartition, AlertContent
+
+logger = logging.getLogger(__name__)
+
+ALERT_STORE_CONFIG = get_section("alerts", {
+    "partition": "month",                  # "month" | "day"
+    "retention_days": 90,                  # 0 = giữ mãi, không archive
+    "archive_dir": "logs/archive",
+    "maintenance_interval_seconds": 3600,
+    "migrate_batch_size": 5000
+})
+
+# Danh sách partition được cache trong process, đọc lại sau khoảng này (partition do process khác tạo)
+REGISTRY_TTL_SECONDS = 30
+
+# Hash nội dung đã biết là có trong alert_contents (bỏ qua lookup với nội dung lặp lại nhiều lần)
+CONTENT_CACHE_SIZE = 100000
+CONTENT_CACHE_SECONDS = 3600
+
+content_table = AlertContent.__table__
+partitions_table = AlertPartition.__table__
+
+_metadata = MetaData()
+
+def partition_bounds(moment: datetime.datetime, granularity: str = "month"):
+    """(tên bảng, start, end) của partition chứa `moment`"""
+    if granularity == "day":
+        start = datetime.datetime(moment.year, moment.month, moment.day)
+        return f"alerts_{start:%Y%m%d}", start, start + datetime.timedelta(days=1)
+
+    start = datetime.datetime(moment.year, moment.month, 1)
+    end = datetime.datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return f"alerts_{start:%Y%m}", start, end
+
+def partition_table(name: str) -> Table:
+    table = _metadata.tables.get(name)
+    if table is None:
+        table = Table(
+            name, _metadata,
+            Column("id", Integer, primary_key=True, autoincrement=True),
+            Column("time", DateTime, nullable=False, index=True),
+            Column("type", String),
+            # Tách label ra cột riêng để thống kê bằng GROUP BY, không phải đọc JSON
+            Column("label", String),
+            Column("content_hash", String(32)),
+            Column("result", LargeBinary),
+            Column("level", String),
+            Index(f"ix_{name}_type_label", "type", "label")
+        )
+    return table
+
+def details_table(name: str) -> Table:
+    """Bảng phụ chứa chi tiết lớn của alert (vd. các frame video bị đánh dấu)"""
+    detail_name = f"{name}_details"
+    table = _metadata.tables.get(detail_name)
+    if table is None:
+        table = Table(
+            detail_name, _metadata,
+            Column("alert_id", Integer, primary_key=True),
+            Column("details", LargeBinary)
+        )
+    return table
+
+def _utc(moment):
+    # Cột time lưu UTC không kèm timezone; tham số có timezone được đổi về cùng dạng
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+def _alert_id(partition: str, row_id: int) -> str:
+    # Id alert gồm partition + id trong bảng, vd. "202406-15"
+    return f"{partition[len('alerts_'):]}-{row_id}"
+
+def _parse_alert_id(alert_id: str):
+    suffix, _, row_id = alert_id.partition("-")
+    if not suffix.isdigit() or not row_id.isdigit():
+        raise ValueError(f"Invalid alert id: {alert_id}")
+    return f"alerts_{suffix}", int(row_id)
+
+def _to_alert(partition: str, row) -> dict:
+    return {
+        "id": _alert_id(partition, row["id"]),
+        "time": row["time"],
+        "type": row["type"],
+        "content": row["content"],
+        "result": LazyResult(row["result"]) if row["result"] is not None else None,
+        "level": row["level"]
+    }
+
+def _select_alerts(table: Table):
+    return select(table, content_table.c.content).select_from(
+        table.outerjoin(content_table, table.c.content_hash == content_table.c.hash)
+    )
+
+def _merge_stats(total: dict, stats: dict):
+    for alert_type, labels in stats.items():
+        total.setdefault(alert_type, Counter()).update(labels)
+
+class AlertStore:
+    def __init__(self, config: dict = ALERT_STORE_CONFIG):
+        self.config = config
+        self._known = set()
+        self._lock = threading.Lock()
+        self._registry = None
+        self._registry_loaded_at = 0.0
+        self._task = None
+        self._content_cache = OrderedDict()
+        self._content_lock = threading.Lock()
+
+    # --- Registry ---
+    # Các hàm nhận `conn` chạy được cả trên kết nối đồng bộ lẫn kết nối async (qua run_sync)
+
+    def _registry_fresh(self) -> bool:
+        return self._registry is not None and time.monotonic() - self._registry_loaded_at <= REGISTRY_TTL_SECONDS
+
+    def _load_registry(self, conn):
+        rows = conn.execute(select(partitions_table).order_by(partitions_table.c.start.desc())).mappings()
+        self._registry = [
+            {
+                "name": row["name"], "start": row["start"], "end": row["end"], "status": row["status"],
+                "row_count": row["row_count"], "stats": row["stats"], "archive_path": row["archive_path"]
+            }
+            for row in rows
+        ]
+        self._registry_loaded_at = time.monotonic()
+
+    def _filter_partitions(self, since=None, until=None) -> list:
+        return [
+            p for p in self._registry
+            if (since is None or p["end"] > since) and (until is None or p["start"] < until)
+        ]
+
+    def partitions(self, since: datetime.datetime = None, until: datetime.datetime = None) -> list:
+        """Các partition giao với [since, until), mới nhất trước"""
+        if not self._registry_fresh():
+            with engine.connect() as conn:
+                self._load_registry(conn)
+        return self._filter_partitions(since, until)
+
+    async def partitions_async(self, since: datetime.datetime = None, until: datetime.datetime = None) -> list:
+        if not self._registry_fresh():
+            async with get_async_engine(readonly=True).connect() as conn:
+                await conn.run_sync(self._load_registry)
+        return self._filter_partitions(since, until)
+
+    def _invalidate(self):
+        self._registry = None
+
+    def _create_partition(self, conn, name: str, start: datetime.datetime, end: datetime.datetime) -> str:
+        """Tạo bảng của partition nếu chưa có; trả về status trong registry (partition đã archive thì không tạo lại bảng)"""
+        status = conn.execute(select(partitions_table.c.status).where(partitions_table.c.name == name)).scalar()
+        if status not in (None, "active"):
+            return status
+        partition_table(name).create(conn, checkfirst=True)
+        details_table(name).create(conn, checkfirst=True)
+        if status is None:
+            conn.execute(insert(partitions_table).values(
+                name=name, start=start, end=end, status="active", created_at=datetime.datetime.utcnow()
+            ))
+        return "active"
+
+    def _ensure_partition(self, moment: datetime.datetime) -> str:
+        name, start, end = partition_bounds(moment, self.config["partition"])
+        if name in self._known:
+            return name
+
+        with self._lock:
+            if name not in self._known:
+                try:
+                    with engine.begin() as conn:
+                        status = self._create_partition(conn, name, start, end)
+                except DBAPIError:
+                    # Process khác vừa tạo cùng partition: lần này checkfirst sẽ thấy bảng
+                    with engine.begin() as conn:
+                        status = self._create_partition(conn, name, start, end)
+                if status == "active":
+                    self._known.add(name)
+                self._invalidate()
+        return name
+
+    async def _ensure_partition_async(self, moment: datetime.datetime) -> str:
+        name, start, end = partition_bounds(moment, self.config["partition"])
+        if name in self._known:
+            return name
+
+        async_engine = get_async_engine()
+        try:
+            async with async_engine.begin() as conn:
+                status = await conn.run_sync(self._create_partition, name, start, end)
+        except DBAPIError:
+            async with async_engine.begin() as conn:
+                status = await conn.run_sync(self._create_partition, name, start, end)
+        if status == "active":
+            self._known.add(name)
+        self._invalidate()
+        return name
+
+    # --- Ghi ---
+
+    def _store_contents(self, conn, contents: dict):
+        """
+        Ghi các nội dung chưa có vào alert_contents. Cache hash chỉ được cập nhật sau khi
+        transaction của caller commit (`_remember_contents`): transaction rollback thì dòng
+        nội dung mất, hash không được phép còn trong cache.
+        """
+        now = time.monotonic()
+        missing = {}
+        for digest, content in contents.items():
+            with self._content_lock:
+                cached_at = self._content_cache.get(digest)
+            if cached_at is None or now - cached_at > CONTENT_CACHE_SECONDS:
+                missing[digest] = content
+
+        if missing:
+            existing = set(conn.execute(select(content_table.c.hash).where(content_table.c.hash.in_(list(missing)))).scalars())
+            created_at = datetime.datetime.utcnow()
+            new_rows = [
+                {"hash": digest, "content": content, "created_at": created_at}
+                for digest, content in missing.items() if digest not in existing
+            ]
+            for row in new_rows:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(insert(content_table).values(**row))
+                except IntegrityError:
+                    # Process khác vừa ghi cùng nội dung
+                    pass
+
+    def _remember_contents(self, digests):
+        """Đánh dấu các hash đã có trong alert_contents; chỉ gọi sau khi transaction ghi đã commit"""
+        now = time.monotonic()
+        with self._content_lock:
+            for digest in digests:
+                self._content_cache[digest] = now
+                self._content_cache.move_to_end(digest)
+            while len(self._content_cache) > CONTENT_CACHE_SIZE:
+                self._content_cache.popitem(last=False)
+
+    def _write(self, conn, name: str, rows: list, return_ids: bool = False):
+        """
+        Ghi các alert đã chuẩn hoá vào một partition. Trả về (id trong bảng nếu `return_ids`,
+        hash nội dung để `_remember_contents` sau khi commit).
+        """
+        contents = {content_hash(row["content"]): row["content"] for row in rows}
+        self._store_contents(conn, contents)
+
+        table = partition_table(name)
+        plain = []
+        ids = []
+        for row in rows:
+            compact, details = split_details(row["result"])
+            values = {
+                "time": row["time"], "type": row["type"], "label": (row["result"] or {}).get("label"),
+                "content_hash": content_hash(row["content"]),
+                "result": encode_result(compact) if compact is not None else None,
+                "level": row["level"]
+            }
+            if details is None and not return_ids:
+                plain.append(values)
+                continue
+
+            # Cần id để ghi bảng phụ: ghi từng dòng
+            row_id = conn.execute(insert(table).values(**values)).inserted_primary_key[0]
+            if details is not None:
+                conn.execute(insert(details_table(name)).values(alert_id=row_id, details=encode_result(details)))
+            ids.append(row_id)
+
+        if plain:
+            conn.execute(insert(table), plain)
+        return ids, list(contents)
+
+    def _write_partition(self, conn, name: str, rows: list, return_ids: bool = False):
+        """
+        Như `_write`, nhưng đọc lại status của partition trong chính transaction (FOR SHARE:
+        archive_expired phải chờ các lần ghi đang chạy) thay vì tin `_known`, vì partition có thể
+        vừa bị process khác archive. Alert thuộc partition đã archive được nối vào file archive
+        (id None), không tạo lại bảng; partition đang archive thì báo lỗi để ghi lại sau.
+        """
+        status = conn.execute(
+            select(partitions_table.c.status).where(partitions_table.c.name == name).with_for_update(read=True)
+        ).scalar()
+        if status == "active":
+            return self._write(conn, name, rows, return_ids)
+
+        self._known.discard(name)
+        if status != "archived":
+            raise RuntimeError(f"Alert partition {name} is {status or 'missing'}, retry later")
+        self._append_archive(conn, name, rows)
+        return [None] * len(rows), []
+
+    def _append_archive(self, conn, name: str, rows: list):
+        """Nối alert vào file archive (gzip nhiều member) và cộng vào thống kê của partition đã archive"""
+        partition = conn.execute(select(partitions_table).where(partitions_table.c.name == name)).mappings().first()
+        stats = {alert_type: dict(labels) for alert_type, labels in (partition["stats"] or {}).items()}
+        for row in rows:
+            labels = stats.setdefault(row["type"], {})
+            label = (row["result"] or {}).get("label")
+            labels[label] = labels.get(label, 0) + 1
+        path = partition["archive_path"] or os.path.join(self.config["archive_dir"], f"{name}.jsonl.gz")
+
+        # Cập nhật registry trước khi ghi file: khoá dòng registry để hai process không nối file cùng lúc
+        conn.execute(update(partitions_table).where(partitions_table.c.name == name).values(
+            stats=stats, row_count=(partition["row_count"] or 0) + len(rows), archive_path=path
+        ))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for row in rows:
+                alert = {"id": None, "time": row["time"], "type": row["type"], "content": row["content"],
+                         "result": row["result"], "level": row["level"]}
+                f.write(json.dumps(alert, ensure_ascii=False, default=str) + "\n")
+        logger.warning("Appended %d alert(s) to archived partition %s", len(rows), name)
+        self._invalidate()
+
+    def insert_alert(self, alert_type: str, content: str, result: dict, level: str = "warning",
+                     moment: datetime.datetime = None) -> dict:
+        """Ghi một alert, trả về alert đã lưu (có id và time, result đầy đủ; id None nếu vào file archive)"""
+        moment = moment or datetime.datetime.utcnow()
+        name = self._ensure_partition(moment)
+        row = {"time": moment, "type": alert_type, "content": content, "result": result, "level": level}
+        with engine.begin() as conn:
+            ids, digests = self._write_partition(conn, name, [row], return_ids=True)
+        self._remember_contents(digests)
+        return dict(row, id=_alert_id(name, ids[0]) if ids[0] is not None else None)
+
+    async def insert_alert_async(self, alert_type: str, content: str, result: dict, level: str = "warning") -> dict:
+        """Như insert_alert, qua kết nối async (dùng trong route / log_alert)"""
+        moment = datetime.datetime.utcnow()
+        name = await self._ensure_partition_async(moment)
+        row = {"time": moment, "type": alert_type, "content": content, "result": result, "level": level}
+        async with get_async_engine().begin() as conn:
+            ids, digests = await conn.run_sync(self._write_partition, name, [row], True)
+        self._remember_contents(digests)
+        return dict(row, id=_alert_id(name, ids[0]) if ids[0] is not None else None)
+
+    def insert_alerts(self, rows: list) -> int:
+        """
+        Ghi nhiều alert theo lô; mỗi row có type, content, result, level và time (tuỳ chọn).
+        Alert có time thuộc partition đã archive được nối vào file archive của partition đó.
+        """
+        grouped = {}
+        for row in rows:
+            moment = row.get("time") or datetime.datetime.utcnow()
+            grouped.setdefault(self._ensure_partition(moment), []).append({
+                "time": moment, "type": row["type"], "content": row.get("content"),
+                "result": row.get("result"), "level": row.get("level", "warning")
+            })
+
+        digests = []
+        with engine.begin() as conn:
+            for name, partition_rows in grouped.items():
+                digests.extend(self._write_partition(conn, name, partition_rows)[1])
+        self._remember_contents(digests)
+
+        # Ghi vào partition đã đóng (vd. migrate dữ liệu cũ) thì thống kê tính sẵn không còn đúng
+        sealed = [p["name"] for p in self.partitions() if p["name"] in grouped and p["status"] == "active" and p["stats"] is not None]
+        if sealed:
+            db = SessionLocal()
+            try:
+                db.query(AlertPartition).filter(AlertPartition.name.in_(sealed)).update(
+                    {AlertPartition.stats: None, AlertPartition.row_count: None}, synchronize_session=False
+                )
+                db.commit()
+            finally:
+                db.close()
+            self._invalidate()
+        return len(rows)
+
+    # --- Đọc ---
+
+    def _recent(self, conn, partitions: list, limit: int, since=None, until=None, alert_type=None) -> list:
+        alerts = []
+        for partition in partitions:
+            if partition["status"] != "active":
+                continue
+            table = partition_table(partition["name"])
+            query = _select_alerts(table).order_by(table.c.time.desc()).limit(limit - len(alerts))
+            if since is not None:
+                query = query.where(table.c.time >= since)
+            if until is not None:
+                query = query.where(table.c.time < until)
+            if alert_type:
+                query = query.where(table.c.type == alert_type)
+
+            # Result chỉ được giải nén khi response được serialize
+            alerts.extend(_to_alert(partition["name"], row) for row in conn.execute(query).mappings())
+            if len(alerts) >= limit:
+                break
+        return alerts
+
+    def recent_alerts(self, limit: int = 20, since: datetime.datetime = None, until: datetime.datetime = None,
+                      alert_type: str = None) -> list:
+        """Alert mới nhất trong khoảng thời gian; dừng ở partition đầu tiên đủ `limit`"""
+        since, until = _utc(since), _utc(until)
+        with engine.connect() as conn:
+            return self._recent(conn, self.partitions(since, until), limit, since, until, alert_type)
+
+    async def recent_alerts_async(self, limit: int = 20, since: datetime.datetime = None, until: datetime.datetime = None,
+                                  alert_type: str = None) -> list:
+        """Như recent_alerts, đọc từ replica nếu có"""
+        since, until = _utc(since), _utc(until)
+        partitions = await self.partitions_async(since, until)
+        async with get_async_engine(readonly=True).connect() as conn:
+            return await conn.run_sync(self._recent, partitions, limit, since, until, alert_type)
+
+    def _details(self, conn, name: str, row_id: int):
+        table = details_table(name)
+        data = conn.execute(select(table.c.details).where(table.c.alert_id == row_id)).scalar()
+        return decode_result(data) if data is not None else None
+
+    def alert_details(self, alert_id: str):
+        """Chi tiết lớn của một alert (vd. các frame video), None nếu không có"""
+        name, row_id = _parse_alert_id(alert_id)
+        if not any(p["name"] == name and p["status"] == "active" for p in self.partitions()):
+            return None
+        with engine.connect() as conn:
+            return self._details(conn, name, row_id)
+
+    async def alert_details_async(self, alert_id: str):
+        name, row_id = _parse_alert_id(alert_id)
+        if not any(p["name"] == name and p["status"] == "active" for p in await self.partitions_async()):
+            return None
+        async with get_async_engine(readonly=True).connect() as conn:
+            return await conn.run_sync(self._details, name, row_id)
+
+    def _stats(self, conn, partitions: list, since=None, until=None) -> dict:
+        labels_by_type = {}
+        scanned = 0
+        for partition in partitions:
+            covered = (since is None or since <= partition["start"]) and (until is None or until >= partition["end"])
+            if covered and partition["stats"] is not None:
+                _merge_stats(labels_by_type, partition["stats"])
+                continue
+            if partition["status"] != "active":
+                continue
+
+            _merge_stats(labels_by_type, self._count(conn, partition["name"], since, until))
+            scanned += 1
+
+        return {
+            "total_alerts": sum(sum(labels.values()) for labels in labels_by_type.values()),
+            "alerts_by_type": {alert_type: sum(labels.values()) for alert_type, labels in labels_by_type.items()},
+            "labels_by_type": labels_by_type,
+            "partitions_scanned": scanned
+        }
+
+    def alert_stats(self, since: datetime.datetime = None, until: datetime.datetime = None) -> dict:
+        """
+        Số alert theo type và label trong khoảng thời gian. Partition nằm trọn trong khoảng
+        và đã có thống kê tính sẵn thì không phải query; partition đã archive chỉ được tính
+        khi nằm trọn trong khoảng.
+        """
+        since, until = _utc(since), _utc(until)
+        with engine.connect() as conn:
+            return self._stats(conn, self.partitions(since, until), since, until)
+
+    async def alert_stats_async(self, since: datetime.datetime = None, until: datetime.datetime = None) -> dict:
+        """Như alert_stats, đọc từ replica nếu có"""
+        since, until = _utc(since), _utc(until)
+        partitions = await self.partitions_async(since, until)
+        async with get_async_engine(readonly=True).connect() as conn:
+            return await conn.run_sync(self._stats, partitions, since, until)
+
+    def _count(self, conn, name: str, since=None, until=None) -> dict:
+        table = partition_table(name)
+        query = select(table.c.type, table.c.label, func.count()).group_by(table.c.type, table.c.label)
+        if since is not None:
+            query = query.where(table.c.time >= since)
+        if until is not None:
+            query = query.where(table.c.time < until)
+
+        stats = {}
+        for alert_type, label, count in conn.execute(query):
+            stats.setdefault(alert_type, {})[label] = count
+        return stats
+
+    # --- Bảo trì ---
+
+    def migrate_legacy(self, batch_size: int = None) -> int:
+        """Chuyển một lô alert cũ nhất từ bảng `alerts` sang partition; trả về số alert đã chuyển"""
+        batch_size = batch_size or self.config["migrate_batch_size"]
+        db = SessionLocal()
+        try:
+            alerts = db.query(Alert).order_by(Alert.time, Alert.id).limit(batch_size).all()
+            if not alerts:
+                return 0
+
+            self.insert_alerts([
+                {
+                    "time": alert.time or datetime.datetime.utcnow(), "type": alert.type, "content": alert.content,
+                    "result": alert.result, "level": alert.level
+                }
+                for alert in alerts
+            ])
+            db.query(Alert).filter(Alert.id.in_([alert.id for alert in alerts])).delete(synchronize_session=False)
+            db.commit()
+            return len(alerts)
+        finally:
+            db.close()
+
+    def seal_partitions(self) -> int:
+        """Tính sẵn thống kê cho các partition đã đóng"""
+        now = datetime.datetime.utcnow()
+        sealed = 0
+        for partition in self.partitions():
+            if partition["status"] != "active" or partition["stats"] is not None or partition["end"] > now:
+                continue
+            with engine.connect() as conn:
+                stats = self._count(conn, partition["name"])
+            self._update(partition["name"], stats=stats, row_count=sum(sum(labels.values()) for labels in stats.values()))
+            sealed += 1
+        return sealed
+
+    def archive_expired(self) -> list:
+        """Xuất partition quá hạn ra file JSONL gzip rồi xoá bảng"""
+        retention_days = self.config["retention_days"]
+        if not retention_days:
+            return []
+
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+        archived = []
+        for partition in self.partitions():
+            # "archiving": lượt trước bị ngắt giữa chừng, làm lại
+            if partition["status"] not in ("active", "archiving") or partition["end"] > cutoff:
+                continue
+            name = partition["name"]
+            # Đổi status trước khi xuất: lần ghi đang chạy (giữ khoá FOR SHARE) được chờ xong,
+            # lần ghi sau đó ở mọi process thấy partition không còn active và không ghi vào bảng nữa
+            self._update(name, status="archiving")
+            table = partition_table(name)
+            details = details_table(name)
+            os.makedirs(self.config["archive_dir"], exist_ok=True)
+            path = os.path.join(self.config["archive_dir"], f"{name}.jsonl.gz")
+
+            # Ghi ra file tạm rồi đổi tên: file archive luôn đầy đủ hoặc không có.
+            # File archive chứa alert đầy đủ (nội dung, result đã giải mã, chi tiết) để đọc được không cần DB.
+            stats = {}
+            query = select(table, content_table.c.content, details.c.details).select_from(
+                table
+                .outerjoin(content_table, table.c.content_hash == content_table.c.hash)
+                .outerjoin(details, details.c.alert_id == table.c.id)
+            ).order_by(table.c.time)
+            with engine.connect() as conn, gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                rows = conn.execution_options(stream_results=True).execute(query)
+                for row in rows.mappings():
+                    labels = stats.setdefault(row["type"], {})
+                    labels[row["label"]] = labels.get(row["label"], 0) + 1
+                    alert = _to_alert(name, row)
+                    result = dict(alert["result"] or {})
+                    result.pop("details_count", None)
+                    if row["details"] is not None:
+                        result.update(decode_result(row["details"]))
+                    alert["result"] = result
+                    f.write(json.dumps(alert, ensure_ascii=False, default=str) + "\n")
+            os.replace(path + ".tmp", path)
+
+            self._update(
+                name, status="archived", archive_path=path, stats=stats,
+                row_count=sum(sum(labels.values()) for labels in stats.values())
+            )
+            for dropped in (details, table):
+                dropped.drop(bind=engine, checkfirst=True)
+                _metadata.remove(dropped)
+            self._known.discard(name)
+            archived.append(name)
+            logger.info("Archived alert partition %s to %s", name, path)
+        if archived:
+            self.prune_contents(cutoff)
+        return archived
+
+    def prune_contents(self, cutoff: datetime.datetime) -> int:
+        """Xoá nội dung tạo trước `cutoff` không còn partition nào tham chiếu"""
+        # Partition đang archive vẫn còn bảng và vẫn tham chiếu nội dung
+        names = [p["name"] for p in self.partitions() if p["status"] != "archived"]
+        query = delete(content_table).where(content_table.c.created_at < cutoff)
+        if names:
+            selects = [select(partition_table(name).c.content_hash) for name in names]
+            referenced = union(*selects) if len(selects) > 1 else selects[0]
+            query = query.where(content_table.c.hash.not_in(referenced))
+        with engine.begin() as conn:
+            deleted = conn.execute(query).rowcount
+        self._content_cache.clear()
+        logger.info("Pruned %d unreferenced alert contents", deleted)
+        return deleted
+
+    def _update(self, name: str, **values):
+        db = SessionLocal()
+        try:
+            db.query(AlertPartition).filter(AlertPartition.name == name).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self._invalidate()
+
+    def run_maintenance(self, max_migrate_batches: int = 20) -> dict:
+        """Một lượt bảo trì: migrate bảng cũ (giới hạn số lô mỗi lượt), đóng và archive partition"""
+        migrated = 0
+        for _ in range(max_migrate_batches):
+            moved = self.migrate_legacy()
+            migrated += moved
+            if moved < self.config["migrate_batch_size"]:
+                break
+        else:
+            # Còn dữ liệu cũ: chưa đóng partition vì lượt sau có thể ghi thêm vào
+            return {"migrated": migrated, "sealed": 0, "archived": []}
+
+        report = {"migrated": migrated, "sealed": self.seal_partitions(), "archived": self.archive_expired()}
+        if migrated or report["sealed"] or report["archived"]:
+            logger.info("Alert store maintenance: %s", report)
+        return report
+
+    # --- Vòng đời ---
+
+    async def start(self):
+        self._task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _maintenance_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.run_maintenance)
+            except Exception as e:
+                logger.error("Alert store maintenance failed: %s", e)
+            await asyncio.sleep(self.config["maintenance_interval_seconds"])
+
+alert_store = AlertStore()
+
+def main(argv=None):
+    import argparse
+    from src.utils.log import configure_logging
+
+    parser = argparse.ArgumentParser(description="Bảo trì partition alert")
+    parser.add_argument("command", nargs="?", default="maintain", choices=("maintain", "migrate", "list"))
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if args.command == "migrate":
+        total = 0
+        while True:
+            moved = alert_store.migrate_legacy()
+            total += moved
+            if not moved:
+                break
+        report = {"migrated": total}
+    elif args.command == "list":
+        report = alert_store.partitions()
+    else:
+        report = alert_store.run_maintenance(max_migrate_batches=sys.maxsize)
+    json.dump(report, sys.stdout, indent=2, default=str)
+    print()
+
+if __name__ == "__main__":
+    main()
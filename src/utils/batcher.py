@@ -0,0 +1,94 @@
+import logging
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Gom các item được gửi gần nhau (kể cả từ nhiều request khác nhau) thành một batch
+    để model chạy chung một lần forward.
+
+    `process_fn` nhận list item và trả về list kết quả cùng thứ tự.
+    Worker chạy trên một thread riêng nên dùng được cả từ code sync lẫn async.
+    """
+
+    def __init__(self, process_fn, max_batch_size: int = 16, max_wait: float = 0.01, name: str = "batcher"):
+        self.process_fn = process_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item) -> Future:
+        """Đưa item vào hàng đợi, trả về Future chứa kết quả"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    async def run(self, item):
+        """Phiên bản async của submit()"""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    @staticmethod
+    def _add(batch: list, entry):
+        # Người gọi đã huỷ (client ngắt kết nối, stream đóng) thì bỏ item, không chạy model;
+        # sau lệnh này Future không thể bị huỷ nữa
+        if entry[1].set_running_or_notify_cancel():
+            batch.append(entry)
+
+    def _collect_batch(self):
+        batch = []
+        self._add(batch, self._queue.get())
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Hết thời gian chờ, chỉ lấy thêm những item đã có sẵn trong hàng đợi
+                    self._add(batch, self._queue.get_nowait())
+                else:
+                    self._add(batch, self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+
+            try:
+                results = self.process_fn(items)
+            except Exception as e:
+                logger.error("Batch failed in %s: %s", self.name, e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Mỗi Future được trả kết quả riêng: lỗi ở một Future không ảnh hưởng các Future khác
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,28 @@
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# Đường dẫn config có thể đổi qua biến môi trường (dùng cho benchmark / nhiều môi trường deploy)
+CONFIG_PATH = os.environ.get("AICP_CONFIG", "config.json")
+
+_config = None
+
+def load_config(reload: bool = False) -> dict:
+    """Đọc config.json một lần và cache lại; trả về {} nếu không có file"""
+    global _config
+    if _config is None or reload:
+        try:
+            with open(CONFIG_PATH, encoding="utf-8") as f:
+                _config = json.load(f)
+        except FileNotFoundError:
+            logger.warning("%s not found. Using defaults.", CONFIG_PATH)
+            _config = {}
+    return _config
+
+def get_section(name: str, defaults: dict = None) -> dict:
+    """Lấy một section của config, các key thiếu được lấy từ defaults"""
+    section = dict(defaults or {})
+    section.update(load_config().get(name, {}))
+    return section
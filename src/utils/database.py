@@ -1,32 +1,60 @@
-import json
 import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, Boolean
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from src.utils.config import get_section
 
-# Đọc config
-with open("config.json") as f:
-    DATABASE_URL = json.load(f)["database"]["url"]
-
-# Tạo engine với connection pool rất nhỏ (phù hợp Supabase free-tier)
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=1,          # chỉ giữ 1 kết nối sẵn
-    max_overflow=2,       # thêm tối đa 2 kết nối tạm
-    pool_timeout=10,      # chờ 10s trước khi báo lỗi
-    pool_recycle=300,     # recycle sau 5 phút để tránh connection die
-    pool_pre_ping=True,   # tự check kết nối trước khi dùng
-    connect_args={
-        "connect_timeout": 10,
-        "application_name": "AI-Child-Protection"
-    }
-)
+# Đọc config (đường dẫn đổi được qua AICP_CONFIG).
+# Mặc định pool rất nhỏ (phù hợp Supabase free-tier); deployment lớn hơn tăng trong config.
+DATABASE_CONFIG = get_section("database", {
+    # Replica chỉ đọc cho query dashboard (/api/alerts, /api/stats); rỗng = dùng DB chính
+    "replica_url": "",
+    "pool_size": 1,                  # số kết nối giữ sẵn
+    "max_overflow": 2,               # thêm tối đa bấy nhiêu kết nối tạm
+    "pool_timeout": 10,              # chờ lấy kết nối từ pool (giây) trước khi báo lỗi
+    "pool_recycle": 300,             # recycle sau 5 phút để tránh connection die
+    "connect_timeout": 10,
+    "command_timeout": 30,           # timeout mỗi câu lệnh (async, giây)
+    # Số prepared statement asyncpg cache mỗi kết nối; đặt 0 khi đi qua PgBouncer transaction mode
+    "statement_cache_size": 100,
+    # Số câu SQL đã compile SQLAlchemy cache mỗi engine
+    "query_cache_size": 500
+})
+DATABASE_URL = DATABASE_CONFIG["url"]
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _create_sync_engine(url: str):
+    if _is_sqlite(url):
+        # SQLite (benchmark / chạy local): không dùng pool và tham số riêng của Postgres
+        return create_engine(url, connect_args={"check_same_thread": False},
+                             query_cache_size=DATABASE_CONFIG["query_cache_size"])
+
+    return create_engine(
+        url,
+        pool_size=DATABASE_CONFIG["pool_size"],
+        max_overflow=DATABASE_CONFIG["max_overflow"],
+        pool_timeout=DATABASE_CONFIG["pool_timeout"],
+        pool_recycle=DATABASE_CONFIG["pool_recycle"],
+        pool_pre_ping=True,   # tự check kết nối trước khi dùng
+        query_cache_size=DATABASE_CONFIG["query_cache_size"],
+        connect_args={
+            "connect_timeout": DATABASE_CONFIG["connect_timeout"],
+            "application_name": "AI-Child-Protection"
+        }
+    )
+
+# Engine đồng bộ: job nền, bảo trì partition, bulk scan, script
+engine = _create_sync_engine(DATABASE_URL)
 
 # Session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-# Model Alert
+# Model Alert: bảng cũ (một bảng duy nhất). Alert mới được ghi vào các bảng
+# theo thời gian alerts_YYYYMM (xem src/utils/alert_store.py); dữ liệu cũ được chuyển dần sang
 class Alert(Base):
     __tablename__ = "alerts"
 
@@ -37,6 +65,63 @@ class Alert(Base):
     result = Column(JSON)
     level = Column(String, default="warning")
 
+# Model Job: công việc phân tích chạy nền (video/audio dài)
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, index=True)
+    status = Column(String, index=True, default="queued")
+    filename = Column(String)
+    source = Column(String)
+    # Thiết bị có profile gửi job (None = policy mặc định); policy được lấy lại lúc job chạy
+    device_id = Column(String)
+    progress = Column(JSON)
+    result = Column(JSON)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
+# Model AlertPartition: danh sách các partition alert theo thời gian
+class AlertPartition(Base):
+    __tablename__ = "alert_partitions"
+
+    name = Column(String, primary_key=True)      # tên bảng, vd. alerts_202406
+    start = Column(DateTime, index=True)         # [start, end)
+    end = Column(DateTime, index=True)
+    status = Column(String, default="active")    # active | archived
+    row_count = Column(Integer)
+    # Thống kê type/label tính sẵn khi partition đã đóng (không còn nhận alert mới)
+    stats = Column(JSON)
+    archive_path = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+# Model AlertContent: nội dung alert lưu một lần theo hash, các partition chỉ tham chiếu
+class AlertContent(Base):
+    __tablename__ = "alert_contents"
+
+    hash = Column(String(32), primary_key=True)
+    content = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+# Profile chính sách của từng trẻ / thiết bị (xem src/utils/policy.py)
+class ChildProfile(Base):
+    __tablename__ = "child_profiles"
+
+    device_id = Column(String, primary_key=True)   # giá trị header X-Device-Id
+    name = Column(String)
+    age_band = Column(String)                      # under_9 | 9_12 | 13_15 | 16_17
+    sensitivity = Column(String)                   # high | normal | low
+    categories = Column(JSON)                      # nhóm nội dung text được theo dõi; null = tất cả
+    allowed_domains = Column(JSON)
+    blocked_domains = Column(JSON)
+    allowlist_only = Column(Boolean, default=False)
+    url_fetch = Column(Boolean, default=True)
+    text_model = Column(Boolean, default=True)
+    video_audio = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
 # Tạo bảng (chỉ chạy 1 lần lúc start app)
 Base.metadata.create_all(bind=engine)
 
@@ -47,3 +132,67 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# --- Async (route FastAPI) ---
+# Engine async được tạo lúc dùng lần đầu (trong event loop), không phải lúc import
+
+_async_engines = {}
+
+def async_url(url: str) -> str:
+    """Đổi URL sang driver async: postgresql -> asyncpg, sqlite -> aiosqlite"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+        # Cache prepared statement phía SQLAlchemy cùng cỡ với asyncpg
+        parsed = parsed.update_query_dict({"prepared_statement_cache_size": str(DATABASE_CONFIG["statement_cache_size"])})
+    elif parsed.get_backend_name() == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+def _create_async_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    if _is_sqlite(url):
+        return create_async_engine(async_url(url), query_cache_size=DATABASE_CONFIG["query_cache_size"])
+
+    return create_async_engine(
+        async_url(url),
+        pool_size=DATABASE_CONFIG["pool_size"],
+        max_overflow=DATABASE_CONFIG["max_overflow"],
+        pool_timeout=DATABASE_CONFIG["pool_timeout"],
+        pool_recycle=DATABASE_CONFIG["pool_recycle"],
+        pool_pre_ping=True,
+        query_cache_size=DATABASE_CONFIG["query_cache_size"],
+        connect_args={
+            "timeout": DATABASE_CONFIG["connect_timeout"],
+            "command_timeout": DATABASE_CONFIG["command_timeout"],
+            "statement_cache_size": DATABASE_CONFIG["statement_cache_size"],
+            "server_settings": {"application_name": "AI-Child-Protection"}
+        }
+    )
+
+def get_async_engine(readonly: bool = False):
+    """Engine async cho DB chính, hoặc cho replica nếu `readonly` và có cấu hình replica_url"""
+    url = DATABASE_CONFIG["replica_url"] if readonly and DATABASE_CONFIG["replica_url"] else DATABASE_URL
+    async_engine = _async_engines.get(url)
+    if async_engine is None:
+        async_engine = _async_engines[url] = _create_async_engine(url)
+    return async_engine
+
+def async_session(readonly: bool = False):
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    return AsyncSession(get_async_engine(readonly), expire_on_commit=False)
+
+async def get_async_db():
+    async with async_session() as db:
+        yield db
+
+async def get_async_read_db():
+    async with async_session(readonly=True) as db:
+        yield db
+
+async def dispose_async_engines():
+    for async_engine in _async_engines.values():
+        await async_engine.dispose()
+    _async_engines.clear()
@@ -0,0 +1,306 @@
+import logging
+import asyncio
+import datetime
+import os
+import time
+import uuid
+from sqlalchemy import and_, or_
+from src.utils.config import get_section
+from src.utils.database import SessionLocal, Job
+from src.routers.websocket_router import broadcast_job_update
+from src.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+JOBS_CONFIG = get_section("jobs", {
+    "max_workers": 2,
+    # Kết quả được giữ lại trong bao lâu sau khi job kết thúc
+    "result_ttl_seconds": 3600,
+    # Ghi tiến độ xuống DB tối đa mỗi khoảng này (tiến độ mới nhất luôn có trong bộ nhớ)
+    "progress_persist_seconds": 2.0,
+    # Job "running" không được worker nào gia hạn (cập nhật updated_at) quá khoảng này thì
+    # coi như worker đã chết, worker khác được nhận lại
+    "lease_seconds": 60
+})
+
+# Thư mục giữ file upload của job cho tới khi job xong (để chạy lại được sau khi restart)
+JOBS_DIR = os.path.join("temp", "jobs")
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "filename": job.filename,
+        "progress": job.progress or {},
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None
+    }
+
+class JobManager:
+    """
+    Hàng đợi job phân tích chạy nền với số worker giới hạn.
+    Trạng thái job lưu trong bảng `jobs`; job chưa xong được đưa lại vào hàng đợi khi khởi động.
+    Nhiều process (worker uvicorn) dùng chung bảng: job chỉ được chạy sau khi nhận (claim) bằng
+    một câu UPDATE có điều kiện; job đang chạy được gia hạn lease định kỳ, job mất lease
+    (process chết) được process khác nhận lại.
+
+    Handler đăng ký theo loại job: `async def handler(job: dict, report_progress) -> dict`.
+    `report_progress(progress: dict)` gọi được từ bất kỳ thread nào.
+    Truy vấn DB (engine đồng bộ) chạy trong thread pool, không chặn event loop.
+    """
+
+    def __init__(self, max_workers: int = JOBS_CONFIG["max_workers"], ttl_seconds: int = JOBS_CONFIG["result_ttl_seconds"],
+                 lease_seconds: float = JOBS_CONFIG["lease_seconds"]):
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.handlers = {}
+        self._queue = None
+        self._tasks = []
+        self._loop = None
+        self._progress = {}
+        self._progress_saved_at = {}
+        # Job đang nằm trong hàng đợi của process này (không đưa vào lần nữa khi quét lại)
+        self._queued = set()
+
+    def register(self, kind: str, handler):
+        self.handlers[kind] = handler
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # --- Vòng đời ---
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+        self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+        await self._requeue_unfinished()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    # --- API ---
+
+    async def submit(self, kind: str, filename: str, source: str, device_id: str = None) -> str:
+        """`device_id`: thiết bị có profile gửi job, handler nhận lại trong `job["device_id"]`"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = str(uuid.uuid4())
+        await self._db(self._insert, Job(
+            id=job_id, kind=kind, status="queued", filename=filename, source=source, device_id=device_id, progress={}
+        ))
+
+        await self._enqueue(job_id)
+        logger.info("%s job %s queued", kind, job_id)
+        return job_id
+
+    async def get(self, job_id: str):
+        """Trạng thái job (None nếu không tồn tại hoặc đã hết hạn)"""
+        data = await self._db(self._load, job_id, live_only=True)
+        if data is None:
+            return None
+        data.pop("source")
+        data.pop("device_id")
+
+        # Tiến độ trong bộ nhớ luôn mới hơn bản đã ghi DB
+        if job_id in self._progress:
+            data["progress"] = self._progress[job_id]
+        return data
+
+    # --- DB (chạy trong thread pool) ---
+
+    async def _db(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    @staticmethod
+    def _insert(job: Job):
+        db = SessionLocal()
+        try:
+            db.add(job)
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _load(job_id: str, live_only: bool = False):
+        """Job dạng dict kèm `source` và `device_id`; `live_only`: None nếu job đã hết hạn"""
+        db = SessionLocal()
+        try:
+            job = db.get(Job, job_id)
+            if job is None or (live_only and job.expires_at and job.expires_at < datetime.datetime.utcnow()):
+                return None
+            return dict(job_to_dict(job), source=job.source, device_id=job.device_id)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _update(job_id: str, **fields):
+        db = SessionLocal()
+        try:
+            job = db.get(Job, job_id)
+            if job is None:
+                return None
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = datetime.datetime.utcnow()
+            db.commit()
+            return job_to_dict(job)
+        finally:
+            db.close()
+
+    def _claimable(self, now: datetime.datetime):
+        # Job đang chờ, hoặc đang chạy nhưng lease đã hết (process chạy nó đã chết)
+        stale = now - datetime.timedelta(seconds=self.lease_seconds)
+        return or_(Job.status == "queued", and_(Job.status == "running", Job.updated_at < stale))
+
+    def _claim(self, job_id: str) -> bool:
+        """Nhận job để chạy; UPDATE có điều kiện nên chỉ một process nhận được"""
+        db = SessionLocal()
+        try:
+            now = datetime.datetime.utcnow()
+            claimed = db.query(Job).filter(Job.id == job_id, self._claimable(now)).update(
+                {"status": "running", "updated_at": now}, synchronize_session=False
+            )
+            db.commit()
+            return claimed == 1
+        finally:
+            db.close()
+
+    def _claimable_ids(self) -> list:
+        db = SessionLocal()
+        try:
+            jobs = db.query(Job.id).filter(self._claimable(datetime.datetime.utcnow())).order_by(Job.created_at).all()
+            return [job.id for job in jobs]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _renew_lease(job_id: str):
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(Job.id == job_id, Job.status == "running").update(
+                {"updated_at": datetime.datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _delete_expired() -> int:
+        db = SessionLocal()
+        try:
+            deleted = db.query(Job).filter(Job.expires_at < datetime.datetime.utcnow()).delete()
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    # --- Nội bộ ---
+
+    async def _requeue_unfinished(self):
+        """Đưa vào hàng đợi các job chưa có process nào chạy (process khác sẽ không nhận trùng nhờ _claim)"""
+        job_ids = [job_id for job_id in await self._db(self._claimable_ids) if job_id not in self._queued]
+        for job_id in job_ids:
+            await self._enqueue(job_id)
+        if job_ids:
+            logger.info("Re-enqueued %d unfinished job(s)", len(job_ids))
+
+    async def _enqueue(self, job_id: str):
+        self._queued.add(job_id)
+        await self._queue.put(job_id)
+
+    def _make_progress_reporter(self, job_id: str):
+        def report_progress(progress: dict):
+            self._loop.call_soon_threadsafe(self._publish_progress, job_id, dict(progress))
+        return report_progress
+
+    def _publish_progress(self, job_id: str, progress: dict):
+        self._progress[job_id] = progress
+        asyncio.create_task(broadcast_job_update({"job_id": job_id, "status": "running", "progress": progress}))
+
+        now = time.monotonic()
+        if now - self._progress_saved_at.get(job_id, 0.0) >= JOBS_CONFIG["progress_persist_seconds"]:
+            self._progress_saved_at[job_id] = now
+            asyncio.create_task(self._save_progress(job_id, progress))
+
+    async def _save_progress(self, job_id: str, progress: dict):
+        try:
+            await self._db(self._update, job_id, progress=progress)
+        except Exception as e:
+            logger.warning("Failed to save progress of job %s: %s", job_id, e)
+
+    async def _keep_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._db(self._renew_lease, job_id)
+            except Exception as e:
+                logger.warning("Failed to renew lease of job %s: %s", job_id, e)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                # Lỗi DB... không được làm chết worker
+                logger.error("Job %s failed: %s", job_id, e)
+
+    async def _run_job(self, job_id: str):
+        if not await self._db(self._claim, job_id):
+            # Process khác đã nhận job (hoặc job đã xong / đã bị xoá)
+            return
+        job = await self._db(self._load, job_id)
+        if job is None:
+            return
+
+        source = job.pop("source")
+        lease = asyncio.create_task(self._keep_lease(job_id))
+        try:
+            # Job chạy ngoài request nên mỗi job là một trace riêng
+            with span(f"job {job['kind']}", job_id=job_id):
+                result = await self.handlers[job["kind"]](dict(job, source=source), self._make_progress_reporter(job_id))
+            fields = {"status": "done", "result": result, "error": None}
+        except Exception as e:
+            logger.error("Job %s failed: %s", job_id, e)
+            fields = {"status": "failed", "error": str(e)}
+        finally:
+            lease.cancel()
+
+        fields["progress"] = self._progress.pop(job_id, job["progress"])
+        fields["expires_at"] = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl_seconds)
+        self._progress_saved_at.pop(job_id, None)
+
+        job = await self._db(self._update, job_id, **fields)
+        self._remove_source(source)
+        await broadcast_job_update(job)
+        logger.info("Job %s %s", job_id, fields["status"])
+
+    def _remove_source(self, source: str):
+        # Chỉ xoá file upload do job tạo ra, không đụng tới URL
+        if source and source.startswith(JOBS_DIR) and os.path.exists(source):
+            os.remove(source)
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                deleted = await self._db(self._delete_expired)
+                if deleted:
+                    logger.info("Removed %d expired job(s)", deleted)
+                # Job của process đã chết (lease hết hạn) được nhận lại
+                await self._requeue_unfinished()
+            except Exception as e:
+                logger.error("Job cleanup failed: %s", e)
+
+job_manager = JobManager()
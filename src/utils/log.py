@@ -0,0 +1,42 @@
+import json
+import logging
+import os
+import sys
+from src.utils.config import get_section
+
+LOGGING_CONFIG = get_section("logging", {
+    "level": "INFO",
+    # "text" cho dev, "json" cho môi trường chạy thật (mỗi dòng một object)
+    "format": "text"
+})
+
+# Các field chuẩn của LogRecord, phần còn lại (truyền qua extra=) được đưa vào JSON
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging():
+    """Cấu hình logging cho package `src`; mức log có thể override bằng biến môi trường AICP_LOG_LEVEL"""
+    level = os.environ.get("AICP_LOG_LEVEL", LOGGING_CONFIG["level"]).upper()
+
+    handler = logging.StreamHandler(sys.stderr)
+    if LOGGING_CONFIG["format"] == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+
+    root = logging.getLogger("src")
+    root.handlers = [handler]
+    root.setLevel(level)
+    root.propagate = False
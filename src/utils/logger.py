@@ -1,8 +1,14 @@
+import logging
 import json
 import os
 import datetime
-from src.utils.database import SessionLocal, Alert
+from src.utils.alert_store import alert_store
 from src.routers.websocket_router import broadcast_alert, broadcast_stats
+from src.utils.metrics import DB_WRITE_SECONDS
+from src.utils.response_cache import alert_version
+from src.utils.tracing import span
+
+logger = logging.getLogger(__name__)
 
 # Fallback JSON file
 LOG_FILE = "logs/alerts.json"
@@ -11,52 +17,40 @@ async def log_alert(alert_type: str, content: str, result: dict, level: str = "w
     """
     Hybrid logging: Try database first, fallback to JSON file
     """
-    # Try database first
-    db_logged = await try_database_logging(alert_type, content, result, level)
+    with span("log_alert", alert_type=alert_type) as alert_span:
+        # Try database first
+        db_logged = await try_database_logging(alert_type, content, result, level)
+
+        # If database fails, use JSON fallback
+        if not db_logged:
+            try_json_fallback(alert_type, content, result, level)
 
-    # If database fails, use JSON fallback
-    if not db_logged:
-        try_json_fallback(alert_type, content, result, level)
+        # Response đã cache của /api/alerts, /api/stats hết hiệu lực
+        alert_version.bump()
+
+        if alert_span is not None:
+            alert_span.set(backend="database" if db_logged else "json")
 
 async def try_database_logging(alert_type: str, content: str, result: dict, level: str = "warning"):
     """Try to log to database and broadcast via WebSocket"""
     try:
-        db = SessionLocal()
-        new_alert = Alert(
-            type=alert_type,
-            content=content,
-            result=result,
-            level=level
-        )
-        db.add(new_alert)
-        db.commit()
-        db.refresh(new_alert)
-        print(f"[DB LOGGED] Alert {new_alert.id} saved to database")
+        with span("db_write"), DB_WRITE_SECONDS.time(backend="database"):
+            alert_data = await alert_store.insert_alert_async(alert_type, content, result, level)
+        logger.debug("Alert %s saved to database", alert_data["id"])
 
         # Broadcast alert via WebSocket
         try:
-            alert_data = {
-                "id": new_alert.id,
-                "type": alert_type,
-                "content": content,
-                "result": result,
-                "level": level,
-                "time": new_alert.time.isoformat()
-            }
-            await broadcast_alert(alert_data)
-            print(f"[WS BROADCAST] Alert {new_alert.id} broadcasted to WebSocket clients")
+            alert_data["time"] = alert_data["time"].isoformat()
+            with span("ws_broadcast"):
+                await broadcast_alert(alert_data)
+            logger.debug("Alert %s broadcasted to WebSocket clients", alert_data["id"])
         except Exception as ws_error:
-            print(f"[WS ERROR] Failed to broadcast alert: {ws_error}")
+            logger.warning("Failed to broadcast alert: %s", ws_error)
 
         return True
     except Exception as e:
-        print(f"[DB ERROR] {e}")
+        logger.error("DB logging failed: %s", e)
         return False
-    finally:
-        try:
-            db.close()
-        except:
-            pass
 
 def try_json_fallback(alert_type: str, content: str, result: dict, level: str = "warning"):
     """Fallback to JSON file logging"""
@@ -72,12 +66,41 @@ def try_json_fallback(alert_type: str, content: str, result: dict, level: str =
             "source": "json_fallback"
         }
 
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
+        with span("json_write"), DB_WRITE_SECONDS.time(backend="json"), open(LOG_FILE, "a", encoding="utf-8") as f:
             f.write(json.dumps(entry, ensure_ascii=False) + "\n")
 
-        print(f"[JSON FALLBACK] Alert saved to {LOG_FILE}")
-        print("[LOGGED]", entry)
+        logger.info("JSON fallback: alert saved to %s", LOG_FILE)
+        logger.debug("Logged alert: %s", entry)
 
     except Exception as e:
-        print(f"[FATAL ERROR] Could not log alert: {e}")
-        print(f"[ALERT DATA] Type: {alert_type}, Content: {content}, Result: {result}")
+        logger.critical("Could not log alert: %s", e)
+        logger.critical("Alert data: type=%s content=%s result=%s", alert_type, content, result)
+
+def _as_utc(moment: datetime.datetime, local: bool = False) -> datetime.datetime:
+    # Giờ UTC không kèm timezone như cột time trong DB; `local`: giờ không kèm timezone là giờ local
+    if moment.tzinfo is None:
+        if not local:
+            return moment
+        moment = moment.astimezone()
+    return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+def read_json_alerts(since: datetime.datetime = None, until: datetime.datetime = None, alert_type: str = None) -> list:
+    """Alert trong file JSON fallback, lọc theo cùng điều kiện với DB (since <= time < until, type)"""
+    if not os.path.exists(LOG_FILE):
+        return []
+
+    since = _as_utc(since) if since else None
+    until = _as_utc(until) if until else None
+    alerts = []
+    with open(LOG_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            alert = json.loads(line)
+            if alert_type and alert["type"] != alert_type:
+                continue
+            if since or until:
+                # File JSON ghi giờ local (datetime.now())
+                moment = _as_utc(datetime.datetime.fromisoformat(alert["time"]), local=True)
+                if (since and moment < since) or (until and moment >= until):
+                    continue
+            alerts.append(alert)
+    return alerts
@@ -0,0 +1,95 @@
+import logging
+import os
+import subprocess
+import cv2
+from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+# Định dạng PCM mà các recognizer dùng: mono, 16 kHz, 16-bit
+PCM_SAMPLE_RATE = 16000
+
+def has_audio_stream(path: str) -> bool:
+    """Kiểm tra file có track audio không (chỉ đọc metadata qua ffprobe)"""
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", path],
+        capture_output=True, check=True
+    ).stdout
+    return bool(output.strip())
+
+def decode_audio_pcm(path: str, sample_rate: int = PCM_SAMPLE_RATE) -> AudioSegment:
+    """
+    Decode track audio thẳng ra PCM mono 16-bit qua pipe của ffmpeg,
+    không ghi file WAV trung gian ra đĩa.
+    """
+    pcm = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", path, "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-"],
+        capture_output=True, check=True
+    ).stdout
+
+    return AudioSegment(data=pcm, sample_width=2, frame_rate=sample_rate, channels=1)
+
+def download_to_file(url: str, path: str):
+    """Tải file từ URL theo từng chunk vào path"""
+    import requests
+    response = requests.get(url, stream=True, timeout=30)
+    response.raise_for_status()
+
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+
+def remove_temp_file(temp_name: str):
+    """Xoá file tạm, không raise nếu lỗi"""
+    try:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+    except Exception as e:
+        logger.warning("Failed to clean up temp file %s: %s", temp_name, e)
+
+class VideoDecoder:
+    """
+    Một decoder dùng chung cho cả metadata lẫn frame của video.
+    Dùng với `with` để đảm bảo luôn giải phóng decoder.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise ValueError(f"Cannot open video: {path}")
+
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.duration = self.frame_count / self.fps if self.fps else 0.0
+
+    def sampled_frames(self, sample_rate: int = 30):
+        """
+        Trả về (frame_index, frame BGR) cho mỗi frame thứ `sample_rate`.
+        Các frame bị bỏ qua chỉ được grab(), không decode.
+        """
+        frame_index = 0
+        while True:
+            frame_index += 1
+            if frame_index % sample_rate:
+                if not self._cap.grab():
+                    break
+                continue
+
+            ret, frame = self._cap.read()
+            if not ret:
+                break
+            yield frame_index, frame
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,163 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket mặc định cho histogram độ trễ (giây)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _Metric:
+    """
+    Metric với dữ liệu chia theo thread: mỗi thread chỉ ghi vào shard của riêng nó
+    nên đường ghi không cần lock; /metrics cộng các shard lại khi scrape.
+    """
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        REGISTRY.append(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # list.append là atomic trong CPython
+            self._shards.append(shard)
+        return shard
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def collect(self) -> dict:
+        totals = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> list:
+        lines = self._header()
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        data = shard.get(key)
+        if data is None:
+            # [count theo từng bucket..., +Inf, sum]
+            data = shard[key] = [0] * (len(self.buckets) + 2)
+        data[bisect.bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> dict:
+        totals = {}
+        for shard in list(self._shards):
+            for key, data in list(shard.items()):
+                total = totals.setdefault(key, [0] * len(data))
+                for i, value in enumerate(list(data)):
+                    total[i] += value
+        return totals
+
+    def render(self) -> list:
+        lines = self._header()
+        for key, data in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), data[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {data[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+class CallbackGauge(_Metric):
+    """Gauge đọc giá trị lúc scrape, `fn()` trả về số hoặc dict {label_tuple: value}"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn, labelnames: tuple = (), type: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.type = type
+
+    def render(self) -> list:
+        lines = self._header()
+        try:
+            values = self.fn()
+        except Exception:
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+REGISTRY = []
+
+def render_metrics() -> str:
+    """Xuất toàn bộ metric theo định dạng text của Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Metric dùng chung ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "aicp_http_request_duration_seconds", "HTTP request latency by endpoint", ("method", "path", "status")
+)
+MODEL_INFERENCE_SECONDS = Histogram(
+    "aicp_model_inference_seconds", "Model forward pass latency per batch", ("model",)
+)
+MODEL_BATCH_SIZE = Histogram(
+    "aicp_model_batch_size", "Items per model forward pass", ("model",), buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+DB_WRITE_SECONDS = Histogram(
+    "aicp_db_write_seconds", "Alert write latency", ("backend",)
+)
+WS_BROADCAST_SECONDS = Histogram(
+    "aicp_ws_broadcast_seconds", "WebSocket broadcast latency", ("type",)
+)
+CHAT_MESSAGES = Counter(
+    "aicp_chat_messages_total", "Chat messages moderated over WebSocket", ("label",)
+)
@@ -1,21 +1,33 @@
-import json
+import logging
+import queue
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from src.utils.config import get_section
+from src.utils.tracing import span
 
-def notify_parent(alert_type: str, content: str, result: dict):
-    """
-    Gửi thông báo cho phụ huynh qua email và in ra console.
-    """
-    print(f"[ALERT to Parents] Type={alert_type} | Content={content} | Result={result}")
+logger = logging.getLogger(__name__)
+
+EMAIL_DEFAULTS = {
+    "smtp_port": 587,
+    "use_tls": True,
+    # Mỗi người nhận chỉ nhận tối đa 1 email trong khoảng này; cảnh báo đến trong lúc chờ được gộp thành digest
+    "min_interval_seconds": 300,
+    # Đóng kết nối SMTP nếu không dùng quá lâu
+    "idle_timeout_seconds": 60,
+    # Gửi lỗi: giữ cảnh báo lại và thử sau retry_seconds * số lần lỗi, bỏ sau max_send_attempts lần
+    "retry_seconds": 60,
+    "max_send_attempts": 3
+}
 
-    try:
-        with open("config.json") as f:
-            config = json.load(f)["email"]
+def _format_score(result: dict) -> str:
+    score = result.get("score")
+    return f"{score:.2f}" if isinstance(score, (int, float)) else "N/A"
 
-        # --- Tạo nội dung email ---
-        subject = f"Cảnh báo an toàn cho trẻ: Phát hiện {alert_type}"
-        body = f"""
+def build_alert_body(alert_type: str, content: str, result: dict) -> str:
+    return f"""
         Chào quý phụ huynh,
 
         Hệ thống giám sát AI vừa phát hiện một hoạt động có khả năng không an toàn.
@@ -23,8 +35,8 @@ def notify_parent(alert_type: str, content: str, result: dict):
         - **Loại cảnh báo:** {alert_type}
         - **Nội dung:** {content}
         - **Kết quả phân tích:**
-            - Nhãn: {result['label']}
-            - Độ tin cậy: {result['score']:.2f}
+            - Nhãn: {result.get('label', 'unknown')}
+            - Độ tin cậy: {_format_score(result)}
 
         Vui lòng kiểm tra và trao đổi với con em mình.
 
@@ -32,23 +44,227 @@ def notify_parent(alert_type: str, content: str, result: dict):
         Hệ thống AI Child Protection
         """
 
-        # --- Gửi email ---
+def build_digest_body(alerts: list, window_seconds: float) -> str:
+    minutes = max(int(round(window_seconds / 60)), 1)
+    lines = "\n".join(
+        f"        - [{alert_type}] {content} → {result.get('label', 'unknown')} ({_format_score(result)})"
+        for alert_type, content, result in alerts
+    )
+    return f"""
+        Chào quý phụ huynh,
+
+        Hệ thống giám sát AI đã phát hiện {len(alerts)} cảnh báo trong {minutes} phút qua:
+
+{lines}
+
+        Vui lòng kiểm tra và trao đổi với con em mình.
+
+        Trân trọng,
+        Hệ thống AI Child Protection
+        """
+
+class NotificationDispatcher:
+    """
+    Gửi email cảnh báo trên một thread nền:
+    - notify_parent() chỉ đưa cảnh báo vào hàng đợi và trả về ngay
+    - giữ một phiên SMTP dùng lại giữa các lần gửi, tự kết nối lại khi bị ngắt
+    - giới hạn tần suất theo người nhận, gộp các cảnh báo dồn dập thành email digest
+    """
+
+    def __init__(self, config: dict = None):
+        self.config = config
+        self._queue = queue.Queue()
+        self._pending = {}      # recipient -> list cảnh báo chờ gửi
+        self._window_start = {} # recipient -> thời điểm cảnh báo đầu tiên đang chờ
+        self._last_sent = {}    # recipient -> thời điểm gửi gần nhất
+        self._failures = {}     # recipient -> số lần gửi lỗi liên tiếp
+        self._retry_at = {}     # recipient -> thời điểm được thử gửi lại
+        self._smtp = None
+        self._smtp_last_used = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    # --- API công khai ---
+
+    def enqueue(self, alert_type: str, content: str, result: dict):
+        if self.config is None:
+            self.config = get_section("email", EMAIL_DEFAULTS)
+        if not self.config.get("smtp_server"):
+            logger.warning("Email is not configured in config.json. Skipping email notification.")
+            return
+        self._ensure_started()
+        self._queue.put((alert_type, content, result))
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self, timeout: float = 10.0):
+        """Gửi nốt các cảnh báo đang chờ rồi dừng thread (gọi khi app shutdown)"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._stopping.clear()
+
+    # --- Worker ---
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="notifier", daemon=True)
+                self._thread.start()
+
+    def _recipients(self):
+        recipients = self.config.get("recipient_email") or []
+        return [recipients] if isinstance(recipients, str) else list(recipients)
+
+    def _worker(self):
+        while True:
+            try:
+                alert = self._queue.get(timeout=1.0)
+                now = time.monotonic()
+                for recipient in self._recipients():
+                    self._pending.setdefault(recipient, []).append(alert)
+                    self._window_start.setdefault(recipient, now)
+            except queue.Empty:
+                pass
+
+            stopping = self._stopping.is_set() and self._queue.empty()
+            try:
+                self._flush_ready(force=stopping)
+                self._close_idle_smtp(force=stopping)
+            except Exception as e:
+                # Thread không được chết: cảnh báo đến sau vẫn phải được gửi
+                logger.error("Notification worker error: %s", e)
+
+            if stopping:
+                if self._pending:
+                    logger.warning("Shutting down with unsent alerts for %d recipient(s)", len(self._pending))
+                return
+
+    def _flush_ready(self, force: bool = False):
+        now = time.monotonic()
+        interval = self.config["min_interval_seconds"]
+
+        for recipient in list(self._pending):
+            last_sent = self._last_sent.get(recipient)
+            if not force and last_sent is not None and now - last_sent < interval:
+                continue
+            if not force and now < self._retry_at.get(recipient, 0.0):
+                continue
+
+            alerts = self._pending.pop(recipient)
+            window_start = self._window_start.pop(recipient)
+
+            try:
+                if len(alerts) == 1:
+                    alert_type, content, result = alerts[0]
+                    subject = f"Cảnh báo an toàn cho trẻ: Phát hiện {alert_type}"
+                    body = build_alert_body(alert_type, content, result)
+                else:
+                    subject = f"Cảnh báo an toàn cho trẻ: {len(alerts)} cảnh báo mới"
+                    body = build_digest_body(alerts, now - (last_sent or window_start))
+            except Exception as e:
+                # Cảnh báo hỏng thì thử lại cũng không được: bỏ batch này, không ảnh hưởng batch khác
+                logger.error("Failed to build notification for %s (%d alert(s) dropped): %s", recipient, len(alerts), e)
+                continue
+
+            # Chạy trên thread nền nên là span gốc riêng, không thuộc trace của request
+            with span("smtp_send", alerts=len(alerts)):
+                sent = self._send(recipient, subject, body)
+            if sent:
+                self._last_sent[recipient] = now
+                self._failures.pop(recipient, None)
+                self._retry_at.pop(recipient, None)
+                logger.info("%d alert(s) sent to %s", len(alerts), recipient)
+            else:
+                self._requeue(recipient, alerts, window_start, now)
+
+    def _requeue(self, recipient: str, alerts: list, window_start: float, now: float):
+        """Giữ lại cảnh báo gửi lỗi (trước các cảnh báo mới đến) để thử lại sau"""
+        attempts = self._failures.get(recipient, 0) + 1
+        if attempts >= self.config["max_send_attempts"]:
+            logger.error("Dropping %d alert(s) for %s after %d failed attempts", len(alerts), recipient, attempts)
+            self._failures.pop(recipient, None)
+            self._retry_at.pop(recipient, None)
+            return
+
+        self._failures[recipient] = attempts
+        self._retry_at[recipient] = now + self.config["retry_seconds"] * attempts
+        self._pending[recipient] = alerts + self._pending.get(recipient, [])
+        self._window_start[recipient] = min(window_start, self._window_start.get(recipient, window_start))
+
+    # --- SMTP ---
+
+    def _connect(self):
+        server = smtplib.SMTP(self.config["smtp_server"], self.config["smtp_port"], timeout=30)
+        if self.config["use_tls"]:
+            server.starttls()
+        if self.config.get("sender_password"):
+            server.login(self.config["sender_email"], self.config["sender_password"])
+        return server
+
+    def _get_smtp(self):
+        if self._smtp is not None:
+            try:
+                # Kiểm tra phiên cũ còn sống không
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+
+        self._smtp = self._connect()
+        return self._smtp
+
+    def _send(self, recipient: str, subject: str, body: str) -> bool:
         msg = MIMEMultipart()
-        msg['From'] = config["sender_email"]
-        msg['To'] = config["recipient_email"]
+        msg['From'] = self.config["sender_email"]
+        msg['To'] = recipient
         msg['Subject'] = subject
         msg.attach(MIMEText(body, 'plain'))
 
-        server = smtplib.SMTP(config["smtp_server"], config["smtp_port"])
-        server.starttls()
-        server.login(config["sender_email"], config["sender_password"])
-        text = msg.as_string()
-        server.sendmail(config["sender_email"], config["recipient_email"], text)
-        server.quit()
+        # Thử lại một lần với kết nối mới nếu phiên cũ bị server đóng
+        for attempt in range(2):
+            try:
+                self._get_smtp().sendmail(self.config["sender_email"], recipient, msg.as_string())
+                self._smtp_last_used = time.monotonic()
+                return True
+            except (smtplib.SMTPServerDisconnected, ConnectionError, OSError) as e:
+                self._close_smtp()
+                if attempt:
+                    logger.error("Failed to send email: %s", e)
+            except Exception as e:
+                logger.error("Failed to send email: %s", e)
+                return False
+        return False
+
+    def _close_idle_smtp(self, force: bool = False):
+        if self._smtp is None:
+            return
+        if force or time.monotonic() - self._smtp_last_used > self.config["idle_timeout_seconds"]:
+            self._close_smtp()
 
-        print(f"[EMAIL] Alert sent to {config['recipient_email']}")
+    def _close_smtp(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
 
-    except FileNotFoundError:
-        print("[ERROR] config.json not found. Skipping email notification.")
-    except Exception as e:
-        print(f"[ERROR] Failed to send email: {e}")
+dispatcher = NotificationDispatcher()
+
+def notify_parent(alert_type: str, content: str, result: dict):
+    """
+    Gửi thông báo cho phụ huynh qua email và in ra console.
+    Email được gửi trên thread nền nên hàm này trả về ngay.
+    """
+    logger.debug("Alert to parents: type=%s content=%s result=%s", alert_type, content, result)
+    with span("notify_parent", alert_type=alert_type):
+        dispatcher.enqueue(alert_type, content, result)
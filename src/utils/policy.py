@@ -0,0 +1,291 @@
+"""
+Chính sách kiểm duyệt theo từng trẻ / thiết bị.
+
+- Mỗi thiết bị (header `X-Device-Id`) có thể có một profile trong bảng `child_profiles`: độ tuổi,
+  độ nhạy, nhóm nội dung text được theo dõi, danh sách domain cho phép / chặn, và các tuỳ chọn tắt
+  bớt phần phân tích tốn kém (tải trang khi kiểm tra URL, model text, audio của video).
+- Profile được compile một lần thành `Policy` (các ngưỡng đã tính sẵn, set / frozenset) và giữ trong
+  bộ nhớ; mỗi verdict chỉ tra dict theo device id, không truy vấn DB. Thiết bị không có profile
+  dùng policy mặc định (ngưỡng như trước khi có profile).
+- Sửa profile qua API thì compile lại ngay trong process; process khác thấy thay đổi sau tối đa
+  `refresh_seconds` (so (số profile, updated_at lớn nhất) rồi mới nạp lại).
+"""
+import asyncio
+import datetime
+import logging
+from urllib.parse import urlparse
+from src.utils.config import get_section
+
+logger = logging.getLogger(__name__)
+
+POLICY_CONFIG = get_section("policy", {
+    # Header định danh thiết bị (app gửi kèm mọi request và khi mở /ws)
+    "device_header": "x-device-id",
+    "refresh_seconds": 30,
+    # Ngưỡng theo độ tuổi. text_*: điểm nhóm cao nhất (toxic) / trung bình các nhóm (suspicious)
+    # của phân tích từ khoá; url_*: điểm URL; image_min_score: điểm tối thiểu để ảnh nsfw bị cảnh báo;
+    # alert_suspicious: text "suspicious" cũng gửi cảnh báo (mặc định chỉ "toxic")
+    "age_bands": {
+        "under_9": {"text_toxic_above": 0.5, "text_suspicious_above": 0.25, "url_suspicious_above": 0.25,
+                    "url_dangerous_above": 0.5, "image_min_score": 0.0, "alert_suspicious": True},
+        "9_12": {"text_toxic_above": 0.6, "text_suspicious_above": 0.3, "url_suspicious_above": 0.3,
+                 "url_dangerous_above": 0.6, "image_min_score": 0.0, "alert_suspicious": True},
+        "13_15": {"text_toxic_above": 0.7, "text_suspicious_above": 0.4, "url_suspicious_above": 0.4,
+                  "url_dangerous_above": 0.7, "image_min_score": 0.0, "alert_suspicious": False},
+        "16_17": {"text_toxic_above": 0.8, "text_suspicious_above": 0.5, "url_suspicious_above": 0.5,
+                  "url_dangerous_above": 0.8, "image_min_score": 0.5, "alert_suspicious": False}
+    },
+    "default_age_band": "13_15",
+    # Cộng vào mọi ngưỡng (âm = nhạy hơn)
+    "sensitivity_offsets": {"high": -0.1, "normal": 0.0, "low": 0.1}
+})
+
+# Nhóm nội dung của phân tích từ khoá (khớp CATEGORY_KEYWORDS trong text_filter)
+TEXT_CATEGORIES = ("cyberbullying", "sexual_content", "scam", "hate_speech", "violence")
+IMAGE_UNSAFE_LABELS = frozenset(("nsfw", "porn", "unsafe", "suspicious"))
+SPEECH_ALERT_LABELS = frozenset(("toxic", "suspicious"))
+
+_THRESHOLDS = ("text_toxic_above", "text_suspicious_above", "url_suspicious_above", "url_dangerous_above")
+_OPTIONS = ("allowlist_only", "url_fetch", "text_model", "video_audio")
+
+def domain_suffixes(url: str) -> set:
+    """Host của URL và các domain cha, vd. a.b.com -> {a.b.com, b.com, com}"""
+    host = (urlparse(url if "://" in url else "http://" + url).hostname or "").lower()
+    parts = host.split(".")
+    return {".".join(parts[index:]) for index in range(len(parts))}
+
+def normalize_domains(values) -> frozenset:
+    domains = set()
+    for value in values or ():
+        value = value.strip().lower()
+        host = urlparse(value).hostname if "://" in value else value.split("/")[0]
+        if host:
+            domains.add(host[4:] if host.startswith("www.") else host)
+    return frozenset(domains)
+
+class Policy:
+    """Profile đã compile; chỉ đọc, dùng chung giữa các request"""
+
+    __slots__ = (
+        "profile", "name", "age_band", "sensitivity", "text_toxic_above", "text_suspicious_above",
+        "url_suspicious_above", "url_dangerous_above", "image_min_score", "text_categories",
+        "text_alert_labels", "allowed_domains", "blocked_domains", "allowlist_only", "url_fetch",
+        "text_model", "video_audio"
+    )
+
+    # --- Text ---
+
+    def label_text(self, categories: dict):
+        """(label, score) từ điểm các nhóm của phân tích từ khoá, chỉ xét nhóm được theo dõi"""
+        scores = [score for name, score in categories.items() if name in self.text_categories]
+        max_score = max(scores, default=0.0)
+        # Chia cho tổng số nhóm để ngưỡng trung bình không đổi khi bỏ bớt nhóm
+        average = sum(scores) / len(categories) if categories else 0.0
+        if max_score > self.text_toxic_above:
+            return "toxic", max_score
+        if average > self.text_suspicious_above:
+            return "suspicious", average
+        return "neutral", 0.9
+
+    def apply_text(self, result: dict) -> dict:
+        """Gán lại label theo ngưỡng của profile (chỉ kết quả có điểm từng nhóm; verdict của model giữ nguyên)"""
+        categories = result.get("categories")
+        if not isinstance(categories, dict) or not categories:
+            return result
+        label, score = self.label_text(categories)
+        if label == result.get("label"):
+            return result
+        return dict(result, label=label, score=score)
+
+    def alerts_text(self, result: dict) -> bool:
+        return result.get("label", "").lower() in self.text_alert_labels
+
+    # --- Ảnh / video ---
+
+    def alerts_image(self, result: dict) -> bool:
+        return result.get("label", "").lower() in IMAGE_UNSAFE_LABELS and result.get("score", 1.0) >= self.image_min_score
+
+    # --- URL ---
+
+    def url_label(self, score: float):
+        """(label, risk_level) theo điểm URL"""
+        if score > self.url_dangerous_above:
+            return "dangerous", "high"
+        if score > self.url_suspicious_above:
+            return "suspicious", "medium"
+        return "safe", "low"
+
+    def domain_rule(self, url: str):
+        """Trả về "allowed" / "blocked" nếu domain (hoặc domain cha) nằm trong danh sách của profile, ngược lại None"""
+        if not (self.allowed_domains or self.blocked_domains or self.allowlist_only):
+            return None
+        suffixes = domain_suffixes(url)
+        if suffixes & self.blocked_domains:
+            return "blocked"
+        if suffixes & self.allowed_domains:
+            return "allowed"
+        return "blocked" if self.allowlist_only else None
+
+    def describe(self) -> dict:
+        return {name: sorted(value) if isinstance(value, frozenset) else value for name, value in
+                ((slot, getattr(self, slot)) for slot in self.__slots__)}
+
+def compile_policy(profile: dict = None, config: dict = POLICY_CONFIG) -> Policy:
+    """Compile profile (dict với các cột của child_profiles) thành Policy; raise ValueError nếu không hợp lệ"""
+    profile = profile or {}
+    age_band = profile.get("age_band") or config["default_age_band"]
+    sensitivity = profile.get("sensitivity") or "normal"
+    if age_band not in config["age_bands"]:
+        raise ValueError(f"Unknown age_band {age_band!r} (expected one of {sorted(config['age_bands'])})")
+    if sensitivity not in config["sensitivity_offsets"]:
+        raise ValueError(f"Unknown sensitivity {sensitivity!r} (expected one of {sorted(config['sensitivity_offsets'])})")
+
+    categories = profile.get("categories")
+    if categories is None:
+        categories = TEXT_CATEGORIES
+    unknown = set(categories) - set(TEXT_CATEGORIES)
+    if unknown:
+        raise ValueError(f"Unknown categories {sorted(unknown)} (expected a subset of {list(TEXT_CATEGORIES)})")
+
+    band = config["age_bands"][age_band]
+    offset = config["sensitivity_offsets"][sensitivity]
+
+    policy = Policy()
+    policy.profile = profile.get("device_id")
+    policy.name = profile.get("name") or profile.get("device_id") or "default"
+    policy.age_band = age_band
+    policy.sensitivity = sensitivity
+    for threshold in _THRESHOLDS:
+        setattr(policy, threshold, round(min(max(band[threshold] + offset, 0.0), 1.0), 4))
+    policy.image_min_score = round(min(max(band["image_min_score"] + offset, 0.0), 1.0), 4)
+    policy.text_categories = frozenset(categories)
+    policy.text_alert_labels = frozenset(("toxic", "suspicious") if band["alert_suspicious"] else ("toxic",))
+    policy.allowed_domains = normalize_domains(profile.get("allowed_domains"))
+    policy.blocked_domains = normalize_domains(profile.get("blocked_domains"))
+    for option in _OPTIONS:
+        value = profile.get(option)
+        setattr(policy, option, (option != "allowlist_only") if value is None else bool(value))
+    return policy
+
+# Policy của thiết bị không có profile
+default_policy = compile_policy()
+
+_PROFILE_FIELDS = ("name", "age_band", "sensitivity", "categories", "allowed_domains", "blocked_domains") + _OPTIONS
+
+class PolicyStore:
+    def __init__(self, config: dict = POLICY_CONFIG):
+        self.config = config
+        self.default = default_policy
+        # device_id -> Policy; chỉ thay cả dict (copy-on-write) nên đọc không cần lock
+        self._policies = {}
+        self._version = None
+        self._task = None
+
+    def get(self, device_id: str) -> Policy:
+        if not device_id:
+            return self.default
+        return self._policies.get(device_id, self.default)
+
+    def for_connection(self, connection) -> Policy:
+        """Policy theo header thiết bị của Request hoặc WebSocket"""
+        return self.get(connection.headers.get(self.config["device_header"]))
+
+    # --- DB ---
+
+    @staticmethod
+    def _row_profile(row) -> dict:
+        profile = {field: getattr(row, field) for field in _PROFILE_FIELDS}
+        profile["device_id"] = row.device_id
+        return profile
+
+    def load(self, force: bool = False) -> bool:
+        """Nạp lại toàn bộ profile nếu bảng đã đổi; trả về True nếu có nạp"""
+        from sqlalchemy import func
+        from src.utils.database import SessionLocal, ChildProfile
+
+        db = SessionLocal()
+        try:
+            version = tuple(db.query(func.count(ChildProfile.device_id), func.max(ChildProfile.updated_at)).one())
+            if version == self._version and not force:
+                return False
+
+            policies = {}
+            for row in db.query(ChildProfile).all():
+                try:
+                    policies[row.device_id] = compile_policy(self._row_profile(row), self.config)
+                except ValueError as e:
+                    # Profile lỗi (vd. age band đã bị bỏ khỏi config): dùng policy mặc định cho thiết bị đó
+                    logger.error("Invalid profile %s: %s", row.device_id, e)
+        finally:
+            db.close()
+
+        self._policies = policies
+        self._version = version
+        return True
+
+    def put(self, device_id: str, profile: dict) -> Policy:
+        """Tạo / sửa profile; compile trước khi ghi để profile lỗi không vào DB"""
+        from src.utils.database import SessionLocal, ChildProfile
+
+        profile = {field: profile.get(field) for field in _PROFILE_FIELDS}
+        policy = compile_policy(dict(profile, device_id=device_id), self.config)
+
+        db = SessionLocal()
+        try:
+            db.merge(ChildProfile(device_id=device_id, updated_at=datetime.datetime.utcnow(), **profile))
+            db.commit()
+        finally:
+            db.close()
+
+        policies = dict(self._policies)
+        policies[device_id] = policy
+        self._policies = policies
+        # Lần refresh sau so lại version với DB (có thể đã có thay đổi khác từ process khác)
+        self._version = None
+        return policy
+
+    def delete(self, device_id: str) -> bool:
+        from src.utils.database import SessionLocal, ChildProfile
+
+        db = SessionLocal()
+        try:
+            deleted = db.query(ChildProfile).filter(ChildProfile.device_id == device_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+        policies = dict(self._policies)
+        policies.pop(device_id, None)
+        self._policies = policies
+        self._version = None
+        return bool(deleted)
+
+    def profiles(self) -> dict:
+        return {device_id: policy.describe() for device_id, policy in self._policies.items()}
+
+    # --- Vòng đời ---
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.load)
+        except Exception as e:
+            logger.error("Failed to load child profiles: %s", e)
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _refresh_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.config["refresh_seconds"])
+            try:
+                if await loop.run_in_executor(None, self.load):
+                    logger.info("Reloaded %d child profiles", len(self._policies))
+            except Exception as e:
+                logger.error("Failed to refresh child profiles: %s", e)
+
+policy_store = PolicyStore()
@@ -0,0 +1,88 @@
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = "logs/profiles"
+
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu stack của mọi thread theo chu kỳ (wall-clock), bật được lúc đang chạy.
+    Kết quả ghi theo định dạng "collapsed stack" (mỗi dòng `thread;frame;frame count`),
+    mở trực tiếp bằng speedscope hoặc chuyển thành SVG bằng flamegraph.pl.
+    """
+
+    def __init__(self, output_dir: str = PROFILES_DIR):
+        self.output_dir = output_dir
+        self._thread = None
+        self._current = None
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def start(self, seconds: float, interval: float = 0.01) -> dict:
+        """Bắt đầu lấy mẫu trên thread nền; chỉ chạy một phiên tại một thời điểm"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise RuntimeError("A profiling session is already running")
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            # Thêm micro giây và số thứ tự để hai phiên trong cùng một giây không ghi đè nhau
+            self._seq += 1
+            name = f"profile-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{self._seq}.folded"
+            self._current = {
+                "name": name,
+                "path": os.path.join(self.output_dir, name),
+                "seconds": seconds,
+                "interval": interval,
+                "samples": 0,
+                "status": "running"
+            }
+            self._thread = threading.Thread(target=self._run, args=(self._current,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return dict(self._current)
+
+    def status(self):
+        return dict(self._current) if self._current else None
+
+    def list_profiles(self) -> list:
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted(name for name in os.listdir(self.output_dir) if name.endswith(".folded"))
+
+    def _run(self, session: dict):
+        own_ident = threading.get_ident()
+        thread_names = {}
+        stacks = Counter()
+        deadline = time.monotonic() + session["seconds"]
+
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                if ident not in thread_names:
+                    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(thread_names.get(ident, str(ident)))
+                stacks[";".join(reversed(frames))] += 1
+
+            session["samples"] += 1
+            time.sleep(session["interval"])
+
+        with open(session["path"], "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        session["status"] = "done"
+        logger.info("Profile written to %s (%d samples)", session["path"], session["samples"])
+
+profiler = SamplingProfiler()
@@ -0,0 +1,187 @@
+"""
+Giảm chất lượng phân tích theo tải (QoS) để giữ độ trễ khi quá tải.
+
+- Mỗi `interval_seconds` controller đọc thời gian chờ slot trung bình và số request bị từ chối
+  (hàng đợi đầy / quá deadline) của các lớp realtime trong scheduler, cùng CPU của process.
+- Quá tải `escalate_after` lần liên tiếp -> hạ một mức; rảnh `recover_after` lần liên tiếp -> nâng
+  lại một mức. Ngưỡng rảnh thấp hơn ngưỡng quá tải (hysteresis) để mức không dao động.
+- Mỗi mức (`levels`) quy định: bước lấy mẫu frame video, có tải trang khi kiểm tra URL hay chỉ
+  xét cấu trúc URL, text có chạy model hay chỉ dùng bộ lọc từ khoá, kích thước decode ảnh.
+- Request lấy cấu hình mức một lần lúc bắt đầu (`qos.current()`) và trả `fidelity` trong response.
+"""
+import asyncio
+import logging
+import os
+import time
+from src.utils.config import get_section
+from src.utils.scheduler import scheduler as default_scheduler
+
+logger = logging.getLogger(__name__)
+
+QOS_CONFIG = get_section("qos", {
+    "enabled": True,
+    "interval_seconds": 1.0,
+    # Lớp scheduler được theo dõi (media vốn chờ lâu, không dùng làm tín hiệu)
+    "watch_classes": ["text", "image", "url"],
+    # Quá tải: chờ slot trung bình vượt target_wait_seconds, có request bị từ chối, hoặc CPU vượt cpu_high
+    "target_wait_seconds": 0.25,
+    "cpu_high": 0.85,
+    # Rảnh: chờ dưới recover_wait_seconds và CPU dưới cpu_low
+    "recover_wait_seconds": 0.05,
+    "cpu_low": 0.6,
+    "escalate_after": 2,
+    "recover_after": 10,
+    # 0 = os.cpu_count()
+    "cpu_cores": 0,
+    # Mức 0 là đầy đủ; video_sample_rate: phân tích 1 frame mỗi N frame; url_fetch: tải trang;
+    # text_model: chạy model cho text mơ hồ; image_size: kích thước decode ảnh (JPEG draft mode)
+    "levels": [
+        {"mode": "full", "video_sample_rate": 30, "url_fetch": True, "text_model": True, "image_size": 224},
+        {"mode": "reduced", "video_sample_rate": 60, "url_fetch": True, "text_model": True, "image_size": 160},
+        {"mode": "degraded", "video_sample_rate": 120, "url_fetch": False, "text_model": False, "image_size": 112},
+        {"mode": "minimal", "video_sample_rate": 240, "url_fetch": False, "text_model": False, "image_size": 64}
+    ]
+})
+
+class CpuSampler:
+    """Tỉ lệ CPU process đã dùng giữa hai lần sample (0..1 trên tổng số core)"""
+
+    def __init__(self, cores: int = 0):
+        self.cores = cores or os.cpu_count() or 1
+        self._last = self._read()
+
+    @staticmethod
+    def _read():
+        times = os.times()
+        return time.monotonic(), times.user + times.system
+
+    def sample(self) -> float:
+        now, cpu = self._read()
+        last_now, last_cpu = self._last
+        self._last = (now, cpu)
+        elapsed = now - last_now
+        return (cpu - last_cpu) / (elapsed * self.cores) if elapsed > 0 else 0.0
+
+class QosController:
+    def __init__(self, config: dict = QOS_CONFIG, scheduler=default_scheduler, cpu: CpuSampler = None):
+        self.config = config
+        self.scheduler = scheduler
+        self.levels = [dict(settings, level=index) for index, settings in enumerate(config["levels"])]
+        self.level = 0
+        # Admin có thể cố định một mức (None = tự động)
+        self.pinned = None
+        self.changes = 0
+        self.signals = {"queue_wait": 0.0, "overloaded": 0, "cpu": 0.0}
+        self._cpu = cpu or CpuSampler(config["cpu_cores"])
+        self._totals = self._scheduler_totals()
+        self._overloaded_streak = 0
+        self._calm_streak = 0
+        self._task = None
+
+    def current(self) -> dict:
+        """Cấu hình của mức hiện tại; request đọc một lần lúc bắt đầu và dùng tới khi xong"""
+        if not self.config["enabled"]:
+            return self.levels[0]
+        return self.levels[self.level if self.pinned is None else self.pinned]
+
+    @staticmethod
+    def fidelity(settings: dict) -> dict:
+        return {"level": settings["level"], "mode": settings["mode"]}
+
+    # --- Tín hiệu ---
+
+    def _scheduler_totals(self):
+        wait_seconds = waits = overloaded = 0
+        for name in self.config["watch_classes"]:
+            work_class = self.scheduler.classes.get(name)
+            if work_class is not None:
+                wait_seconds += work_class.wait_seconds
+                waits += work_class.waits
+                overloaded += work_class.overloaded
+        return wait_seconds, waits, overloaded
+
+    def sample(self) -> dict:
+        """Tín hiệu trong khoảng từ lần sample trước"""
+        totals = self._scheduler_totals()
+        wait_seconds, waits, overloaded = (now - before for now, before in zip(totals, self._totals))
+        self._totals = totals
+        return {
+            "queue_wait": wait_seconds / waits if waits else 0.0,
+            "overloaded": overloaded,
+            "cpu": self._cpu.sample()
+        }
+
+    # --- Điều khiển ---
+
+    def update(self, signals: dict) -> int:
+        """Cập nhật mức theo tín hiệu của một khoảng; trả về mức mới"""
+        config = self.config
+        self.signals = signals
+        overloaded = (
+            signals["queue_wait"] > config["target_wait_seconds"]
+            or signals["overloaded"] > 0
+            or signals["cpu"] > config["cpu_high"]
+        )
+        calm = signals["queue_wait"] < config["recover_wait_seconds"] and not signals["overloaded"] and signals["cpu"] < config["cpu_low"]
+
+        if overloaded:
+            self._overloaded_streak += 1
+            self._calm_streak = 0
+            if self._overloaded_streak >= config["escalate_after"] and self.level < len(self.levels) - 1:
+                self._set_level(self.level + 1)
+        elif calm:
+            self._calm_streak += 1
+            self._overloaded_streak = 0
+            if self._calm_streak >= config["recover_after"] and self.level > 0:
+                self._set_level(self.level - 1)
+        else:
+            # Vùng giữa hai ngưỡng: giữ nguyên mức
+            self._overloaded_streak = self._calm_streak = 0
+        return self.level
+
+    def _set_level(self, level: int):
+        logger.warning(
+            "QoS level %d (%s) -> %d (%s); queue_wait=%.3fs overloaded=%d cpu=%.2f",
+            self.level, self.levels[self.level]["mode"], level, self.levels[level]["mode"],
+            self.signals["queue_wait"], self.signals["overloaded"], self.signals["cpu"]
+        )
+        self.level = level
+        self.changes += 1
+        self._overloaded_streak = self._calm_streak = 0
+
+    def pin(self, level: int = None):
+        if level is not None and not 0 <= level < len(self.levels):
+            raise ValueError(f"level must be in [0, {len(self.levels) - 1}]")
+        self.pinned = level
+
+    def get_stats(self):
+        return {
+            "enabled": self.config["enabled"],
+            "level": self.level,
+            "mode": self.levels[self.level]["mode"],
+            "pinned": self.pinned,
+            "effective": self.fidelity(self.current()),
+            "changes": self.changes,
+            "signals": {key: round(value, 4) for key, value in self.signals.items()}
+        }
+
+    # --- Vòng đời ---
+
+    async def start(self):
+        if self.config["enabled"]:
+            self._task = asyncio.create_task(self._control_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _control_loop(self):
+        while True:
+            await asyncio.sleep(self.config["interval_seconds"])
+            try:
+                self.update(self.sample())
+            except Exception as e:
+                logger.error("QoS update failed: %s", e)
+
+qos = QosController()
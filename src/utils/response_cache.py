@@ -0,0 +1,142 @@
+"""
+Cache response cho các endpoint dashboard (/api/alerts, /api/stats).
+
+- Key là path + query params; mỗi entry gắn với `alert_version` lúc tạo. `log_alert` tăng version
+  nên entry cũ tự hết hạn khi có alert mới, không cần xoá cache.
+- Body JSON được serialize và nén (gzip, brotli nếu có cài) một lần lúc tạo entry.
+- ETag theo nội dung body: client gửi If-None-Match khớp thì nhận 304, không tốn query lẫn băng thông.
+- `max_age_seconds` giới hạn độ cũ khi alert được ghi từ process khác (worker khác, bulk scan, migrate).
+"""
+import gzip
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from src.utils.config import get_section
+from src.utils.singleflight import SingleFlight
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_CACHE_CONFIG = get_section("response_cache", {
+    "enabled": True,
+    "max_entries": 256,
+    "max_age_seconds": 30,
+    # Body nhỏ hơn ngưỡng này không nén
+    "compress_min_bytes": 512,
+    "gzip_level": 6,
+    "brotli_quality": 5
+})
+
+class AlertVersion:
+    """Bộ đếm tăng dần mỗi khi có alert mới (trong process này)"""
+
+    def __init__(self):
+        self.value = 0
+
+    def bump(self):
+        self.value += 1
+
+alert_version = AlertVersion()
+
+class CacheEntry:
+    __slots__ = ("version", "created_at", "etag", "bodies")
+
+    def __init__(self, version: int, body: bytes, config: dict):
+        self.version = version
+        self.created_at = time.monotonic()
+        self.etag = 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.bodies = {"identity": body}
+        if len(body) >= config["compress_min_bytes"]:
+            self.bodies["gzip"] = gzip.compress(body, config["gzip_level"])
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=config["brotli_quality"])
+
+def _accepted_encodings(request: Request) -> set:
+    header = request.headers.get("accept-encoding", "")
+    encodings = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+def entry_response(request: Request, entry: CacheEntry, headers: dict = None) -> Response:
+    """Response cho entry đã nén sẵn: 304 nếu If-None-Match khớp, ngược lại body theo Accept-Encoding"""
+    headers = dict(headers or {}, **{"ETag": entry.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and entry.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    accepted = _accepted_encodings(request)
+    for encoding in ("br", "gzip"):
+        if encoding in entry.bodies and encoding in accepted:
+            headers["Content-Encoding"] = encoding
+            return Response(entry.bodies[encoding], media_type="application/json", headers=headers)
+    return Response(entry.bodies["identity"], media_type="application/json", headers=headers)
+
+class ResponseCache:
+    def __init__(self, config: dict = RESPONSE_CACHE_CONFIG, version: AlertVersion = alert_version):
+        self.config = config
+        self.version = version
+        self._entries = OrderedDict()
+        # Nhiều request cùng miss một key chỉ build một lần
+        self._builds = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _fresh(self, entry: CacheEntry) -> bool:
+        return (
+            entry is not None
+            and entry.version == self.version.value
+            and time.monotonic() - entry.created_at <= self.config["max_age_seconds"]
+        )
+
+    async def _build(self, key, build) -> CacheEntry:
+        version = self.version.value
+        data = await build()
+        body = json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        entry = CacheEntry(version, body, self.config)
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.config["max_entries"]:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def respond(self, request: Request, build) -> Response:
+        """
+        Trả response JSON cho `await build()` qua cache.
+        304 nếu If-None-Match khớp ETag của entry còn hiệu lực.
+        """
+        if not self.config["enabled"]:
+            return Response(json.dumps(jsonable_encoder(await build()), ensure_ascii=False), media_type="application/json")
+
+        key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+        entry = self._entries.get(key)
+        if self._fresh(entry):
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            entry = await self._builds.do(f"{key}:{self.version.value}", self._build, key, build)
+
+        response = entry_response(request, entry)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def get_stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified
+        }
+
+response_cache = ResponseCache()
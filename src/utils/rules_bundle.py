@@ -0,0 +1,304 @@
+"""
+Bộ luật gọn cho app mobile (PWA) lọc sơ bộ ngay trên thiết bị.
+
+- Bundle gồm các section: automaton Aho-Corasick đã compile cho từ khoá text (cùng trọng số / ngưỡng
+  của tầng lọc từ khoá trên server), danh sách domain chặn / cho phép, danh sách hash nội dung xấu đã biết.
+- Version là hash nội dung các section nên mọi worker build cùng luật đều ra cùng version.
+  Bundle được build một lần mỗi version, serialize và nén sẵn trong bộ nhớ.
+- Client gửi `since=<version đang có>`: trùng version hiện tại -> 304; version còn trong lịch sử
+  (`max_history` version gần nhất của worker này) -> delta chỉ gồm section đã đổi (section dạng tập hợp
+  chỉ gửi phần thêm / bớt); không biết version đó -> bundle đầy đủ. Kèm ETag cho If-None-Match.
+- Server áp dụng cùng danh sách domain / hash với thiết bị (`rule_lists`), nên nội dung bị chặn
+  trên thiết bị và được gửi lên ở nền để cảnh báo cũng ra cùng verdict trên server.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from fastapi import Request, Response
+from src.utils.config import get_section
+from src.utils.policy import domain_suffixes
+from src.utils.response_cache import RESPONSE_CACHE_CONFIG, CacheEntry, entry_response
+
+logger = logging.getLogger(__name__)
+
+RULES_BUNDLE_CONFIG = get_section("rules_bundle", {
+    "enabled": True,
+    # Kiểm tra nguồn luật (file hash, config) có đổi không mỗi N giây
+    "refresh_seconds": 300,
+    "max_history": 20,
+    "deny_domains": [],
+    "allow_domains": [],
+    # File digest (mỗi dòng một digest, xem text_digest / image_digest); rỗng = không dùng
+    "text_hash_file": "",
+    "image_hash_file": ""
+})
+
+BUNDLE_FORMAT = 1
+# Số ký tự hex giữ lại của SHA-256 (64 bit là đủ cho danh sách vài trăm nghìn mục)
+DIGEST_CHARS = 16
+
+def text_digest(text: str) -> str:
+    """Digest của tin nhắn sau khi chuẩn hoá (chữ thường, gộp khoảng trắng); app tính giống hệt bằng SHA-256"""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:DIGEST_CHARS]
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:DIGEST_CHARS]
+
+def read_digests(path: str) -> list:
+    if not path:
+        return []
+    if not os.path.exists(path):
+        # Thiếu file hash không được làm hỏng cả bundle (từ khoá, domain vẫn dùng được)
+        logger.error("Rules bundle hash file not found: %s", path)
+        return []
+    with open(path, encoding="utf-8") as f:
+        return sorted({line.strip().lower()[:DIGEST_CHARS] for line in f if line.strip() and not line.startswith("#")})
+
+def compile_automaton(keywords: list) -> dict:
+    """
+    Aho-Corasick cho danh sách từ khoá (đã viết thường). Mỗi node: `chars` (các ký tự có cạnh đi ra,
+    nối thành chuỗi) và `next` (node đích tương ứng), `fail`, `out` (id từ khoá kết thúc tại node,
+    đã gộp theo chuỗi fail) nên client chỉ cần duyệt text một lần.
+    """
+    goto = [{}]
+    out = [[]]
+    for index, keyword in enumerate(keywords):
+        node = 0
+        for char in keyword:
+            target = goto[node].get(char)
+            if target is None:
+                target = len(goto)
+                goto.append({})
+                out.append([])
+                goto[node][char] = target
+            node = target
+        out[node].append(index)
+
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for char, target in goto[node].items():
+            queue.append(target)
+            state = fail[node]
+            while state and char not in goto[state]:
+                state = fail[state]
+            fail[target] = goto[state].get(char, 0)
+            out[target] = out[target] + out[fail[target]]
+
+    return {
+        "chars": ["".join(edges) for edges in goto],
+        "next": [list(edges.values()) for edges in goto],
+        "fail": fail,
+        "out": out
+    }
+
+def match_automaton(automaton: dict, text: str) -> set:
+    """Id các từ khoá xuất hiện trong text (cách client dùng automaton)"""
+    goto = [dict(zip(chars, targets)) for chars, targets in zip(automaton["chars"], automaton["next"])]
+    fail, out = automaton["fail"], automaton["out"]
+    found = set()
+    node = 0
+    for char in text:
+        while node and char not in goto[node]:
+            node = fail[node]
+        node = goto[node].get(char, 0)
+        found.update(out[node])
+    return found
+
+class RuleLists:
+    """
+    Danh sách domain / digest của bundle hiện tại dạng set, để server áp dụng đúng các luật
+    mà thiết bị dùng khi lọc sơ bộ. Chỉ thay cả set (copy-on-write) nên đọc không cần lock.
+    """
+
+    def __init__(self):
+        self.deny_domains = self.allow_domains = self.text_hashes = self.image_hashes = frozenset()
+
+    def update(self, sections: dict):
+        self.deny_domains = frozenset(sections.get("deny_domains", ()))
+        self.allow_domains = frozenset(sections.get("allow_domains", ()))
+        self.text_hashes = frozenset(sections.get("text_hashes", ()))
+        self.image_hashes = frozenset(sections.get("image_hashes", ()))
+
+    def domain_rule(self, url: str):
+        """"blocked" / "allowed" theo danh sách chung (xét sau danh sách của profile, như trên thiết bị), ngược lại None"""
+        if not (self.deny_domains or self.allow_domains):
+            return None
+        suffixes = domain_suffixes(url)
+        if suffixes & self.deny_domains:
+            return "blocked"
+        if suffixes & self.allow_domains:
+            return "allowed"
+        return None
+
+    def known_text(self, content: str) -> bool:
+        return bool(self.text_hashes) and text_digest(content) in self.text_hashes
+
+    def known_image(self, data: bytes) -> bool:
+        return bool(self.image_hashes) and image_digest(data) in self.image_hashes
+
+rule_lists = RuleLists()
+
+def _encode(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+def bundle_version(sections: dict) -> str:
+    return hashlib.sha256(_encode(sections)).hexdigest()[:DIGEST_CHARS]
+
+class RulesBundle:
+    """
+    `collect()` trả về dict section -> giá trị (JSON được); section trong `set_sections`
+    là list chuỗi và được gửi delta theo phần thêm / bớt. `on_refresh(sections)` được gọi
+    mỗi khi có version mới.
+    """
+
+    def __init__(self, collect, set_sections=(), config: dict = RULES_BUNDLE_CONFIG, on_refresh=None):
+        self.collect = collect
+        self.set_sections = frozenset(set_sections)
+        self.on_refresh = on_refresh
+        self.config = config
+        self.version = None
+        self._sections = None
+        self._history = OrderedDict()
+        self._full = None
+        self._deltas = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self.served = {"full": 0, "delta": 0, "not_modified": 0}
+
+    def refresh(self) -> bool:
+        """Build lại nếu nguồn luật đổi; trả về True nếu có version mới"""
+        sections = self.collect()
+        version = bundle_version(sections)
+        if version == self.version:
+            return False
+
+        body = _encode({"type": "full", "format": BUNDLE_FORMAT, "version": version, "sections": sections})
+        full = CacheEntry(version, body, RESPONSE_CACHE_CONFIG)
+        with self._lock:
+            self._history[version] = sections
+            while len(self._history) > self.config["max_history"]:
+                self._history.popitem(last=False)
+            self.version, self._sections, self._full, self._deltas = version, sections, full, {}
+        if self.on_refresh is not None:
+            self.on_refresh(sections)
+        logger.info("Rules bundle version %s (%d bytes)", version, len(body))
+        return True
+
+    def _diff(self, base: dict, current: dict) -> dict:
+        sets, replace = {}, {}
+        for name, value in current.items():
+            old = base.get(name)
+            if old == value:
+                continue
+            if name in self.set_sections and old is not None:
+                old_items, new_items = set(old), set(value)
+                sets[name] = {"added": sorted(new_items - old_items), "removed": sorted(old_items - new_items)}
+            else:
+                replace[name] = value
+        removed = sorted(set(base) - set(current))
+        return {"sets": sets, "replace": replace, "removed": removed}
+
+    def _delta(self, since: str):
+        """Entry delta từ `since` tới version hiện tại, None nếu không còn `since` trong lịch sử"""
+        with self._lock:
+            entry = self._deltas.get(since)
+            if entry is not None or since not in self._history:
+                return entry
+            base, current, version, full = self._history[since], self._sections, self.version, self._full
+
+        body = _encode(dict(self._diff(base, current), type="delta", format=BUNDLE_FORMAT, version=version, base=since))
+        # Delta không nhỏ hơn bundle đầy đủ thì gửi bản đầy đủ
+        entry = full if len(body) >= len(full.bodies["identity"]) else CacheEntry(version, body, RESPONSE_CACHE_CONFIG)
+        with self._lock:
+            if self.version == version:
+                self._deltas[since] = entry
+        return entry
+
+    async def ensure_built(self) -> bool:
+        """Build lần đầu trong thread nếu start() chưa build được; False nếu vẫn chưa có bundle"""
+        if self.version is None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+            except Exception as e:
+                logger.error("Failed to build rules bundle: %s", e)
+        return self.version is not None
+
+    def respond(self, request: Request, since: str = None) -> Response:
+        """Response cho bundle đã build (gọi sau ensure_built)"""
+        version, full = self.version, self._full
+        headers = {"X-Rules-Version": version}
+        if since == version:
+            self.served["not_modified"] += 1
+            return Response(status_code=304, headers=dict(headers, ETag=full.etag))
+
+        entry = self._delta(since) if since else None
+        response = entry_response(request, entry or full, headers)
+        if response.status_code == 304:
+            self.served["not_modified"] += 1
+        else:
+            self.served["delta" if entry is not None and entry is not full else "full"] += 1
+        return response
+
+    def get_stats(self):
+        return {
+            "version": self.version,
+            "bytes": len(self._full.bodies["identity"]) if self._full else 0,
+            "history": len(self._history),
+            "served": dict(self.served)
+        }
+
+    # --- Vòng đời ---
+
+    async def start(self):
+        if not self.config["enabled"]:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.refresh)
+        except Exception as e:
+            logger.error("Failed to build rules bundle: %s", e)
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _refresh_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.config["refresh_seconds"])
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                logger.error("Failed to refresh rules bundle: %s", e)
+
+def main(argv=None):
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Tạo digest cho file hash của rules bundle")
+    parser.add_argument("kind", choices=("text", "image"))
+    parser.add_argument("paths", nargs="*", help="text: file tin nhắn (mỗi dòng một tin, mặc định stdin); image: các file ảnh")
+    args = parser.parse_args(argv)
+
+    if args.kind == "text":
+        sources = [open(path, encoding="utf-8") for path in args.paths] or [sys.stdin]
+        for source in sources:
+            for line in source:
+                if line.strip():
+                    print(text_digest(line))
+    else:
+        for path in args.paths:
+            with open(path, "rb") as f:
+                print(image_digest(f.read()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Admission control và lập lịch ưu tiên cho mọi việc phân tích.
+
+- Mỗi request phân tích chiếm một slot trong `max_concurrent` slot chung, theo lớp:
+  text (chat realtime) > image > url > media (video / audio, job nền).
+- Khi hết slot, request chờ trong hàng đợi của lớp; slot trống được chia theo trọng số
+  (stride scheduling): lớp có weight lớn được phục vụ thường xuyên hơn nhưng lớp nhỏ không bị bỏ đói.
+  Mỗi lớp có thể bị giới hạn số slot tối đa (vd. media) để vài video không chiếm hết worker.
+- Rate limit token bucket theo lớp và theo client (API key đã đăng ký / thiết bị có profile / IP) -> 429.
+- Hàng đợi đầy hoặc chờ quá `deadline_seconds` (request đã cũ, client có lẽ đã bỏ) -> 503.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from src.utils.config import get_section
+from src.utils.metrics import Counter, Histogram
+from src.utils.policy import policy_store
+
+SCHEDULER_CONFIG = get_section("scheduler", {
+    "enabled": True,
+    # Số việc phân tích chạy đồng thời (đa số chờ model batcher nên lớn hơn số core)
+    "max_concurrent": 64,
+    "classes": {
+        # weight: tỉ lệ chia slot khi tranh chấp; max_concurrent: trần số slot của lớp;
+        # max_queue: số request chờ tối đa; deadline_seconds: thời gian chờ tối đa (0 = không giới hạn)
+        "text": {"weight": 16, "max_concurrent": 64, "max_queue": 1000, "deadline_seconds": 2.0},
+        "image": {"weight": 4, "max_concurrent": 32, "max_queue": 200, "deadline_seconds": 10.0},
+        "url": {"weight": 2, "max_concurrent": 16, "max_queue": 200, "deadline_seconds": 15.0},
+        "media": {"weight": 1, "max_concurrent": 2, "max_queue": 50, "deadline_seconds": 120.0}
+    },
+    # Token bucket mỗi client: rate (token/giây), burst (token tối đa). Một ảnh / URL / tin = 1 token
+    "rate_limits": {
+        "text": {"rate": 20, "burst": 60},
+        "image": {"rate": 5, "burst": 30},
+        "url": {"rate": 5, "burst": 30},
+        "media": {"rate": 0.1, "burst": 3}
+    },
+    "max_clients": 100000,
+    # API key hợp lệ (X-API-Key); key khác bị bỏ qua khi định danh client
+    "api_keys": []
+})
+
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "aicp_scheduler_wait_seconds", "Time analysis requests spent queued for a slot", ("class",)
+)
+SCHEDULER_REJECTED = Counter(
+    "aicp_scheduler_rejected_total", "Analysis requests rejected by admission control", ("class", "reason")
+)
+
+class Rejected(HTTPException):
+    """Request bị từ chối: 429 (rate limit) hoặc 503 (quá tải), kèm Retry-After"""
+
+    def __init__(self, status: int, reason: str, retry_after: float, work_class: str):
+        super().__init__(
+            status_code=status,
+            detail={"reason": reason, "class": work_class, "retry_after": round(retry_after, 3)},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        self.reason = reason
+        self.retry_after = retry_after
+        self.work_class = work_class
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Lấy `cost` token; trả về 0 nếu được, ngược lại số giây cần chờ"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+class _WorkClass:
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.weight = config["weight"]
+        self.max_concurrent = config["max_concurrent"]
+        self.max_queue = config["max_queue"]
+        self.deadline = config["deadline_seconds"]
+        self.waiters = deque()
+        self.in_flight = 0
+        # Virtual time của stride scheduling: tăng 1/weight mỗi lần được cấp slot
+        self.pass_value = 0.0
+        self.admitted = 0
+        # Tổng thời gian chờ / số lần chờ / số lần bị từ chối vì quá tải (controller QoS đọc chênh lệch)
+        self.wait_seconds = 0.0
+        self.waits = 0
+        self.overloaded = 0
+
+class Scheduler:
+    def __init__(self, config: dict = SCHEDULER_CONFIG):
+        self.config = config
+        self.capacity = config["max_concurrent"]
+        self.classes = {name: _WorkClass(name, class_config) for name, class_config in config["classes"].items()}
+        self.in_flight = 0
+        self._vtime = 0.0
+        self._buckets = OrderedDict()
+
+    # --- Rate limit ---
+
+    def check_rate(self, work_class: str, client: str, cost: float = 1.0):
+        """Trừ token của client; raise Rejected(429) nếu vượt rate limit"""
+        limits = self.config["rate_limits"].get(work_class)
+        if not self.config["enabled"] or not limits or client is None:
+            return
+
+        key = (work_class, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limits["rate"], limits["burst"])
+            if len(self._buckets) > self.config["max_clients"]:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        # Request lớn hơn cả burst vẫn được chạy khi bucket đầy, không bị chặn vĩnh viễn
+        wait = bucket.take(min(cost, bucket.burst))
+        if wait:
+            SCHEDULER_REJECTED.inc(**{"class": work_class, "reason": "rate_limited"})
+            raise Rejected(429, "rate_limited", wait, work_class)
+
+    # --- Slot ---
+
+    def _eligible(self, work_class: _WorkClass) -> bool:
+        return work_class.in_flight < work_class.max_concurrent and self.in_flight < self.capacity
+
+    def _grant(self, work_class: _WorkClass):
+        work_class.in_flight += 1
+        work_class.admitted += 1
+        self.in_flight += 1
+        self._vtime = work_class.pass_value
+        work_class.pass_value += 1.0 / work_class.weight
+
+    def _dispatch(self):
+        """Cấp slot trống cho waiter của lớp có virtual time nhỏ nhất"""
+        while self.in_flight < self.capacity:
+            candidates = []
+            for work_class in self.classes.values():
+                # Bỏ các waiter đã bị huỷ / hết hạn
+                while work_class.waiters and work_class.waiters[0].done():
+                    work_class.waiters.popleft()
+                if work_class.waiters and self._eligible(work_class):
+                    candidates.append(work_class)
+            if not candidates:
+                return
+
+            work_class = min(candidates, key=lambda c: c.pass_value)
+            self._grant(work_class)
+            work_class.waiters.popleft().set_result(None)
+
+    def _release(self, work_class: _WorkClass):
+        work_class.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+
+    async def acquire(self, work_class_name: str, deadline: float = None):
+        """Chờ tới khi được cấp slot; raise Rejected(503) nếu hàng đợi đầy hoặc quá deadline"""
+        work_class = self.classes[work_class_name]
+        started = time.monotonic()
+
+        if not work_class.waiters and self._eligible(work_class):
+            # Lớp vừa có việc trở lại không được dùng virtual time cũ để chiếm hết slot
+            work_class.pass_value = max(work_class.pass_value, self._vtime)
+            self._grant(work_class)
+            work_class.waits += 1
+            SCHEDULER_WAIT_SECONDS.observe(0.0, **{"class": work_class_name})
+            return
+
+        if len(work_class.waiters) >= work_class.max_queue:
+            work_class.overloaded += 1
+            SCHEDULER_REJECTED.inc(**{"class": work_class_name, "reason": "queue_full"})
+            raise Rejected(503, "queue_full", max(work_class.deadline, 1.0), work_class_name)
+
+        if not work_class.waiters:
+            work_class.pass_value = max(work_class.pass_value, self._vtime)
+        waiter = asyncio.get_running_loop().create_future()
+        work_class.waiters.append(waiter)
+
+        deadline = work_class.deadline if deadline is None else deadline
+        try:
+            await asyncio.wait_for(waiter, deadline or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Vừa được cấp slot đúng lúc hết hạn / client ngắt kết nối: trả slot lại
+                self._release(work_class)
+            else:
+                waiter.cancel()
+                try:
+                    work_class.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            work_class.wait_seconds += time.monotonic() - started
+            work_class.waits += 1
+            work_class.overloaded += 1
+            SCHEDULER_REJECTED.inc(**{"class": work_class_name, "reason": "deadline"})
+            raise Rejected(503, "queue_deadline_exceeded", deadline, work_class_name)
+        waited = time.monotonic() - started
+        work_class.wait_seconds += waited
+        work_class.waits += 1
+        SCHEDULER_WAIT_SECONDS.observe(waited, **{"class": work_class_name})
+
+    @asynccontextmanager
+    async def slot(self, work_class: str, client: str = None, cost: float = 1.0, deadline: float = None):
+        """
+        async with scheduler.slot("text", client_id(request)): ...
+        `client` None (vd. job nền) thì không áp rate limit.
+        """
+        if not self.config["enabled"]:
+            yield
+            return
+
+        self.check_rate(work_class, client, cost)
+        await self.acquire(work_class, deadline)
+        try:
+            yield
+        finally:
+            self._release(self.classes[work_class])
+
+    async def run(self, work_class: str, fn, *args):
+        """
+        `await fn(*args)` trong một slot, không tính rate limit. Dùng cho phần việc dùng chung
+        qua singleflight: mỗi request tự check_rate, chỉ lần chạy thật mới chiếm slot.
+        """
+        async with self.slot(work_class):
+            return await fn(*args)
+
+    def get_stats(self):
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "classes": {
+                name: {
+                    "queued": len(work_class.waiters),
+                    "in_flight": work_class.in_flight,
+                    "admitted": work_class.admitted,
+                    "weight": work_class.weight
+                }
+                for name, work_class in self.classes.items()
+            },
+            "rate_limited_clients": len(self._buckets)
+        }
+
+def client_id(connection) -> str:
+    """
+    Định danh client để rate limit (Request hoặc WebSocket): API key có trong `api_keys`,
+    device id đã có profile, hoặc IP. Header chưa đăng ký bị bỏ qua, nếu không client chỉ cần
+    đổi giá trị mỗi request là có bucket mới.
+    """
+    headers = connection.headers
+    api_key = headers.get("x-api-key")
+    if api_key and api_key in SCHEDULER_CONFIG["api_keys"]:
+        return f"key:{api_key}"
+    device_id = headers.get(policy_store.config["device_header"])
+    if device_id and policy_store.get(device_id) is not policy_store.default:
+        return f"device:{device_id}"
+    return connection.client.host if connection.client else "unknown"
+
+scheduler = Scheduler()
@@ -0,0 +1,65 @@
+import asyncio
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+class SingleFlight:
+    """
+    Gộp các lời gọi trùng nhau đang chạy đồng thời: request đến sau với cùng key
+    chờ kết quả của lần tính đang chạy thay vì tự fetch / chạy model lại.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn, *args):
+        """Chạy `await fn(*args)` một lần cho mỗi key đang in-flight"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # Phần việc chung chạy trong task riêng, không thuộc request nào: request đầu tiên
+            # bị huỷ (client ngắt kết nối) thì các request đang chờ vẫn nhận được kết quả
+            task = asyncio.ensure_future(fn(*args))
+            self._inflight[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        # shield: request bị huỷ chỉ ngừng chờ, không huỷ phần việc chung
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Đánh dấu đã lấy exception để không bị cảnh báo khi mọi request chờ đã bị huỷ
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self):
+        total = self.executed + self.coalesced
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0
+        }
+
+def content_key(namespace: str, data) -> str:
+    """Key theo hash nội dung (text hoặc bytes)"""
+    if isinstance(data, str):
+        data = data.strip().encode("utf-8")
+    return f"{namespace}:{hashlib.sha256(data).hexdigest()}"
+
+def url_key(url: str) -> str:
+    """Key theo URL đã chuẩn hoá: scheme/host chữ thường, bỏ port mặc định và fragment, sắp xếp query"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return "url:" + urlunsplit((scheme, host, path, query, ""))
+
+singleflight = SingleFlight()
@@ -0,0 +1,204 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from src.utils.config import get_section
+
+logger = logging.getLogger(__name__)
+
+TRACING_CONFIG = get_section("tracing", {
+    # Tắt mặc định; bật qua config hoặc lúc chạy bằng POST /api/admin/tracing
+    "enabled": False,
+    # "file": ghi JSONL ra `path`; "otlp": gửi OTLP/HTTP JSON tới `endpoint` (collector, Jaeger...)
+    "exporter": "file",
+    "path": "logs/traces.jsonl",
+    "endpoint": "http://localhost:4318/v1/traces",
+    "service_name": "ai-child-protection",
+    "flush_interval_seconds": 1.0,
+    "max_queue": 10000
+})
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "status")
+
+    def __init__(self, name: str, parent, attributes: dict):
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+class SpanExporter:
+    """
+    Đưa span đã kết thúc vào hàng đợi, một thread nền ghi theo lô
+    để request không phải chờ I/O của tracing.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.enabled = bool(config["enabled"])
+        self.exported = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=config["max_queue"])
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Không để tracing làm chậm request khi exporter không theo kịp
+            self.dropped += 1
+
+    def get_stats(self):
+        return {
+            "enabled": self.enabled,
+            "exporter": self.config["exporter"],
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            spans = [self._queue.get()]
+            time.sleep(self.config["flush_interval_seconds"])
+            while True:
+                try:
+                    spans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if self.config["exporter"] == "otlp":
+                    self._post_otlp(spans)
+                else:
+                    self._write_file(spans)
+                self.exported += len(spans)
+            except Exception as e:
+                self.dropped += len(spans)
+                logger.warning("Failed to export %d span(s): %s", len(spans), e)
+
+    def _write_file(self, spans: list):
+        directory = os.path.dirname(self.config["path"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.config["path"], "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def _post_otlp(self, spans: list):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.config["service_name"])]},
+                "scopeSpans": [{
+                    "scope": {"name": "aicp"},
+                    "spans": [_otlp_span(span) for span in spans]
+                }]
+            }]
+        }
+        response = requests.post(self.config["endpoint"], json=payload, timeout=5)
+        response.raise_for_status()
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def _otlp_span(span: Span) -> dict:
+    data = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+        # 1 = OK, 2 = ERROR
+        "status": {"code": 2 if span.status == "error" else 1}
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+exporter = SpanExporter(TRACING_CONFIG)
+
+def set_enabled(enabled: bool):
+    exporter.enabled = bool(enabled)
+
+def is_enabled() -> bool:
+    return exporter.enabled
+
+def current_span():
+    return _current_span.get()
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Đo một bước xử lý. Span lồng nhau (kể cả qua await) tự gắn vào span cha.
+    Khi tracing tắt chỉ tốn một phép kiểm tra.
+    """
+    if not exporter.enabled:
+        yield None
+        return
+
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attributes["error"] = repr(e)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        exporter.export(current)
+
+def bind(fn, *args, **kwargs):
+    """
+    Trả về callable chạy `fn` trong context hiện tại, dùng khi đưa việc sang thread
+    (run_in_executor không tự copy contextvars) để span trong thread vẫn thuộc cùng trace.
+    """
+    if not exporter.enabled:
+        return functools.partial(fn, *args, **kwargs)
+    return functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)